@@ -0,0 +1,151 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class AlarmHistory:
+    """Stores the received blaulichtSMS alarms and infos and the transitions of the HDMI device
+    they caused in an SQLite database at :path:.
+
+    The alarms are stored when they are received for the first time or changed,
+    so the database is written only a few times per alarm.
+    The alarms are indexed by their alarmId and alarmDate, the transitions by their time,
+    so restoring the active alarms after a restart and querying the history
+    do not depend on the size of the history.
+    Entries older than :max_age: days are removed when the history is opened.
+    The times are UNIX timestamps.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS alarms (
+            alarm_id PRIMARY KEY,
+            alarm_date TEXT NOT NULL,
+            alarm_time REAL NOT NULL,
+            received_at REAL NOT NULL,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS alarms_alarm_time ON alarms (alarm_time);
+        CREATE TABLE IF NOT EXISTS transitions (
+            time REAL NOT NULL,
+            is_on INTEGER NOT NULL,
+            alarm_id
+        );
+        CREATE INDEX IF NOT EXISTS transitions_time ON transitions (time);
+    """
+
+    def __init__(self, path, max_age=365):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # used by the polling thread and the thread controlling the HDMI device
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            # the write-ahead log appends to a single file instead of rewriting pages
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(self.SCHEMA)
+        self.remove_older_than(time.time() - max_age * 86400)
+
+    def add_alarms(self, alarms, received_at=None):
+        """Stores blaulichtSMS Dashboard API alarm or info elements.
+        An alarm which is already stored is updated, its receive time is kept.
+
+        :param received_at: The time the alarms were received, the current time if None
+        """
+        received_at = received_at if received_at is not None else time.time()
+        rows = [(alarm["alarmId"], alarm["alarmDate"], self._get_alarm_time(alarm["alarmDate"]),
+                 received_at, json.dumps(alarm)) for alarm in alarms]
+        self._write("INSERT INTO alarms (alarm_id, alarm_date, alarm_time, received_at, data)"
+                    " VALUES (?, ?, ?, ?, ?) ON CONFLICT (alarm_id) DO UPDATE"
+                    " SET alarm_date = excluded.alarm_date, alarm_time = excluded.alarm_time,"
+                    " data = excluded.data", rows)
+
+    def add_transition(self, is_on, alarm_id=None, transition_time=None):
+        """Stores a transition of the desired state of the HDMI device.
+
+        :param alarm_id: The alarmId of the alarm which caused the transition, None if the
+            transition was not caused by an alarm, e.g. because the last active alarm expired
+        """
+        transition_time = transition_time if transition_time is not None else time.time()
+        self._write("INSERT INTO transitions (time, is_on, alarm_id) VALUES (?, ?, ?)",
+                    [(transition_time, int(is_on), alarm_id)])
+
+    def get_alarms(self, since=None, until=None, limit=None):
+        """
+        :return: The alarms with an alarmDate between :since: and :until: as dicts,
+            the newest first. The dicts contain the alarm element as received
+            and its "receivedAt" time.
+        """
+        query = "SELECT data, received_at FROM alarms WHERE alarm_time >= ? AND alarm_time <= ?" \
+            " ORDER BY alarm_time DESC"
+        parameters = [since if since is not None else float("-inf"),
+                      until if until is not None else float("inf")]
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [dict(json.loads(data), receivedAt=received_at) for data, received_at in rows]
+
+    def get_alarm(self, alarm_id):
+        """
+        :return: The alarm with the alarmId :alarm_id: like :get_alarms: or None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, received_at FROM alarms WHERE alarm_id = ?", (alarm_id,)).fetchone()
+        return dict(json.loads(row[0]), receivedAt=row[1]) if row else None
+
+    def count_alarms(self, since=None, until=None):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM alarms WHERE alarm_time >= ? AND alarm_time <= ?",
+                (since if since is not None else float("-inf"),
+                 until if until is not None else float("inf"))).fetchone()[0]
+
+    def get_transitions(self, since=None, until=None):
+        """
+        :return: A list of tuples of the time, the desired state (True if on) and the causing
+            alarmId of the transitions between :since: and :until:, the oldest first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT time, is_on, alarm_id FROM transitions WHERE time >= ? AND time <= ?"
+                " ORDER BY time",
+                (since if since is not None else float("-inf"),
+                 until if until is not None else float("inf"))).fetchall()
+        return [(transition_time, bool(is_on), alarm_id)
+                for transition_time, is_on, alarm_id in rows]
+
+    def remove_older_than(self, oldest_time):
+        with self._lock, self._connection:
+            alarm_count = self._connection.execute(
+                "DELETE FROM alarms WHERE alarm_time < ?", (oldest_time,)).rowcount
+            transition_count = self._connection.execute(
+                "DELETE FROM transitions WHERE time < ?", (oldest_time,)).rowcount
+        if alarm_count or transition_count:
+            self.logger.info("Removed " + str(alarm_count) + " alarms and "
+                             + str(transition_count) + " transitions from the alarm history")
+
+    def _write(self, statement, rows):
+        """Writes :rows: with :statement:.
+        A failed write is only logged, the alarm monitor does not depend on the history.
+        """
+        try:
+            with self._lock, self._connection:
+                self._connection.executemany(statement, rows)
+        except sqlite3.Error as e:
+            self.logger.error("Failed to write the alarm history: " + str(e))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _get_alarm_time(alarm_date):
+        return datetime.strptime(alarm_date, "%Y-%m-%dT%H:%M:%S.%fZ") \
+            .replace(tzinfo=timezone.utc).timestamp()
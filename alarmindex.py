@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime
+
+
+class AlarmRecord:
+    """The parsed parts of a blaulichtSMS Dashboard API alarm or info element."""
+
+    __slots__ = ("alarm_id", "alarm_date", "alarm_datetime", "expires_at")
+
+    def __init__(self, alarm_id, alarm_date, alarm_datetime, expires_at):
+        self.alarm_id = alarm_id
+        self.alarm_date = alarm_date
+        self.alarm_datetime = alarm_datetime
+        self.expires_at = expires_at
+
+
+class AlarmIndex:
+    """Keeps the alarms of the latest blaulichtSMS Dashboard API response keyed by their alarmId.
+
+    Each alarm is parsed only when it is new or its alarmDate changed.
+    The time the newest alarm expires is kept up to date,
+    so checking for an active alarm does not depend on the number of alarms.
+    :latest_alarm_id: is the alarmId of the alarm which expires last.
+    The datetimes are all in UTC.
+    """
+
+    def __init__(self, alarm_duration):
+        self.logger = logging.getLogger(__name__)
+        self.alarm_duration = alarm_duration
+        self.expires_at = datetime.min
+        self.latest_alarm_id = None
+        self.update_count = 0
+        self._records = {}
+
+    def update(self, alarms):
+        """Updates the index with the alarms of a response.
+
+        Alarms which are no longer contained in the response are removed.
+
+        :return: The records of the new or changed alarms
+        """
+        new_records = []
+        alarm_ids = set()
+        is_recompute_required = False
+        for alarm in alarms:
+            alarm_id = alarm["alarmId"]
+            alarm_ids.add(alarm_id)
+            record = self._records.get(alarm_id)
+            if record is not None and record.alarm_date == alarm["alarmDate"]:
+                continue
+            is_recompute_required = is_recompute_required or record is not None
+            record = self._parse(alarm)
+            self._records[alarm_id] = record
+            new_records.append(record)
+            self.logger.debug("Alarm " + str(alarm_id) + " on " + str(record.alarm_datetime))
+            if record.expires_at > self.expires_at:
+                self.expires_at = record.expires_at
+                self.latest_alarm_id = alarm_id
+
+        if len(alarm_ids) != len(self._records):
+            for alarm_id in self._records.keys() - alarm_ids:
+                del self._records[alarm_id]
+            is_recompute_required = True
+        if is_recompute_required:
+            self._recompute_expiry()
+        self.update_count += 1
+        return new_records
+
+    def restore(self, alarms):
+        """Adds alarms stored before a restart, e.g. in the :AlarmHistory:.
+        They are replaced or removed by the first :update:.
+        """
+        for alarm in alarms:
+            record = self._parse(alarm)
+            self._records[record.alarm_id] = record
+        self._recompute_expiry()
+
+    def is_active(self, now):
+        """Checks if any alarm is active at :now:.
+
+        An alarm is active if it's datetime is greater than or equals :now: minus :alarm_duration:.
+        """
+        return now <= self.expires_at
+
+    def get(self, alarm_id):
+        return self._records.get(alarm_id)
+
+    def __len__(self):
+        return len(self._records)
+
+    def _recompute_expiry(self):
+        latest_record = max(self._records.values(), key=lambda record: record.expires_at,
+                            default=None)
+        self.expires_at = latest_record.expires_at if latest_record else datetime.min
+        self.latest_alarm_id = latest_record.alarm_id if latest_record else None
+
+    def _parse(self, alarm):
+        alarm_datetime = datetime.strptime(alarm["alarmDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
+        return AlarmRecord(alarm["alarmId"], alarm["alarmDate"], alarm_datetime,
+                           alarm_datetime + self.alarm_duration)
@@ -1,76 +1,372 @@
+import asyncio
 import logging
 import time
+from datetime import datetime
 from sched import scheduler
 
-from chromiumbrowsercontroller import ChromiumBrowserController
+from alarmmonitormailsender import QueuedMailSender
+from cecreconciler import CecReconciler
+from daemonthreadexecutor import DaemonThreadExecutor
+from pollingscheduler import PollingScheduler
 
 
 class AlarmMonitor:
     """Controls the application's execution flow."""
 
     def __init__(self, polling_interval, send_errors, send_starts, blaulichtsms_controller,
-                 hdmi_cec_controller, browser_controller, mail_sender):
+                 hdmi_cec_controller, browser_controller, mail_sender, polling_scheduler=None,
+                 cec_verify_interval=300, browser_check_interval=None, is_browser_started=False):
         self.logger = logging.getLogger(__name__)
-        self.scheduler = scheduler(time.time, time.sleep)
+        self.scheduler = scheduler(time.monotonic, time.sleep)
+        self.polling_scheduler = polling_scheduler if polling_scheduler \
+            else PollingScheduler(polling_interval)
         self.blaulichtsms_controller = blaulichtsms_controller
         self.hdmi_cec_controller = hdmi_cec_controller
+        self.cec_reconciler = CecReconciler(hdmi_cec_controller, cec_verify_interval,
+                                            blaulichtsms_controller.alarm_history)
         self.browser_controller = browser_controller
         self.mail_sender = mail_sender
-        self.browser_controller.start()
+        if not is_browser_started:
+            self.browser_controller.start()
 
         self._polling_interval = polling_interval
+        self._browser_check_interval = browser_check_interval if browser_check_interval \
+            else polling_interval
         self._send_errors = send_errors
         self._send_starts = send_starts
 
         self._is_browser_error = False
+        self._is_browser_recycle_deferred = False
+
+        self._standby_timer = None
+        self._standby_timer_expiry = None
 
     def _run_helper(self):
         """The main loop of the application.
-        Reschedules itself to run every :_polling_interval: seconds.
+        Reschedules itself at the time computed by the :polling_scheduler:.
 
-        Ensures that a browser which is displaying the blaulichtSMS Einsatzmonitor dashboard is running.
         Checks if communication with an HDMI device via CEC is possible.
+        Sends HDMI CEC commands only if the device is not in the desired state.
         """
         self.logger.debug("running helper")
-        self.scheduler.enter(self._polling_interval, 1, self._run_helper)
 
-        self._check_browser_status()
-        if self.blaulichtsms_controller.is_alarm():
-            self.hdmi_cec_controller.activate_source()
+        is_alarm = self.blaulichtsms_controller.is_alarm()
+        # if the request failed, the standby timer still switches off at the known expiry
+        if not self.blaulichtsms_controller.is_last_request_failed:
+            self._update_standby_timer(is_alarm)
+            self._set_desired(is_alarm)
+        self.cec_reconciler.reconcile()
+
+        self.scheduler.enterabs(self._schedule_next_poll(time.monotonic(), False), 1,
+                                self._run_helper)
+
+    def _set_desired(self, is_alarm):
+        alarm_id = self.blaulichtsms_controller.alarm_index.latest_alarm_id if is_alarm else None
+        self.cec_reconciler.set_desired(is_alarm, alarm_id)
+
+    def _apply_initial_alarm_state(self):
+        """Sets the desired state of the HDMI device before the first alarm request of the monitor.
+
+        The state is known if the alarms were already requested during the startup
+        or were restored from the alarm history.
+        So an alarm which is still active is displayed again right after a restart,
+        even before the first alarm request succeeded.
+
+        :return: True if the state was set
+        """
+        if self._is_polled_at_startup():
+            source = "the alarm request during the startup"
+        elif self.blaulichtsms_controller.alarm_history is not None:
+            source = "the alarm history"
         else:
-            self.hdmi_cec_controller.standby()
+            return False
+        is_alarm = self.blaulichtsms_controller.alarm_index.is_active(datetime.utcnow())
+        self.logger.info("Set the HDMI device state from " + source + ": "
+                         + ("on" if is_alarm else "standby"))
+        self._update_standby_timer(is_alarm)
+        self._set_desired(is_alarm)
+        return True
+
+    def _is_polled_at_startup(self):
+        return self.blaulichtsms_controller.alarm_index.update_count > 0
+
+    def _schedule_next_poll(self, now, is_failed):
+        is_failed = is_failed or self.blaulichtsms_controller.is_last_request_failed
+        has_news = not is_failed and self.blaulichtsms_controller.received_new_alarms
+        return self.polling_scheduler.schedule(now, is_failed, has_news)
+
+    def _update_standby_timer(self, is_alarm):
+        """Schedules the standby for the exact time the last active alarm expires.
+        The timer is only replaced if the expiry changed.
+        """
+        if not is_alarm:
+            self._cancel_standby_timer()
+            return
+        expires_at = self.blaulichtsms_controller.alarm_index.expires_at
+        if self._standby_timer is not None and expires_at == self._standby_timer_expiry:
+            return
+        self._cancel_standby_timer()
+        delay = (expires_at - datetime.utcnow()).total_seconds()
+        self.logger.debug("Scheduling standby in " + str(delay) + " seconds")
+        self._standby_timer = self._start_timer(time.monotonic() + delay, self._on_alarm_expired)
+        self._standby_timer_expiry = expires_at
+
+    def _cancel_standby_timer(self):
+        if self._standby_timer is not None:
+            self._cancel_timer(self._standby_timer)
+            self._standby_timer = None
+
+    def _on_alarm_expired(self):
+        self._standby_timer = None
+        if self.blaulichtsms_controller.alarm_index.is_active(datetime.utcnow()):
+            self._update_standby_timer(True)
+            return
+        self.logger.info("The last active alarm expired")
+        self._enter_standby()
+
+    def _enter_standby(self):
+        self.cec_reconciler.set_desired(False)
+        self.cec_reconciler.reconcile()
+
+    def _start_timer(self, when, callback):
+        return self.scheduler.enterabs(when, 0, callback)
+
+    def _cancel_timer(self, timer):
+        try:
+            self.scheduler.cancel(timer)
+        except ValueError:
+            # the timer already ran
+            pass
+
+    def _supervise_browser(self):
+        """Ensures that a browser which is displaying the blaulichtSMS Einsatzmonitor dashboard
+        is running. Reschedules itself every :browser_check_interval: seconds.
+        """
+        self._check_browser_status()
+        self.scheduler.enter(self._browser_check_interval, 2, self._supervise_browser)
 
     def _check_browser_status(self):
-        """Checks if the browser process which is displaying the blaulichtSMS
-        Einsatzmonitor dashboard is still running.
+        """Checks if the browser which is displaying the blaulichtSMS
+        Einsatzmonitor dashboard is still running and healthy.
 
-        If the process is no longer running, it starts a new one.
+        If it is not, the browser is recovered.
         """
         if not self.browser_controller.is_alive():
-            self.logger.warning("The browser is not running. Starting it.")
+            self.logger.warning("The browser is not running or not healthy. Recovering it.")
 
             if self._send_errors and not self._is_browser_error:
                 self.mail_sender.send_message("The browser of the AlarmMonitor has crashed.\n"
                                               "A mail is sent as soon as the problem is resolved.")
                 self._is_browser_error = True
 
-            session_id = self.blaulichtsms_controller.get_session()
-            self.browser_controller = ChromiumBrowserController(session_id)
-            self.browser_controller.start()
-        elif self._is_browser_error:
-            self.mail_sender.send_message("The browser issue of the AlarmMonitor is resolved.")
-            self._is_browser_error = False
+            session_id = self.blaulichtsms_controller.session_token_manager.get_token()
+            if session_id is None:
+                self.logger.warning("No valid blaulichtSMS session. Retrying to recover the"
+                                    " browser at the next check.")
+                return
+            self.browser_controller.recover(session_id)
+        else:
+            if self._is_browser_error:
+                self.mail_sender.send_message("The browser issue of the AlarmMonitor is resolved.")
+                self._is_browser_error = False
+            self._check_browser_resources()
+
+    def _check_browser_resources(self):
+        """Recycles the browser if it exceeded its resource limits.
+
+        The browser is only recycled while no alarm is active and the HDMI device is in standby,
+        so the dashboard never disappears during an alarm.
+        """
+        reason = self.browser_controller.get_recycle_reason()
+        if reason is None:
+            self._is_browser_recycle_deferred = False
+            return
+        is_alarm = self.blaulichtsms_controller.alarm_index.is_active(datetime.utcnow())
+        is_standby = self.cec_reconciler.desired_on is False \
+            and self.cec_reconciler.observed_on is not True
+        if is_alarm or not is_standby:
+            if not self._is_browser_recycle_deferred:
+                self.logger.info("Deferring the browser recycle until the HDMI device is in"
+                                 + " standby: " + reason)
+                self._is_browser_recycle_deferred = True
+            return
+        session_id = self.blaulichtsms_controller.session_token_manager.get_token()
+        if session_id is None:
+            self.logger.warning("No valid blaulichtSMS session. Retrying to recycle the"
+                                " browser at the next check.")
+            return
+        self.logger.warning("Recycling the browser: " + reason)
+        self._is_browser_recycle_deferred = False
+        self.browser_controller.recycle(session_id)
 
     def run(self):
         self.logger.info("START - Started alarm monitor")
-        if self._send_starts:
-            self.mail_sender.send_message("The AlarmMonitor has started.")
         try:
-            self._run_helper()
-            self.scheduler.run()
+            self._run_loop()
         except KeyboardInterrupt:
             self.logger.info("Stopping alarm monitor")
         finally:
-            if self.hdmi_cec_controller.is_on():
+            self.logger.info("HDMI CEC commands sent: " + str(self.cec_reconciler.commands_sent)
+                             + ", suppressed: " + str(self.cec_reconciler.commands_suppressed))
+            if not self._wait_for_cec():
+                self.logger.warning("The HDMI CEC device is still busy. Skipping the standby.")
+            # unknown if the devices of several displays are in different states
+            elif self.hdmi_cec_controller.is_on() is not False:
                 self.hdmi_cec_controller.standby()
+            self.hdmi_cec_controller.close()
             self.browser_controller.terminate()
+
+    def _wait_for_cec(self):
+        """
+        :return: True if no other thread is using the HDMI CEC device
+        """
+        return True
+
+    def _run_loop(self):
+        if self._send_starts:
+            self.mail_sender.send_message("The AlarmMonitor has started.")
+        if self._apply_initial_alarm_state():
+            self.cec_reconciler.reconcile()
+        self._supervise_browser()
+        if self._is_polled_at_startup():
+            self.scheduler.enterabs(self._schedule_next_poll(
+                self.blaulichtsms_controller.last_response_time, False), 1, self._run_helper)
+        else:
+            self._run_helper()
+        self.scheduler.run()
+
+
+class AsyncAlarmMonitor(AlarmMonitor):
+    """Controls the application's execution flow with an asyncio event loop.
+
+    Polling the blaulichtSMS Dashboard API, supervising the browser, controlling the HDMI CEC
+    device and delivering mails run as independent tasks.
+    Each task runs the blocking calls of its subsystem in its own thread with a deadline,
+    so a slow subsystem never delays the next alarm poll.
+    On shutdown each thread gets at most its deadline to finish a running call,
+    so a hanging call does not block the exit.
+    """
+
+    def __init__(self, polling_interval, send_errors, send_starts, blaulichtsms_controller,
+                 hdmi_cec_controller, browser_controller, mail_sender, polling_scheduler=None,
+                 cec_verify_interval=300, browser_check_interval=None, is_browser_started=False,
+                 poll_timeout=20, cec_timeout=10, browser_timeout=60, mail_timeout=60):
+        if not isinstance(mail_sender, QueuedMailSender):
+            mail_sender = QueuedMailSender(mail_sender)
+        super().__init__(polling_interval, send_errors, send_starts, blaulichtsms_controller,
+                         hdmi_cec_controller, browser_controller, mail_sender, polling_scheduler,
+                         cec_verify_interval, browser_check_interval, is_browser_started)
+        self._timeouts = {
+            "poll": poll_timeout,
+            "cec": cec_timeout,
+            "browser": browser_timeout
+        }
+        self._mail_timeout = mail_timeout
+        self._executors = {name: DaemonThreadExecutor(name) for name in self._timeouts}
+        self._pending_calls = {}
+        self._alarm_state_changed = None
+        self._loop = None
+
+    def _run_loop(self):
+        try:
+            asyncio.run(self._run_tasks())
+        finally:
+            self._shut_down_executors()
+
+    def _wait_for_cec(self):
+        # the running call of the CEC thread finished if the thread finished
+        return self._executors["cec"].shutdown(timeout=self._timeouts["cec"])
+
+    def _shut_down_executors(self):
+        """Waits for the running call of each subsystem at most the subsystem's timeout."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        start = time.monotonic()
+        for subsystem, executor in self._executors.items():
+            timeout = max(start + self._timeouts[subsystem] - time.monotonic(), 0)
+            if not executor.shutdown(timeout=timeout):
+                self.logger.warning("The " + subsystem + " task did not finish. Abandoning it.")
+
+    async def _run_tasks(self):
+        self._loop = asyncio.get_running_loop()
+        self._alarm_state_changed = asyncio.Event()
+        if self._apply_initial_alarm_state():
+            self._alarm_state_changed.set()
+        tasks = [
+            self.mail_sender.start_delivery(self._mail_timeout),
+            asyncio.create_task(self._poll_alarms()),
+            asyncio.create_task(self._supervise_browser()),
+            asyncio.create_task(self._control_cec())
+        ]
+        if self._send_starts:
+            self.mail_sender.send_message("The AlarmMonitor has started.")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run_in_executor(self, subsystem, func):
+        """Runs :func: in the thread of :subsystem: and waits at most the subsystem's timeout.
+
+        If the previous call of the subsystem is still running, :func: is not run at all.
+
+        :return: A tuple of a flag if :func: finished and its result
+        """
+        pending_call = self._pending_calls.get(subsystem)
+        if pending_call is not None and not pending_call.done():
+            self.logger.warning("The " + subsystem + " task is still busy. Skipping it.")
+            return False, None
+        call = asyncio.get_running_loop().run_in_executor(self._executors[subsystem], func)
+        self._pending_calls[subsystem] = call
+        try:
+            return True, await asyncio.wait_for(asyncio.shield(call), self._timeouts[subsystem])
+        except asyncio.TimeoutError:
+            self.logger.error("The " + subsystem + " task exceeded its deadline of "
+                              + str(self._timeouts[subsystem]) + " seconds")
+        except Exception:
+            self.logger.exception("The " + subsystem + " task failed")
+        return False, None
+
+    async def _poll_alarms(self):
+        """Polls the alarms at the times computed by the :polling_scheduler:."""
+        loop = asyncio.get_running_loop()
+        if self._is_polled_at_startup():
+            next_poll = self._schedule_next_poll(
+                self.blaulichtsms_controller.last_response_time, False)
+            await asyncio.sleep(max(next_poll - loop.time(), 0))
+        while True:
+            self.logger.debug("polling alarms")
+            is_finished, is_alarm = await self._run_in_executor(
+                "poll", self.blaulichtsms_controller.is_alarm)
+            if is_finished and not self.blaulichtsms_controller.is_last_request_failed:
+                self._update_standby_timer(is_alarm)
+                self._set_desired(is_alarm)
+            self._alarm_state_changed.set()
+            next_poll = self._schedule_next_poll(loop.time(), not is_finished)
+            await asyncio.sleep(max(next_poll - loop.time(), 0))
+
+    async def _supervise_browser(self):
+        while True:
+            await self._run_in_executor("browser", self._check_browser_status)
+            await asyncio.sleep(self._browser_check_interval)
+
+    async def _control_cec(self):
+        """Reconciles the state of the HDMI CEC device after every alarm poll
+        and when the last active alarm expired.
+        """
+        while True:
+            await self._alarm_state_changed.wait()
+            self._alarm_state_changed.clear()
+            await self._run_in_executor("cec", self.cec_reconciler.reconcile)
+
+    def _enter_standby(self):
+        self.cec_reconciler.set_desired(False)
+        self._alarm_state_changed.set()
+
+    def _start_timer(self, when, callback):
+        # the event loop's clock is time.monotonic
+        return self._loop.call_at(when, callback)
+
+    def _cancel_timer(self, timer):
+        timer.cancel()
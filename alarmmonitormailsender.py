@@ -1,6 +1,13 @@
+import asyncio
 import configparser
 import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from mailspool import MailSpool, get_mail_spool
 from sendmail import MailSender
 
 
@@ -9,6 +16,7 @@ class AlarmMonitorMailSender:
     alarmmonitor.
 
     The used settings are the SMTP settings and the from and to addresses.
+    If a spool directory is set, the mails are delivered via a :MailSpool:.
     """
 
     def __init__(self):
@@ -21,9 +29,170 @@ class AlarmMonitorMailSender:
             config["Email"]["smtp_server"],
             config["Email"]["smtp_port"],
             config['Email']['username'],
-            config['Email']['password']
+            config['Email']['password'],
+            reuse_connection=True
         )
+        self.mail_sender = get_mail_spool(config, self.mail_sender, "alarmmonitor")
 
     def send_message(self, msg):
+        """
+        :return: True if the mail was sent or spooled
+        """
         final_msg = "Subject: " + self.subject + "\n\n" + msg
-        self.mail_sender.send_message(self.from_addr, self.to_addrs, final_msg)
+        return self.mail_sender.send_message(self.from_addr, self.to_addrs, final_msg)
+
+    def disconnect(self):
+        """Closes the connection to the SMTP server. Unlike :close:, further mails can be sent."""
+        if isinstance(self.mail_sender, MailSpool):
+            self.mail_sender.disconnect()
+        else:
+            self.mail_sender.close()
+
+    def close(self):
+        self.mail_sender.close()
+
+
+class MailOutbox:
+    """Wraps an :AlarmMonitorMailSender: to send its mails from a background thread.
+
+    :send_message: only enqueues the mail and never waits for the SMTP server.
+    At most :max_size: mails are queued, further mails are dropped and counted.
+    The mails enqueued within :digest_delay: seconds after a mail are sent as one digest,
+    in which repeated messages are collapsed.
+    The connection to the SMTP server is closed after :idle_timeout: seconds without mails.
+    """
+
+    def __init__(self, mail_sender, max_size=100, digest_delay=10, idle_timeout=60):
+        self.logger = logging.getLogger(__name__)
+        self._mail_sender = mail_sender
+        self.digest_delay = digest_delay
+        self.idle_timeout = idle_timeout
+        self.sent_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+        self._queue = queue.Queue(max_size)
+        self._thread = threading.Thread(target=self._deliver, name="mail-outbox", daemon=True)
+        self._thread.start()
+
+    def send_message(self, msg):
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped_count += 1
+            self.logger.error("The mail outbox is full. Dropped mail: " + msg)
+
+    def close(self, timeout=30):
+        """Sends the enqueued mails and stops the background thread.
+        Waits at most :timeout: seconds.
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self.logger.info("Mails sent: " + str(self.sent_count)
+                         + ", failed: " + str(self.failed_count)
+                         + ", dropped: " + str(self.dropped_count))
+
+    def _deliver(self):
+        is_connected = False
+        while True:
+            try:
+                msg = self._queue.get(timeout=self.idle_timeout if is_connected else None)
+            except queue.Empty:
+                self._mail_sender.disconnect()
+                is_connected = False
+                continue
+            if msg is None:
+                break
+            messages, is_closed = self._collect_digest(msg)
+            try:
+                is_sent = self._mail_sender.send_message(self._get_digest(messages))
+            except Exception:
+                self.logger.exception("Failed to send mail")
+                is_sent = False
+            if is_sent:
+                self.sent_count += len(messages)
+                is_connected = True
+            else:
+                self.failed_count += len(messages)
+            if is_closed:
+                break
+        self._mail_sender.close()
+
+    def _collect_digest(self, msg):
+        """Collects the mails enqueued within :digest_delay: seconds after :msg:.
+
+        :return: A tuple of the messages and a flag if :close: was called
+        """
+        messages = [msg]
+        deadline = time.monotonic() + self.digest_delay
+        while True:
+            try:
+                msg = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return messages, False
+            if msg is None:
+                return messages, True
+            messages.append(msg)
+
+    @staticmethod
+    def _get_digest(messages):
+        """Collapses repeated messages. Keeps the order of their first occurrence.
+
+        :return: The text of the digest
+        """
+        counts = {}
+        for msg in messages:
+            counts[msg] = counts.get(msg, 0) + 1
+        parts = [msg if count == 1 else msg + "\n(repeated " + str(count) + " times)"
+                 for msg, count in counts.items()]
+        return "\n\n---\n\n".join(parts)
+
+
+class QueuedMailSender:
+    """Wraps a mail sender to deliver its mails from an asyncio task.
+
+    After :start_delivery: was called, :send_message: only enqueues the mail and can be called
+    from any thread. Otherwise the mail is sent synchronously.
+    """
+
+    def __init__(self, mail_sender):
+        self.logger = logging.getLogger(__name__)
+        self._mail_sender = mail_sender
+        self._loop = None
+        self._queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mail")
+
+    def send_message(self, msg):
+        loop = self._loop
+        if loop is None:
+            self._mail_sender.send_message(msg)
+        else:
+            loop.call_soon_threadsafe(self._queue.put_nowait, msg)
+
+    def start_delivery(self, timeout):
+        """Starts a task in the running event loop which delivers the enqueued mails
+        one after another. Gives up on a mail after :timeout: seconds.
+
+        :return: The delivery task
+        """
+        self._queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        return asyncio.create_task(self._deliver(timeout))
+
+    async def _deliver(self, timeout):
+        try:
+            while True:
+                msg = await self._queue.get()
+                delivery = self._loop.run_in_executor(
+                    self._executor, self._mail_sender.send_message, msg)
+                try:
+                    await asyncio.wait_for(delivery, timeout)
+                except asyncio.TimeoutError:
+                    self.logger.error("Sending mail exceeded its deadline of "
+                                      + str(timeout) + " seconds")
+                except Exception:
+                    self.logger.exception("Failed to send mail")
+        finally:
+            self._loop = None
@@ -1,22 +1,113 @@
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from pprint import pformat
 
 import requests
 
+from alarmindex import AlarmIndex
+from pooledhttpclient import PooledHttpClient
+
 
 class BlaulichtSmsSessionInitException(Exception):
     pass
 
 
+class SessionTokenManager:
+    """Manages the session token of the blaulichtSMS Dashboard API
+    which is shared by the alarm poller and the browser.
+
+    A token is considered valid for :ttl: seconds after the login.
+    It is renewed in the background :refresh_margin: seconds before it expires
+    and after it was reported to be invalid.
+    Concurrent renewals are merged into a single login.
+    """
+
+    def __init__(self, login, ttl=43200, refresh_margin=600):
+        self.logger = logging.getLogger(__name__)
+        self._login = login
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+
+        self._token = None
+        self._expires_at = 0
+        self._is_refreshing = False
+        self._condition = threading.Condition()
+
+    def get_token(self, block=True, timeout=None):
+        """Gets the current session token.
+
+        If :block: is False, the token is never renewed in the calling thread.
+        A renewal is started in the background instead if the token is about to expire.
+
+        :return: The session token or None if there is no valid session token
+        """
+        with self._condition:
+            token = self._token
+            is_expiring = time.monotonic() >= self._expires_at - self._refresh_margin
+        if token and not is_expiring:
+            return token
+        if token or not block:
+            self.refresh_async()
+            return token
+        return self.refresh(timeout)
+
+    def invalidate(self, token):
+        """Marks :token: as invalid and starts a renewal in the background."""
+        with self._condition:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+        self.refresh_async()
+
+    def refresh_async(self):
+        with self._condition:
+            if self._is_refreshing:
+                return
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self, timeout=None):
+        """Logs in to get a new session token.
+        If a login is already running, waits for its result instead.
+
+        :return: The session token or None if there is no valid session token
+        """
+        with self._condition:
+            if self._is_refreshing:
+                self._condition.wait_for(lambda: not self._is_refreshing, timeout)
+                return self._token
+            self._is_refreshing = True
+
+        token = None
+        try:
+            token = self._login()
+        except BlaulichtSmsSessionInitException:
+            self.logger.error("Failed to renew blaulichtSMS session. "
+                              "Maybe there is no internet connection.")
+        finally:
+            with self._condition:
+                if token:
+                    self._token = token
+                    self._expires_at = time.monotonic() + self._ttl
+                self._is_refreshing = False
+                self._condition.notify_all()
+        with self._condition:
+            return self._token
+
+
 class BlaulichtSmsController:
     """Handles the communication with the
     `blaulichtSMS Dashboard API
     <https://github.com/blaulichtSMS/docs/blob/master/dashboard_api_v1.md>`_
+
+    If an :alarm_history: is given, the received alarms are stored in it
+    and the alarms which are still active are restored from it at the start.
     """
 
     def __init__(self, customer_id, username, password, alarm_duration=3600, show_infos=False,
-                 base_url="https://api.blaulichtsms.net/blaulicht/api/alarm/v1/dashboard/"):
+                 base_url="https://api.blaulichtsms.net/blaulicht/api/alarm/v1/dashboard/",
+                 http_client=None, session_ttl=43200, alarm_history=None):
         self.logger = logging.getLogger(__name__)
 
         self.customer_id = customer_id
@@ -25,8 +116,26 @@ class BlaulichtSmsController:
         self.alarm_duration = timedelta(seconds=alarm_duration)
         self.show_infos = show_infos
         self.base_url = base_url
+        self.http_client = http_client if http_client else PooledHttpClient()
+
+        self.session_token_manager = SessionTokenManager(self.get_session, ttl=session_ttl)
 
-        self._session_token = None
+        self.is_last_request_failed = False
+        self.last_response_time = None
+        self.received_new_alarms = False
+        self.alarm_index = AlarmIndex(self.alarm_duration)
+        self.alarm_history = alarm_history
+        if alarm_history is not None:
+            self._restore_alarms()
+
+    def _restore_alarms(self):
+        active_since = (datetime.now(timezone.utc) - self.alarm_duration).timestamp()
+        alarms = self.alarm_history.get_alarms(since=active_since)
+        if alarms:
+            self.alarm_index.restore(alarms)
+            self.logger.info("Restored " + str(len(alarms))
+                             + " alarms from the alarm history. Alarms are active until "
+                             + str(self.alarm_index.expires_at))
 
     def get_session(self):
         """Gets a new session token from the blaulichtSMS Dashboard API at every call.
@@ -40,24 +149,39 @@ class BlaulichtSmsController:
                 "username": self.username,
                 "password": self.password
             }
-            response = requests.post(self.base_url + "login", json=content)
-            session_id = response.json()["sessionId"]
+            response = self.http_client.post(self.base_url + "login", json=content)
+            try:
+                session_id = response.json()["sessionId"]
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger.error("Invalid blaulichtSMS login response. Status code: "
+                                  + str(response.status_code))
+                raise BlaulichtSmsSessionInitException() from e
             if session_id:
                 self.logger.info("Successfully initialized blaulichtSMS session")
             else:
                 self.logger.warning("Failed to initialize blaulichtSMS session")
             return session_id
-        except requests.exceptions.ConnectionError as e:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             raise BlaulichtSmsSessionInitException() from e
 
     def _get_alarms(self):
         """Gets the alarms from the blaulichtSMS Dashboard API"""
-        if not self._session_token:
-            self._session_token = self.get_session()
+        session_token = self.session_token_manager.get_token(block=False)
+        if not session_token:
+            self.logger.warning("No valid blaulichtSMS session. Skipping the alarm request.")
+            return None
 
         try:
             self.logger.info("Requesting blaulichtSMS alarms...")
-            response = requests.get(self.base_url + self._session_token)
+            response = self.http_client.get(self.base_url + session_token)
+            if response.status_code in (401, 403):
+                self.logger.warning("The blaulichtSMS session is no longer valid. Renewing it.")
+                self.session_token_manager.invalidate(session_token)
+                return None
+            if not response.ok:
+                self.logger.error("Failed to request blaulichtSMS alarms. Status code: "
+                                  + str(response.status_code))
+                return None
             self.logger.info("Request successful")
             self.logger.debug("Response body: \n" + pformat(response.json()))
             response_json = response.json()
@@ -68,25 +192,37 @@ class BlaulichtSmsController:
         except requests.exceptions.ConnectionError:
             self.logger.error("Failed to request blaulichtSMS alarms. Maybe there is no internet connection.")
             return None
+        except requests.exceptions.Timeout:
+            self.logger.error("Request for blaulichtSMS alarms timed out.")
+            return None
 
     def is_alarm(self):
         """Checks if there is any active alarm.
 
         An alarm is active if it's datetime is greater than or equals the current datetime minus :alarm_duration:.
         The datetimes are all in UTC.
+        Only new or changed alarms are parsed, the others are looked up in the :alarm_index:.
 
         :return: True if there is any active alarm, False otherwise
         """
         self.logger.info("Checking for new alarms...")
         alarms = self._get_alarms()
-        if not alarms:
+        self.is_last_request_failed = alarms is None
+        if alarms is None:
+            self.received_new_alarms = False
             return False
-        for alarm in alarms:
-            alarm_datetime = datetime.strptime(alarm["alarmDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
-            self.logger.debug("Alarm " + str(alarm["alarmId"]) + " on " + str(alarm_datetime))
-            if alarm_datetime >= datetime.utcnow() - self.alarm_duration:
-                self.logger.debug("Alarm " + str(alarm["alarmId"]) + " is active")
-                self.logger.info("There is an active alarm")
-                return True
+        self.last_response_time = time.monotonic()
+        # all alarms of the first response were received before the start
+        is_first_response = self.alarm_index.update_count == 0
+        new_alarms = self.alarm_index.update(alarms)
+        if new_alarms and self.alarm_history is not None:
+            new_alarm_ids = {record.alarm_id for record in new_alarms}
+            self.alarm_history.add_alarms(
+                [alarm for alarm in alarms if alarm["alarmId"] in new_alarm_ids])
+        self.received_new_alarms = bool(new_alarms) and not is_first_response
+        if self.alarm_index.is_active(datetime.utcnow()):
+            self.logger.debug("Alarms are active until " + str(self.alarm_index.expires_at))
+            self.logger.info("There is an active alarm")
+            return True
         self.logger.info("No active alarm found")
         return False
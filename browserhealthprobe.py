@@ -0,0 +1,125 @@
+import json
+import logging
+import time
+
+from devtoolsclient import DevToolsException
+
+# Evaluated in the dashboard tab. Returns the state of the page as a JSON string.
+PAGE_STATE_EXPRESSION = """JSON.stringify((() => {
+    const navigation = performance.getEntriesByType("navigation")[0];
+    const selector = %s;
+    return {
+        url: location.href,
+        readyState: document.readyState,
+        loadTime: navigation && navigation.loadEventEnd > 0 ? navigation.loadEventEnd : null,
+        pageAge: performance.now(),
+        hasContent: !!document.body && document.body.innerText.trim().length > 0,
+        hasLoginForm: document.querySelector("input[type=password]") !== null,
+        hasDashboard: selector ? document.querySelector(selector) !== null : true
+    };
+})())"""
+
+
+class BrowserHealth:
+    """The result of a single health probe of the dashboard tab.
+
+    The times are in seconds.
+    """
+
+    __slots__ = ("is_healthy", "reason", "response_time", "load_time")
+
+    def __init__(self, is_healthy, reason=None, response_time=None, load_time=None):
+        self.is_healthy = is_healthy
+        self.reason = reason
+        self.response_time = response_time
+        self.load_time = load_time
+
+
+class BrowserHealthProbe:
+    """Checks via the DevTools protocol if a Chromium instance actually shows the
+    blaulichtSMS Einsatzmonitor dashboard.
+
+    A probe fails if the renderer does not evaluate a script within :response_timeout: seconds,
+    if the page did not finish loading within :max_load_time: seconds,
+    if the login page is shown (e.g. because the token expired),
+    or if the page is blank or does not contain an element matching :dashboard_selector:.
+    The login page is recognized by its login form, not by its URL, as the dashboard
+    is opened with the login URL and may keep it after the login.
+
+    The browser is only reported unhealthy after :failure_threshold: consecutive failed probes.
+    Probes within :startup_grace: seconds after :reset: was called are skipped.
+    """
+
+    def __init__(self, devtools_client, response_timeout=5, max_load_time=30,
+                 dashboard_selector=None, failure_threshold=2, startup_grace=60):
+        self.logger = logging.getLogger(__name__)
+        self.devtools_client = devtools_client
+        self.response_timeout = response_timeout
+        self.max_load_time = max_load_time
+        self.dashboard_selector = dashboard_selector
+        self.failure_threshold = failure_threshold
+        self.startup_grace = startup_grace
+
+        self.last_health = None
+        self.failure_count = 0
+        self._probe_after = 0
+
+    def reset(self):
+        """Starts the grace period of a newly started browser or reloaded dashboard."""
+        self.failure_count = 0
+        self.last_health = None
+        self._probe_after = time.monotonic() + self.startup_grace
+
+    def is_healthy(self):
+        if time.monotonic() < self._probe_after:
+            return True
+        health = self.probe()
+        self.last_health = health
+        if health.is_healthy:
+            if self.failure_count:
+                self.logger.info("The dashboard is healthy again")
+            self.failure_count = 0
+            return True
+        self.failure_count += 1
+        self.logger.warning("Browser health probe failed (" + str(self.failure_count) + "/"
+                            + str(self.failure_threshold) + "): " + health.reason)
+        return self.failure_count < self.failure_threshold
+
+    def probe(self):
+        """Runs a single health probe.
+
+        :return: A :BrowserHealth:
+        """
+        expression = PAGE_STATE_EXPRESSION % json.dumps(self.dashboard_selector)
+        try:
+            with self.devtools_client.connect_page() as page:
+                start = time.monotonic()
+                result = page.send("Runtime.evaluate",
+                                   {"expression": expression, "returnByValue": True},
+                                   self.response_timeout)
+                response_time = time.monotonic() - start
+        except DevToolsException as e:
+            return BrowserHealth(False, "The renderer is not responding: " + str(e))
+
+        try:
+            state = json.loads(result["result"]["value"])
+        except (KeyError, TypeError, ValueError):
+            return BrowserHealth(False, "Unexpected page state: " + str(result),
+                                 response_time)
+        load_time = state["loadTime"] / 1000 if state["loadTime"] is not None else None
+        self.logger.debug("Browser health probe: response time " + str(response_time)
+                          + " s, load time " + str(load_time) + " s")
+
+        if load_time is None:
+            if state["pageAge"] / 1000 > self.max_load_time:
+                return BrowserHealth(False, "The page did not finish loading",
+                                     response_time)
+            # the page is still loading
+            return BrowserHealth(True, None, response_time)
+        if state["hasLoginForm"] and not (self.dashboard_selector and state["hasDashboard"]):
+            return BrowserHealth(False, "The login page is shown", response_time, load_time)
+        if not state["hasContent"]:
+            return BrowserHealth(False, "The page is blank", response_time, load_time)
+        if not state["hasDashboard"]:
+            return BrowserHealth(False, "The dashboard is not shown", response_time, load_time)
+        return BrowserHealth(True, None, response_time, load_time)
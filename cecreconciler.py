@@ -0,0 +1,60 @@
+import logging
+import time
+
+
+class CecReconciler:
+    """Keeps an HDMI CEC device in a desired power state with as few CEC commands as possible.
+
+    A command is only sent if the desired state differs from the last known state of the device.
+    Every :verify_interval: seconds the state of the device is queried,
+    so a device switched by someone else is switched back.
+    Changes of the desired state are stored in the :alarm_history: if one is given.
+    """
+
+    def __init__(self, cec_controller, verify_interval=300, alarm_history=None):
+        self.logger = logging.getLogger(__name__)
+        self.cec_controller = cec_controller
+        self.verify_interval = verify_interval
+        self.alarm_history = alarm_history
+
+        self.desired_on = None
+        self.observed_on = None
+        self.commands_sent = 0
+        self.commands_suppressed = 0
+        self._next_verification = 0
+
+    def set_desired(self, is_on, alarm_id=None):
+        """
+        :param alarm_id: The alarmId of the alarm which caused the state, if any
+        """
+        if is_on != self.desired_on:
+            self.logger.debug("Desired HDMI CEC device state: " + ("on" if is_on else "standby"))
+            if self.alarm_history is not None:
+                self.alarm_history.add_transition(is_on, alarm_id)
+        self.desired_on = is_on
+
+    def reconcile(self):
+        """Sends a command to the HDMI CEC device if its last known state is not the desired one.
+        Queries the state of the device first if the verification is due.
+        """
+        if self.desired_on is None:
+            return
+        now = time.monotonic()
+        if self.observed_on == self.desired_on and now >= self._next_verification:
+            self.observed_on = self.cec_controller.is_on()
+            self._next_verification = now + self.verify_interval
+            if self.observed_on is not None and self.observed_on != self.desired_on:
+                self.logger.warning("The HDMI CEC device was switched by someone else")
+
+        if self.observed_on == self.desired_on:
+            self.commands_suppressed += 1
+            return
+        if self.desired_on:
+            self.cec_controller.activate_source()
+        else:
+            self.cec_controller.standby()
+        self.commands_sent += 1
+        self.observed_on = self.desired_on
+        self._next_verification = now + self.verify_interval
+        self.logger.debug("HDMI CEC commands sent: " + str(self.commands_sent)
+                          + ", suppressed: " + str(self.commands_suppressed))
@@ -1,41 +1,261 @@
 import fileinput
 import logging
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 from pathlib import Path
 
+from devtoolsclient import DevToolsClient, DevToolsException
+
+CONFIG_DIR = os.path.join(str(Path.home()), ".config")
+# files of a profile snapshot which are not copied into an ephemeral profile
+# Singleton* link to the instance using the profile and would prevent Chromium from starting
+PROFILE_SNAPSHOT_IGNORE = shutil.ignore_patterns(
+    "Singleton*", "*Cache*", "Crashpad", "Crash Reports", "*.log", "*.tmp")
+
 
 class ChromiumBrowserController:
     """Handles Chromium browser instances to show the
     blaulichtSMS Einsatzmonitor dashboard.
+
+    If :remote_debugging_port: is set, the instance can be controlled via the DevTools protocol.
+    A :hidden: instance starts off-screen and keeps rendering until it is shown.
+    If a :health_probe: is given, the browser is only considered alive
+    if it actually shows the dashboard (requires :remote_debugging_port:).
+    A running browser with a remote debugging port is recovered by navigating the dashboard tab
+    to the new session. It is only restarted if that failed
+    or did not help :max_in_place_recoveries: times in a row.
+
+    If :profile_snapshot_dir: is set, every start copies this pre-seeded profile into a new
+    directory below :ephemeral_profile_root: (a RAM-backed tmpfs by default) instead of using
+    :user_data_dir:. The profile is always fresh, so there is no crashed session to restore,
+    and Chromium does not write its profile and cache to the SD card.
+
+    A :resource_monitor: checks the resources of the browser's process tree against limits,
+    so a browser which grew too large can be recycled.
+
+    The browser is shown on the X display :x_display:.
     """
 
-    def __init__(self, session_id):
+    def __init__(self, session_id, remote_debugging_port=None, user_data_dir=None, hidden=False,
+                 health_probe=None, max_in_place_recoveries=1, profile_snapshot_dir=None,
+                 ephemeral_profile_root="/dev/shm", resource_monitor=None, x_display=":0"):
         self.logger = logging.getLogger(__name__)
         self._session_id = session_id
         self._process = None
+        self.x_display = x_display
+        self.remote_debugging_port = remote_debugging_port
+        self.user_data_dir = user_data_dir
+        self.hidden = hidden
+        self.devtools = DevToolsClient(remote_debugging_port) if remote_debugging_port else None
+        self.health_probe = health_probe
+        self.max_in_place_recoveries = max_in_place_recoveries
+        self._in_place_recovery_count = 0
+        self.profile_snapshot_dir = profile_snapshot_dir
+        self.ephemeral_profile_root = ephemeral_profile_root
+        self._ephemeral_user_data_dir = None
+        self.resource_monitor = resource_monitor
 
     def start(self):
-        self._delete_crash_exit()
+        start = time.monotonic()
+        if self.profile_snapshot_dir:
+            self._create_ephemeral_profile()
+        else:
+            self._delete_crash_exit()
+        profile_time = time.monotonic() - start
         self._process = subprocess.Popen(
-            [
-                "/usr/bin/chromium-browser",
-                "--display=:0",
-                "--noerrdialogs",
-                "--disable-session-restore",
-                "--disable-session-crashed-bubble",
-                "--disable-infobars",
-                "--start-fullscreen",
-                "https://dashboard.blaulichtsms.net/#/login?token="
-                + self._session_id
-            ],
+            self._get_command(),
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL
         )
-        self.logger.info("Started browser")
+        if self.health_probe:
+            self.health_probe.reset()
+        if self.resource_monitor:
+            self.resource_monitor.attach(self._process.pid)
+        self.logger.info("Started browser on display " + self.x_display)
+        if self.devtools:
+            threading.Thread(target=self._log_startup_time, args=(start, profile_time),
+                             daemon=True).start()
+        else:
+            self.logger.debug("Prepared the " + self._get_profile_mode() + " profile in "
+                              + str(round(profile_time, 3)) + " seconds")
+
+    def _log_startup_time(self, start, profile_time, timeout=120):
+        """Logs the time until the DevTools endpoint of the started browser is available."""
+        if self.devtools.wait_until_available(timeout):
+            self.logger.info("Browser with " + self._get_profile_mode() + " profile ready after "
+                             + str(round(time.monotonic() - start, 3)) + " seconds (profile"
+                             + " prepared in " + str(round(profile_time, 3)) + " seconds)")
+
+    def _get_profile_mode(self):
+        return "ephemeral" if self.profile_snapshot_dir else "persistent"
+
+    def _create_ephemeral_profile(self):
+        self._delete_ephemeral_profile()
+        user_data_dir = tempfile.mkdtemp(prefix="chromium-dashboard-",
+                                         dir=self.ephemeral_profile_root)
+        try:
+            shutil.copytree(self.profile_snapshot_dir, user_data_dir, symlinks=True,
+                            ignore=PROFILE_SNAPSHOT_IGNORE, dirs_exist_ok=True)
+        except OSError as e:
+            self.logger.error("Failed to copy the profile snapshot "
+                              + self.profile_snapshot_dir + ": " + str(e))
+        self._ephemeral_user_data_dir = user_data_dir
+        self.logger.debug("Created ephemeral profile " + user_data_dir)
+
+    def _delete_ephemeral_profile(self):
+        if self._ephemeral_user_data_dir:
+            shutil.rmtree(self._ephemeral_user_data_dir, ignore_errors=True)
+            self._ephemeral_user_data_dir = None
+
+    def _get_command(self):
+        command = [
+            "/usr/bin/chromium-browser",
+            "--display=" + self.x_display,
+            "--noerrdialogs",
+            "--disable-session-restore",
+            "--disable-session-crashed-bubble",
+            "--disable-infobars"
+        ]
+        if self.remote_debugging_port:
+            command.append("--remote-debugging-port=" + str(self.remote_debugging_port))
+        if self._ephemeral_user_data_dir:
+            command += [
+                "--user-data-dir=" + self._ephemeral_user_data_dir,
+                # the disk cache is not part of the user data directory on Linux
+                "--disk-cache-dir=" + os.path.join(self._ephemeral_user_data_dir, "Cache")
+            ]
+        elif self.user_data_dir:
+            command.append("--user-data-dir=" + self.user_data_dir)
+        if self.hidden:
+            command += [
+                "--window-position=-10000,-10000",
+                # keep rendering the dashboard while the window is hidden
+                "--disable-backgrounding-occluded-windows",
+                "--disable-renderer-backgrounding",
+                "--disable-background-timer-throttling"
+            ]
+        else:
+            command.append("--start-fullscreen")
+        command.append(self._get_dashboard_url())
+        return command
+
+    def _get_dashboard_url(self):
+        return "https://dashboard.blaulichtsms.net/#/login?token=" + self._session_id
 
     def is_alive(self):
-        return self._process.poll() is None
+        if self._process.poll() is not None:
+            return False
+        if not self.health_probe:
+            return True
+        is_healthy = self.health_probe.is_healthy()
+        if self.health_probe.last_health is not None and self.health_probe.last_health.is_healthy:
+            self._in_place_recovery_count = 0
+        return is_healthy
+
+    def recover(self, session_id):
+        """Shows the dashboard with a new session, in the running browser if possible.
+        Otherwise the browser is started again and a browser which is still running
+        but not healthy is terminated first.
+        """
+        if self.recover_in_place(session_id):
+            return
+        if self._process.poll() is None:
+            self.terminate()
+        self.start()
+
+    def get_recycle_reason(self):
+        """Checks the resources of the browser against the limits of the :resource_monitor:.
+
+        :return: The reason why the browser should be recycled or None
+        """
+        if not self.resource_monitor or self._process.poll() is not None:
+            return None
+        return self.resource_monitor.get_exceeded_limit()
+
+    def recycle(self, session_id):
+        """Restarts the browser with a new session to free its resources."""
+        self._session_id = session_id
+        self._in_place_recovery_count = 0
+        self.terminate()
+        self.start()
+
+    def recover_in_place(self, session_id):
+        """Navigates the dashboard tab of the running browser to a new session.
+
+        :return: True if the tab navigated to the dashboard
+        """
+        self._session_id = session_id
+        if self.devtools is None or self._process.poll() is not None:
+            return False
+        if self._in_place_recovery_count >= self.max_in_place_recoveries:
+            self.logger.warning("Reloading the dashboard did not help. Restarting the browser.")
+            self._in_place_recovery_count = 0
+            return False
+        start = time.monotonic()
+        try:
+            with self.devtools.connect_page() as page:
+                result = page.send("Page.navigate", {"url": self._get_dashboard_url()})
+        except DevToolsException as e:
+            self.logger.warning("Failed to reload the dashboard: " + str(e))
+            return False
+        if result.get("errorText"):
+            self.logger.warning("Failed to reload the dashboard: " + result["errorText"])
+            return False
+        self._in_place_recovery_count += 1
+        if self.health_probe:
+            self.health_probe.reset()
+        self.logger.info("Reloaded the dashboard in "
+                         + str(round(time.monotonic() - start, 3)) + " seconds")
+        return True
+
+    def show(self):
+        """Moves the window of a hidden instance on-screen and switches it to fullscreen.
+
+        :return: True if the window is shown
+        """
+        try:
+            with self.devtools.connect_browser() as browser:
+                window_id = self._get_window_id(browser)
+                browser.send("Browser.setWindowBounds",
+                             {"windowId": window_id, "bounds": {"windowState": "normal"}})
+                browser.send("Browser.setWindowBounds",
+                             {"windowId": window_id, "bounds": {"left": 0, "top": 0}})
+                browser.send("Browser.setWindowBounds",
+                             {"windowId": window_id, "bounds": {"windowState": "fullscreen"}})
+            self.hidden = False
+            return True
+        except DevToolsException as e:
+            self.logger.warning("Failed to show the browser window: " + str(e))
+            return False
+
+    def hide(self):
+        """Minimizes the window of the instance.
+
+        :return: True if the window is hidden
+        """
+        try:
+            with self.devtools.connect_browser() as browser:
+                browser.send("Browser.setWindowBounds",
+                             {"windowId": self._get_window_id(browser),
+                              "bounds": {"windowState": "minimized"}})
+            self.hidden = True
+            return True
+        except DevToolsException as e:
+            self.logger.warning("Failed to hide the browser window: " + str(e))
+            return False
+
+    @staticmethod
+    def _get_window_id(browser):
+        targets = browser.send("Target.getTargets")["targetInfos"]
+        pages = [target for target in targets if target["type"] == "page"]
+        if not pages:
+            raise DevToolsException("There is no page")
+        return browser.send("Browser.getWindowForTarget",
+                            {"targetId": pages[0]["targetId"]})["windowId"]
 
     def _delete_crash_exit(self):
         """If Chromium starts after an unexpected exit (e.g. the host chrashed),
@@ -44,8 +264,9 @@ class ChromiumBrowserController:
         This method removes this notification, as it is not wanted for the alarm monitor.
         """
         self.logger.debug("Delete crashed session flag")
-        file_path = os.path.join(
-            str(Path.home()), ".config", "chromium", "Default", "Preferences")
+        user_data_dir = self.user_data_dir if self.user_data_dir \
+            else os.path.join(CONFIG_DIR, "chromium")
+        file_path = os.path.join(user_data_dir, "Default", "Preferences")
         try:
             with fileinput.input(files=file_path, inplace=True) as file:
                 for line in file:
@@ -60,6 +281,254 @@ class ChromiumBrowserController:
                 + " No crashed session flag to delete."
             )
 
-    def terminate(self):
+    def terminate(self, timeout=10):
+        if self._process is None:
+            # the browser failed to start
+            self._delete_ephemeral_profile()
+            return
         self._process.terminate()
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.logger.warning("The browser did not exit. Killing it.")
+            self._process.kill()
+            self._process.wait()
+        self._delete_ephemeral_profile()
         self.logger.info("Closed browser")
+
+
+class HotSpareBrowserController:
+    """Shows the blaulichtSMS Einsatzmonitor dashboard in a Chromium instance
+    and keeps a second, hidden instance with the dashboard already loaded.
+
+    If the shown instance crashes, the spare instance is shown instead within a fraction of
+    a second. A new spare instance is started in the background afterwards.
+    Both instances use their own user data directory and remote debugging port.
+    If :health_probe_factory: is given, it's called with the DevTools client of each instance
+    to create its health probe.
+    With a :profile_snapshot_dir:, both instances use their own ephemeral copy of the snapshot.
+    If :resource_monitor_factory: is given, it's called to create the resource monitor
+    of each instance.
+    Both instances are shown on the X display :x_display:.
+    """
+
+    def __init__(self, session_id, remote_debugging_ports=(9222, 9223),
+                 user_data_dirs=(os.path.join(CONFIG_DIR, "chromium-dashboard-1"),
+                                 os.path.join(CONFIG_DIR, "chromium-dashboard-2")),
+                 spare_warm_up_timeout=60, health_probe_factory=None, profile_snapshot_dir=None,
+                 ephemeral_profile_root="/dev/shm", resource_monitor_factory=None, x_display=":0"):
+        self.logger = logging.getLogger(__name__)
+        self._session_id = session_id
+        self.x_display = x_display
+        self._slots = list(zip(remote_debugging_ports, user_data_dirs))
+        self._spare_warm_up_timeout = spare_warm_up_timeout
+        self._health_probe_factory = health_probe_factory
+        self._profile_snapshot_dir = profile_snapshot_dir
+        self._ephemeral_profile_root = ephemeral_profile_root
+        self._resource_monitor_factory = resource_monitor_factory
+        self._is_primary_recycle_required = False
+        self._is_spare_recycle_required = False
+        self._lock = threading.Lock()
+        self._is_warming_up = False
+        self._is_terminated = False
+        self.primary = self._create_browser(self._slots[0], hidden=False)
+        self.spare = None
+
+    def start(self):
+        self.primary.start()
+        self._warm_up_spare_async()
+
+    def is_alive(self):
+        """Checks if the shown instance is running. Replaces a crashed spare instance."""
+        with self._lock:
+            is_spare_crashed = self.spare is not None and not self.spare.is_alive()
+            if is_spare_crashed:
+                self.spare = None
+        if is_spare_crashed:
+            self.logger.warning("The spare browser is not running. Starting it.")
+            self._warm_up_spare_async()
+        return self.primary.is_alive()
+
+    def recover(self, session_id):
+        """Reloads the dashboard in the shown instance if possible.
+        Otherwise shows the spare instance if it is ready or starts a new instance.
+        """
+        self._session_id = session_id
+        if self.primary.recover_in_place(session_id):
+            return
+        self._fail_over()
+
+    def get_recycle_reason(self):
+        """Checks the resources of both instances.
+
+        :return: The reason why an instance should be recycled or None
+        """
+        with self._lock:
+            spare = self.spare
+        spare_reason = spare.get_recycle_reason() if spare is not None else None
+        self._is_spare_recycle_required = spare_reason is not None
+        primary_reason = self.primary.get_recycle_reason()
+        self._is_primary_recycle_required = primary_reason is not None
+        if primary_reason is not None:
+            return "shown browser: " + primary_reason
+        if spare_reason is not None:
+            return "spare browser: " + spare_reason
+        return None
+
+    def recycle(self, session_id):
+        """Replaces the instances which exceeded their resource limits.
+        The shown instance is replaced by the spare instance.
+        """
+        self._session_id = session_id
+        if self._is_spare_recycle_required:
+            self._is_spare_recycle_required = False
+            with self._lock:
+                spare, self.spare = self.spare, None
+            if spare is not None:
+                spare.terminate()
+        if self._is_primary_recycle_required:
+            self._is_primary_recycle_required = False
+            self._fail_over()
+        else:
+            self._warm_up_spare_async()
+
+    def _fail_over(self):
+        with self._lock:
+            spare, self.spare = self.spare, None
+        failed_primary = self.primary
+        if spare is not None and spare.is_alive() and spare.show():
+            self.logger.info("Switched to the spare browser")
+            self.primary = spare
+            failed_primary.terminate()
+        else:
+            if spare is not None and spare.is_alive():
+                spare.terminate()
+            failed_primary.terminate()
+            self.primary = self._create_browser(self._get_slot(self.primary), hidden=False)
+            self.primary.start()
+        self._warm_up_spare_async()
+
+    def terminate(self):
+        self.primary.terminate()
+        with self._lock:
+            self._is_terminated = True
+            if self.spare is not None:
+                self.spare.terminate()
+                self.spare = None
+
+    def _warm_up_spare_async(self):
+        with self._lock:
+            if self._is_warming_up or self._is_terminated:
+                return
+            self._is_warming_up = True
+        threading.Thread(target=self._warm_up_spare, daemon=True).start()
+
+    def _warm_up_spare(self):
+        """Starts a spare instance. It's terminated again if it fails to start,
+        is not ready in time or the controller is terminated meanwhile.
+        """
+        spare = None
+        is_ready = False
+        try:
+            spare_slot = self._slots[1] if self._get_slot(self.primary) == self._slots[0] \
+                else self._slots[0]
+            spare = self._create_browser(spare_slot, hidden=True)
+            spare.start()
+            if spare.devtools.wait_until_available(self._spare_warm_up_timeout):
+                spare.hide()
+                is_ready = True
+            else:
+                self.logger.warning("The spare browser did not start in time")
+        except Exception:
+            self.logger.exception("Failed to start the spare browser")
+        finally:
+            with self._lock:
+                self._is_warming_up = False
+                is_ready = is_ready and not self._is_terminated
+                if is_ready:
+                    self.spare = spare
+            if not is_ready and spare is not None:
+                spare.terminate()
+        if is_ready:
+            self.logger.info("The spare browser is ready")
+
+    def _get_slot(self, browser):
+        return browser.remote_debugging_port, browser.user_data_dir
+
+    def _create_browser(self, slot, hidden):
+        remote_debugging_port, user_data_dir = slot
+        browser = ChromiumBrowserController(self._session_id, remote_debugging_port,
+                                            user_data_dir, hidden,
+                                            profile_snapshot_dir=self._profile_snapshot_dir,
+                                            ephemeral_profile_root=self._ephemeral_profile_root,
+                                            x_display=self.x_display)
+        if self._health_probe_factory:
+            browser.health_probe = self._health_probe_factory(browser.devtools)
+        if self._resource_monitor_factory:
+            browser.resource_monitor = self._resource_monitor_factory()
+        return browser
+
+
+class MultiDisplayBrowserController:
+    """Shows the blaulichtSMS Einsatzmonitor dashboard on several displays
+    with one browser controller per display.
+
+    Only the browsers which are not alive are recovered
+    and only the browsers which exceeded their resource limits are recycled,
+    so the dashboard never disappears from the other displays.
+    """
+
+    def __init__(self, browser_controllers):
+        self.logger = logging.getLogger(__name__)
+        self.browser_controllers = browser_controllers
+        self._failed_browsers = []
+        self._recycled_browsers = []
+
+    def start(self):
+        for browser_controller in self.browser_controllers:
+            browser_controller.start()
+
+    def is_alive(self):
+        """Checks the browsers of all displays.
+
+        :return: True if the browsers of all displays are alive
+        """
+        self._failed_browsers = [browser_controller
+                                 for browser_controller in self.browser_controllers
+                                 if not browser_controller.is_alive()]
+        for browser_controller in self._failed_browsers:
+            self.logger.warning("The browser on display " + browser_controller.x_display
+                                + " is not running or not healthy")
+        return not self._failed_browsers
+
+    def recover(self, session_id):
+        """Recovers the browsers which were not alive at the last :is_alive: check."""
+        failed_browsers, self._failed_browsers = self._failed_browsers, []
+        for browser_controller in failed_browsers:
+            browser_controller.recover(session_id)
+
+    def get_recycle_reason(self):
+        """Checks the resources of the browsers of all displays.
+
+        :return: The reasons why browsers should be recycled or None
+        """
+        reasons = []
+        self._recycled_browsers = []
+        for browser_controller in self.browser_controllers:
+            reason = browser_controller.get_recycle_reason()
+            if reason is not None:
+                self._recycled_browsers.append(browser_controller)
+                reasons.append("display " + browser_controller.x_display + ": " + reason)
+        return ", ".join(reasons) if reasons else None
+
+    def recycle(self, session_id):
+        """Recycles the browsers which exceeded their resource limits
+        at the last :get_recycle_reason: check.
+        """
+        recycled_browsers, self._recycled_browsers = self._recycled_browsers, []
+        for browser_controller in recycled_browsers:
+            browser_controller.recycle(session_id)
+
+    def terminate(self):
+        for browser_controller in self.browser_controllers:
+            browser_controller.terminate()
@@ -0,0 +1,64 @@
+import queue
+import threading
+from concurrent.futures import Executor, Future
+
+
+class DaemonThreadExecutor(Executor):
+    """Runs the submitted calls one after another in a single daemon thread.
+
+    The workers of a ThreadPoolExecutor are joined when the interpreter exits,
+    so a call which hangs, e.g. on a device which stopped responding, blocks the exit forever.
+    This thread is not joined at exit, and :shutdown: waits for it at most :timeout: seconds.
+    """
+
+    def __init__(self, thread_name):
+        self._calls = queue.Queue()
+        self._is_shut_down = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_calls, name=thread_name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._is_shut_down:
+                raise RuntimeError("Cannot submit a call after the shutdown")
+            future = Future()
+            self._calls.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False, timeout=None):
+        """Stops the thread after the submitted calls.
+
+        :param cancel_futures: True if the calls which did not start yet are cancelled
+        :param timeout: The maximum number of seconds to wait for the thread if :wait: is True
+        :return: True if the thread finished
+        """
+        with self._lock:
+            self._is_shut_down = True
+            if cancel_futures:
+                while True:
+                    try:
+                        call = self._calls.get_nowait()
+                    except queue.Empty:
+                        break
+                    if call is not None:
+                        call[0].cancel()
+            self._calls.put(None)
+        if wait:
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run_calls(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            future, fn, args, kwargs = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -0,0 +1,188 @@
+import base64
+import json
+import logging
+import os
+import socket
+import struct
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+
+class DevToolsException(Exception):
+    pass
+
+
+class DevToolsConnection:
+    """A WebSocket connection to a target of the
+    `Chrome DevTools Protocol <https://chromedevtools.github.io/devtools-protocol/>`_.
+
+    Commands are sent one after another. Events received while waiting for the result
+    of a command are ignored.
+    """
+
+    OPCODE_CONTINUATION = 0x0
+    OPCODE_TEXT = 0x1
+    OPCODE_CLOSE = 0x8
+    OPCODE_PING = 0x9
+    OPCODE_PONG = 0xA
+
+    def __init__(self, websocket_url, timeout=5):
+        self.logger = logging.getLogger(__name__)
+        self.timeout = timeout
+        self._last_id = 0
+        url = urlparse(websocket_url)
+        try:
+            self._socket = socket.create_connection((url.hostname, url.port), timeout)
+            self._handshake(url.netloc, url.path)
+        except OSError as e:
+            raise DevToolsException("Failed to connect to " + websocket_url) from e
+
+    def send(self, method, params=None, timeout=None):
+        """Sends the command :method: and waits at most :timeout: seconds for its result.
+
+        :return: The result of the command
+        """
+        self._last_id += 1
+        command_id = self._last_id
+        message = {"id": command_id, "method": method, "params": params or {}}
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        try:
+            self._send_frame(self.OPCODE_TEXT, json.dumps(message).encode())
+            while True:
+                self._socket.settimeout(max(deadline - time.monotonic(), 0.001))
+                response = json.loads(self._receive_message())
+                if response.get("id") != command_id:
+                    continue
+                if "error" in response:
+                    raise DevToolsException(method + " failed: " + str(response["error"]))
+                return response.get("result", {})
+        except (OSError, ValueError) as e:
+            raise DevToolsException(method + " failed") from e
+
+    def close(self):
+        try:
+            self._send_frame(self.OPCODE_CLOSE, b"")
+        except OSError:
+            pass
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _handshake(self, host, path):
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = "GET " + path + " HTTP/1.1\r\n" \
+            + "Host: " + host + "\r\n" \
+            + "Upgrade: websocket\r\n" \
+            + "Connection: Upgrade\r\n" \
+            + "Sec-WebSocket-Key: " + key + "\r\n" \
+            + "Sec-WebSocket-Version: 13\r\n\r\n"
+        self._socket.sendall(request.encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = self._socket.recv(1024)
+            if not chunk:
+                raise DevToolsException("Connection closed during the WebSocket handshake")
+            response += chunk
+        status_line = response.split(b"\r\n", 1)[0]
+        if b" 101 " not in status_line:
+            raise DevToolsException("WebSocket handshake failed: " + status_line.decode())
+
+    def _send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 1 << 16:
+            header += bytes([0x80 | 126]) + struct.pack("!H", length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack("!Q", length)
+        # frames sent by a client have to be masked
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        self._socket.sendall(header + mask + masked)
+
+    def _receive_message(self):
+        message = b""
+        while True:
+            is_final, opcode, payload = self._receive_frame()
+            if opcode == self.OPCODE_PING:
+                self._send_frame(self.OPCODE_PONG, payload)
+            elif opcode == self.OPCODE_CLOSE:
+                raise DevToolsException("The DevTools connection was closed")
+            elif opcode in (self.OPCODE_TEXT, self.OPCODE_CONTINUATION):
+                message += payload
+                if is_final:
+                    return message.decode()
+
+    def _receive_frame(self):
+        first, second = self._receive_exactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._receive_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._receive_exactly(8))[0]
+        return bool(first & 0x80), first & 0x0F, self._receive_exactly(length)
+
+    def _receive_exactly(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self._socket.recv(count - len(data))
+            if not chunk:
+                raise DevToolsException("The DevTools connection was closed")
+            data += chunk
+        return data
+
+
+class DevToolsClient:
+    """Accesses a Chromium instance which was started with --remote-debugging-port."""
+
+    def __init__(self, port, host="127.0.0.1", timeout=5):
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+
+    def is_available(self):
+        try:
+            self._get_json("/json/version")
+            return True
+        except DevToolsException:
+            return False
+
+    def wait_until_available(self, timeout):
+        """
+        :return: True if the DevTools endpoint became available within :timeout: seconds
+        """
+        deadline = time.monotonic() + timeout
+        while not self.is_available():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def connect_browser(self):
+        """Connects to the browser target, e.g. to control windows."""
+        version = self._get_json("/json/version")
+        return DevToolsConnection(version["webSocketDebuggerUrl"], self.timeout)
+
+    def connect_page(self):
+        """Connects to the first page target, i.e. the tab showing the dashboard."""
+        pages = self.get_pages()
+        if not pages:
+            raise DevToolsException("There is no page")
+        return DevToolsConnection(pages[0]["webSocketDebuggerUrl"], self.timeout)
+
+    def get_pages(self):
+        return [target for target in self._get_json("/json/list") if target["type"] == "page"]
+
+    def _get_json(self, path):
+        url = "http://" + self.host + ":" + str(self.port) + path
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                return json.loads(response.read().decode())
+        except (OSError, ValueError) as e:
+            raise DevToolsException("Failed to request " + url) from e
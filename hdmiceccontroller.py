@@ -1,12 +1,15 @@
 import logging
 import re
 import subprocess
+import sys
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 from enum import IntEnum
-from queue import Empty, Queue
-from threading import Thread
+from queue import Empty
+from threading import Condition, Event, Lock, Thread
 
-import cec
+from daemonthreadexecutor import DaemonThreadExecutor
 
 
 class CecMode(IntEnum):
@@ -24,11 +27,136 @@ class CecLogging(IntEnum):
     CEC_LOG_ALL = 31
 
 
+class CecEvent:
+    """An output line of cec-client parsed into its parts.
+
+    :level: is the log level of a log line, e.g. "TRAFFIC", and None for other lines.
+    :direction: is "<<" for sent and ">>" for received CEC messages of TRAFFIC lines.
+    The CEC message parts are None if the line does not contain a CEC message with an opcode.
+    """
+
+    __slots__ = ("line", "level", "direction", "initiator", "destination", "opcode", "parameters")
+
+    # e.g. "TRAFFIC: [          271838]	>> 0f:36"
+    LOG_PATTERN = re.compile(r"^(ERROR|WARNING|NOTICE|TRAFFIC|DEBUG):\s*\[\s*\d+\]\s*(.*?)\s*$")
+    TRAFFIC_PATTERN = re.compile(r"^(<<|>>)\s*([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2})+)$")
+
+    def __init__(self, line):
+        self.line = line
+        self.level = None
+        self.direction = None
+        self.initiator = None
+        self.destination = None
+        self.opcode = None
+        self.parameters = None
+
+        match = self.LOG_PATTERN.match(line)
+        if match is None:
+            return
+        self.level = match.group(1)
+        if self.level != "TRAFFIC":
+            return
+        match = self.TRAFFIC_PATTERN.match(match.group(2))
+        if match is None:
+            return
+        self.direction = match.group(1)
+        frame = bytes(int(byte, 16) for byte in match.group(2).split(":"))
+        self.initiator = frame[0] >> 4
+        self.destination = frame[0] & 0xF
+        self.opcode = frame[1]
+        self.parameters = frame[2:]
+
+
+class CecPowerStateTracker:
+    """Tracks the power state and the active source of an HDMI CEC device
+    from the messages on the CEC bus.
+
+    A tracked power state is only used for :max_age: seconds.
+    Afterwards the device has to be queried again.
+    """
+
+    # see https://github.com/Pulse-Eight/libcec/blob/master/include/cectypes.h
+    OPCODE_IMAGE_VIEW_ON = 0x04
+    OPCODE_TEXT_VIEW_ON = 0x0D
+    OPCODE_STANDBY = 0x36
+    OPCODE_ACTIVE_SOURCE = 0x82
+    OPCODE_REPORT_POWER_STATUS = 0x90
+    BROADCAST_ADDRESS = 0xF
+
+    POWER_STATUS_PATTERN = re.compile(r"power status: *([a-z ]+?)\s*$")
+    POWER_STATUSES = {
+        "on": True,
+        "in transition from standby to on": True,
+        "standby": False,
+        "in transition from on to standby": False
+    }
+
+    def __init__(self, logical_address=0, max_age=60):
+        self.logger = logging.getLogger('CEC')
+        self.logical_address = logical_address
+        self.max_age = max_age
+
+        self.power_on = None
+        self.power_updated_at = None
+        self.active_source = None
+        self.active_source_updated_at = None
+
+    def get_power_state(self):
+        """
+        :return: The tracked power state or None if it is unknown or older than :max_age:
+        """
+        if self.power_updated_at is None \
+                or time.monotonic() - self.power_updated_at > self.max_age:
+            return None
+        return self.power_on
+
+    def set_power_state(self, is_on):
+        if is_on != self.power_on:
+            self.logger.debug("HDMI CEC device is " + ("on" if is_on else "in standby"))
+        self.power_on = is_on
+        self.power_updated_at = time.monotonic()
+
+    def invalidate(self):
+        """Forgets the power state, e.g. after a command was sent which changes it."""
+        self.power_updated_at = None
+
+    def handle_event(self, event):
+        """Tracks the state from a parsed output line of cec-client."""
+        if event.opcode is not None:
+            self.handle_message(event.initiator, event.destination, event.opcode,
+                                event.parameters)
+        elif event.level is None:
+            match = self.POWER_STATUS_PATTERN.search(event.line)
+            if match:
+                is_on = self.POWER_STATUSES.get(match.group(1))
+                if is_on is not None:
+                    self.set_power_state(is_on)
+
+    def handle_message(self, initiator, destination, opcode, parameters):
+        """Tracks the state from a CEC message."""
+        is_to_device = destination in (self.logical_address, self.BROADCAST_ADDRESS)
+        if opcode == self.OPCODE_REPORT_POWER_STATUS and initiator == self.logical_address \
+                and parameters:
+            # 0: on, 1: standby, 2: standby to on, 3: on to standby
+            self.set_power_state(parameters[0] in (0, 2))
+        elif opcode == self.OPCODE_STANDBY and is_to_device:
+            self.set_power_state(False)
+        elif opcode in (self.OPCODE_IMAGE_VIEW_ON, self.OPCODE_TEXT_VIEW_ON) \
+                and destination == self.logical_address:
+            self.set_power_state(True)
+        elif opcode == self.OPCODE_ACTIVE_SOURCE:
+            self.active_source = initiator
+            self.active_source_updated_at = time.monotonic()
+            self.logger.debug("Active source: " + str(initiator))
+
+
 class AbstractCecController(ABC):
 
-    def __init__(self, send_errors, mail_sender):
+    def __init__(self, send_errors, mail_sender, state_max_age=60):
         self.logger = logging.getLogger(__name__)
         self._mail_sender = mail_sender
+        self.power_state_tracker = CecPowerStateTracker(self._get_logical_address(),
+                                                        state_max_age)
 
         self._send_errors = send_errors
         self._is_hdmi_error = False
@@ -59,6 +187,14 @@ class AbstractCecController(ABC):
         """ check if the monitor is on """
         pass
 
+    def close(self, timeout=10):
+        """ release the HDMI CEC device, waiting at most :timeout: seconds """
+        pass
+
+    def _get_logical_address(self):
+        """ the logical CEC address of the controlled device """
+        return 0
+
     def _handle_hdmi_error(self):
         self.logger.error("Cannot connect to HDMI CEC device")
 
@@ -75,12 +211,19 @@ class AbstractCecController(ABC):
 class PythonCecController(AbstractCecController):
     """Controls a HDMI CEC device using the libCEC Python bindings
     by {@link https://github.com/trainman419/python-cec|trainman419}
+
+    The bindings open a single CEC adapter per process, so only a single display is supported.
     """
 
     def _init_cec_connection(self):
         self.logger.debug("Initializing HDMI CEC connection...")
+        # the bindings load libCEC, so they are only imported if this controller is used
+        import cec
+        self._cec = cec
         cec.init()
         self.hdmi_cec_device = cec.Device(cec.CECDEVICE_TV)
+        if hasattr(cec, "EVENT_COMMAND"):
+            cec.add_callback(self._handle_cec_command, cec.EVENT_COMMAND)
         self.standby()
         self.logger.info("Successfully initialized HDMI CEC connection")
 
@@ -88,109 +231,313 @@ class PythonCecController(AbstractCecController):
         if not self.is_on():
             self.logger.info("Power on HDMI CEC device")
             self.hdmi_cec_device.power_on()
+            self.power_state_tracker.invalidate()
             self.activate_source()
 
     def standby(self):
         if self.is_on():
             self.logger.info("Standby HDMI CEC device")
             self.hdmi_cec_device.standby()
+            self.power_state_tracker.invalidate()
 
     def activate_source(self):
-        cec.set_active_source()
+        self._cec.set_active_source()
+        self.power_state_tracker.invalidate()
 
     def is_on(self):
+        """Uses the tracked power state if it is recent enough, otherwise queries the device."""
+        is_on = self.power_state_tracker.get_power_state()
+        if is_on is not None:
+            return is_on
         try:
             is_on = self.hdmi_cec_device.is_on()
+            self.power_state_tracker.set_power_state(is_on)
             if self._is_hdmi_error:
                 self._handle_hdmi_error_resolved()
             return is_on
         except OSError:
             self._handle_hdmi_error()
 
+    def _handle_cec_command(self, event, command):
+        """Tracks the power state from the CEC messages reported by python-cec."""
+        self.power_state_tracker.handle_message(command["initiator"], command["destination"],
+                                                command["opcode"], command["parameters"])
+
+
+class CecQuery:
+    """A command sent to cec-client which waits for a response line matching :pattern:."""
+
+    def __init__(self, command, pattern, deadline):
+        self.command = command
+        self.pattern = pattern
+        self.deadline = deadline
+        self.match = None
+        self._done = Event()
+
+    def resolve(self, match):
+        self.match = match
+        self._done.set()
+
+    def wait(self):
+        """Waits until the response arrived or the deadline passed.
+
+        :return: The match of the response line or None if there was no response in time
+        """
+        self._done.wait(max(self.deadline - time.monotonic(), 0))
+        return self.match
+
+
+class CecCommandMultiplexer:
+    """Matches the output lines of cec-client to the queries waiting for a response.
+
+    Several queries can be outstanding at the same time.
+    A line resolves the oldest outstanding query whose pattern matches the line.
+    All other lines are ignored, e.g. the log lines of cec-client.
+    """
+
+    def __init__(self, write_command):
+        self.logger = logging.getLogger('CEC')
+        self._write_command = write_command
+        self._pending = deque()
+        self._lock = Lock()
+
+    def submit(self, command, pattern, timeout=5):
+        """Sends :command: without waiting for the response.
+
+        :return: The :CecQuery: to wait for the response
+        """
+        query = CecQuery(command, re.compile(pattern), time.monotonic() + timeout)
+        with self._lock:
+            self._pending.append(query)
+        self._write_command(command)
+        return query
+
+    def query(self, command, pattern, timeout=5):
+        """Sends :command: and waits at most :timeout: seconds for a response matching :pattern:.
+
+        :return: The match of the response line or None if there was no response in time
+        """
+        query = self.submit(command, pattern, timeout)
+        match = query.wait()
+        if match is None:
+            self.logger.warning("No response to '" + command + "' within " + str(timeout)
+                                + " seconds")
+            self._remove(query)
+        return match
+
+    def dispatch(self, line):
+        """Resolves the oldest outstanding query whose pattern matches :line:.
+
+        :return: True if :line: was a response to a query
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._pending and self._pending[0].deadline < now:
+                self._pending.popleft()
+            for query in self._pending:
+                match = query.pattern.search(line)
+                if match:
+                    self._pending.remove(query)
+                    query.resolve(match)
+                    return True
+        return False
+
+    def cancel_all(self):
+        with self._lock:
+            while self._pending:
+                self._pending.popleft().resolve(None)
+
+    def _remove(self, query):
+        with self._lock:
+            try:
+                self._pending.remove(query)
+            except ValueError:
+                pass
+
+
+class CecEventBuffer:
+    """A buffer of :CecEvent:s with a fixed capacity.
+    If the buffer is full, the oldest event is dropped.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.received_count = 0
+        self.dropped_count = 0
+        self.memory_bytes = 0
+        self._events = deque(maxlen=capacity)
+        self._condition = Condition()
+
+    def put(self, event):
+        """
+        :return: True if the oldest event was dropped
+        """
+        with self._condition:
+            is_dropped = len(self._events) == self.capacity
+            if is_dropped:
+                self.memory_bytes -= self._get_size(self._events[0])
+                self.dropped_count += 1
+            self._events.append(event)
+            self.memory_bytes += self._get_size(event)
+            self.received_count += 1
+            self._condition.notify()
+        return is_dropped
+
+    def get(self, block=True, timeout=None):
+        """Removes and returns the oldest event.
+        Raises the Empty exception if no event is available within :timeout: seconds
+        or immediately if :block: is False.
+        """
+        with self._condition:
+            if block and not self._condition.wait_for(lambda: self._events, timeout):
+                raise Empty()
+            if not self._events:
+                raise Empty()
+            event = self._events.popleft()
+            self.memory_bytes -= self._get_size(event)
+            return event
+
+    def get_all(self):
+        """Removes and returns all events."""
+        with self._condition:
+            events = list(self._events)
+            self._events.clear()
+            self.memory_bytes = 0
+            return events
+
+    def __len__(self):
+        return len(self._events)
+
+    @staticmethod
+    def _get_size(event):
+        return sys.getsizeof(event) + sys.getsizeof(event.line)
+
 
 class StdoutReader():
+    """Reads the output lines of cec-client in a thread and parses them into :CecEvent:s.
 
-    def __init__(self, stdout):
+    Every event is passed to :event_handler:. If the handler does not return True,
+    the event is kept in a buffer of :capacity: events until :stop_buffering: is called.
+    """
+
+    def __init__(self, stdout, event_handler=None, capacity=1000):
         self.logger = logging.getLogger('CEC')
-        self.queue = Queue()
+        self.buffer = CecEventBuffer(capacity)
+        self.is_buffering = True
         self.stdout = stdout
+        self.event_handler = event_handler
         self.thread = Thread(target=self.enqueue_output)
         self.thread.daemon = True  # thread dies with the program
         self.thread.start()
 
     def enqueue_output(self):
         for line in iter(self.stdout.readline, ''):
-            self.queue.put(line)
             self.logger.debug('< %s', line.rstrip('\n '))
-        self.logger.debug('closing stdout')
+            event = CecEvent(line)
+            if self.event_handler is not None and self.event_handler(event):
+                continue
+            if not self.is_buffering:
+                continue
+            if self.buffer.put(event) and self.buffer.dropped_count % 1000 == 1:
+                self.logger.info("The CEC output buffer is full. " + self.get_stats())
+        self.logger.debug('closing stdout. ' + self.get_stats())
         self.stdout.close()
 
     def get(self, block=True, timeout=None):
-        """Remove and return an item from the queue.
+        """Remove and return an event from the buffer.
         If optional args block is true and timeout is None (the default),
-        block if necessary until an item is available. If timeout is a
+        block if necessary until an event is available. If timeout is a
         positive number, it blocks at most timeout seconds and raises the
-        Empty exception if no item was available within that time. Otherwise
-        (block is false), return an item if one is immediately available, else
+        Empty exception if no event was available within that time. Otherwise
+        (block is false), return an event if one is immediately available, else
         raise the Empty exception (timeout is ignored in that case)."""
-        return self.queue.get(block, timeout)
+        return self.buffer.get(block, timeout)
 
     def get_nowait(self):
         """Equivalent to `get(False).`"""
         return self.get(False)
 
+    def stop_buffering(self):
+        """Discards the buffered events and the following events not passed to the handler,
+        e.g. after the startup output was read and nothing reads the buffer any more.
+        """
+        self.is_buffering = False
+        self.buffer.get_all()
+
     def read_nonblock(self):
         """read the whole contents of the stream non-blocking"""
-        out_str = []
+        return "\n".join(event.line for event in self.buffer.get_all())
 
-        try:
-            while not self.queue.empty():
-                out_str.append(self.queue.get_nowait())
-        except Empty:
-            pass
-
-        return "\n".join(out_str)
+    def get_stats(self):
+        return "Buffered lines: {}/{}, buffered bytes: {}, received lines: {}, " \
+               "dropped lines: {}".format(len(self.buffer), self.buffer.capacity,
+                                          self.buffer.memory_bytes, self.buffer.received_count,
+                                          self.buffer.dropped_count)
 
 
 class LibCecController(AbstractCecController):
     """Controls a HDMI CEC device using
     {@link https://github.com/Pulse-Eight/libcec|Pulse-Eight libCEC}
+
+    Each instance runs its own cec-client, which opens the CEC adapter :adapter:,
+    e.g. /dev/cec1, or the first adapter found if it is None.
     """
 
-    def __init__(self, *args, debug_level=CecLogging.CEC_LOG_ERROR, device_id="0", **kwargs):
+    def __init__(self, *args, debug_level=CecLogging.CEC_LOG_ERROR, device_id="0",
+                 output_buffer_size=1000, adapter=None, **kwargs):
         # see https://github.com/Pulse-Eight/libcec/blob/master/include/cectypes.h#L829
         self._debug_level = debug_level
+        self.adapter = adapter
+        self._output_buffer_size = output_buffer_size
         self.cecclient = None
         self.stdout_reader = None
+        self.multiplexer = CecCommandMultiplexer(self.execute_cec_command)
         self.device_id = device_id
         self.cec_logger = logging.getLogger('CEC')
         super(LibCecController, self).__init__(*args, **kwargs)
 
     def _init_cec_connection(self):
         self.logger.debug('initializing CEC connection')
+        self.multiplexer.cancel_all()
+        command = ['cec-client', '-d', '{}'.format(self._debug_level), '-o', 'alarmmonitor']
+        if self.adapter:
+            command.append(self.adapter)
         self.cecclient = subprocess.Popen(
-            ['cec-client', '-d', '{}'.format(self._debug_level), '-o', 'alarmmonitor'],
+            command,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             encoding='utf-8',
         )
-        self.stdout_reader = StdoutReader(self.cecclient.stdout)
+        self.stdout_reader = StdoutReader(self.cecclient.stdout, self._handle_event,
+                                          self._output_buffer_size)
         self.wait_to_be_ready()
+        # the responses are matched by the multiplexer, the other lines are not read any more
+        self.stdout_reader.stop_buffering()
 
     def wait_to_be_ready(self):
         """wait for CEC to initialize"""
         count = 0
         while count < 6:
             try:
-                line = self.stdout_reader.get(timeout=10)
-                if "waiting for input" in line:
+                event = self.stdout_reader.get(timeout=10)
+                if "waiting for input" in event.line:
                     self.cec_logger.info('CEC is ready')
                     break
             except Empty:
                 self.cec_logger.warning("haven't received a line from CEC")
                 count += 3
 
+    def _handle_event(self, event):
+        self.power_state_tracker.handle_event(event)
+        return self.multiplexer.dispatch(event.line)
+
+    def _get_logical_address(self):
+        try:
+            return int(self.device_id, 16)
+        except ValueError:
+            return 0
+
     def read_stdout(self):
         if not self.is_connected:
             return ''
@@ -208,26 +555,30 @@ class LibCecController(AbstractCecController):
     def power_on(self):
         self.logger.info("Power on HDMI CEC device")
         self.execute_cec_command("on " + self.device_id)
+        self.power_state_tracker.invalidate()
         # self.activate_source()
 
     def standby(self):
         self.logger.info("Standby HDMI CEC device %s", self.device_id)
         self.execute_cec_command("standby " + self.device_id)
+        self.power_state_tracker.invalidate()
 
     def activate_source(self):
         self.execute_cec_command("as")
+        self.power_state_tracker.invalidate()
 
     def is_on(self):
+        """Uses the tracked power state if it is recent enough, otherwise queries the device.
+        The response of the query updates the tracked power state.
+        """
+        is_on = self.power_state_tracker.get_power_state()
+        if is_on is not None:
+            return is_on
         self.connect()
-        self.read_stdout()
-        self.execute_cec_command("pow {}".format(self.device_id))
-        cec_scan = ""
-        try:
-            cec_scan = self.stdout_reader.get(True, 5)
-        except Empty:
-            pass
-        re_match = re.search(r"power status: *([a-z]+)$", cec_scan, re.MULTILINE)
-        return re_match is not None and re_match.group(1) == "on"
+        re_match = self.multiplexer.query("pow {}".format(self.device_id),
+                                          CecPowerStateTracker.POWER_STATUS_PATTERN)
+        return re_match is not None \
+            and CecPowerStateTracker.POWER_STATUSES.get(re_match.group(1), False)
 
     def execute_cec_command(self, command, new_line=True):
         """write a command to stdin of cec-client"""
@@ -243,3 +594,58 @@ class LibCecController(AbstractCecController):
         if self.cecclient:
             self.cecclient.kill()
             self.cecclient.wait(10)
+
+
+class CecControllerGroup:
+    """Controls several HDMI CEC devices, e.g. the TVs of several displays, like a single device.
+
+    The commands are sent to all devices in parallel, so all devices switch at the same time.
+    Each device is controlled from its own daemon thread, so a device which stopped responding
+    does not block the exit.
+    """
+
+    def __init__(self, cec_controllers):
+        self.logger = logging.getLogger(__name__)
+        self.cec_controllers = cec_controllers
+        self._executors = [DaemonThreadExecutor("cec-" + str(index))
+                           for index in range(len(cec_controllers))]
+
+    def power_on(self):
+        self._run_all(lambda cec_controller: cec_controller.power_on())
+
+    def standby(self):
+        self._run_all(lambda cec_controller: cec_controller.standby())
+
+    def activate_source(self):
+        self._run_all(lambda cec_controller: cec_controller.activate_source())
+
+    def is_on(self):
+        """
+        :return: True if all devices are on, False if all devices are in standby,
+            None if the devices are in different states or a state is unknown
+        """
+        states = set(self._run_all(lambda cec_controller: cec_controller.is_on()))
+        return states.pop() if len(states) == 1 else None
+
+    def _run_all(self, func):
+        """Calls :func: with each controller in parallel and waits for all calls.
+
+        :return: The results of the calls
+        """
+        futures = [executor.submit(func, cec_controller)
+                   for executor, cec_controller in zip(self._executors, self.cec_controllers)]
+        return [future.result() for future in futures]
+
+    def close(self, timeout=10):
+        """Stops the threads of the devices after their running commands.
+        Waits at most :timeout: seconds for all of them.
+        """
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + timeout
+        for executor, cec_controller in zip(self._executors, self.cec_controllers):
+            if executor.shutdown(timeout=max(deadline - time.monotonic(), 0)):
+                cec_controller.close(max(deadline - time.monotonic(), 0))
+            else:
+                self.logger.warning("The HDMI CEC device did not finish its command."
+                                    " Abandoning it.")
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+
+
+class LogWriteStatistics:
+    """Counts the writes of :BufferedLogWriter: instances. The times are in seconds."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.record_count = 0
+        self.byte_count = 0
+        self.flush_count = 0
+        self.fsync_count = 0
+        self.tail_write_count = 0
+        self.max_flush_latency = 0
+        self.total_flush_latency = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Starts counting from zero.
+
+        :return: A :LogWriteStatistics: with the counts until now
+        """
+        statistics = LogWriteStatistics()
+        with self._lock:
+            for name in ("started", "record_count", "byte_count", "flush_count", "fsync_count",
+                         "tail_write_count", "max_flush_latency", "total_flush_latency"):
+                value = getattr(self, name)
+                setattr(self, name, getattr(statistics, name))
+                setattr(statistics, name, value)
+        return statistics
+
+    def add_flush(self, byte_count, latency):
+        with self._lock:
+            self.byte_count += byte_count
+            self.flush_count += 1
+            self.fsync_count += 1
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def add_tail_write(self):
+        with self._lock:
+            self.tail_write_count += 1
+            self.fsync_count += 1
+
+    def __str__(self):
+        duration = max(time.monotonic() - self.started, 1e-9)
+        average_latency = self.total_flush_latency / self.flush_count if self.flush_count else 0
+        return "Wrote " + str(self.record_count) + " records (" + str(self.byte_count) \
+            + " bytes, " + str(round(self.byte_count / duration, 1)) + " bytes/s) in " \
+            + str(self.flush_count) + " flushes with " + str(self.fsync_count) + " fsyncs (" \
+            + str(self.tail_write_count) + " tail writes), flush latency average " \
+            + str(round(average_latency * 1000, 1)) + " ms, maximum " \
+            + str(round(self.max_flush_latency * 1000, 1)) + " ms"
+
+
+class BufferedLogWriter:
+    """A file-like object which keeps the written log lines in memory and appends them to
+    the log file in batches, which spares the SD card.
+
+    The lines are appended every :flush_interval: seconds, if more than :max_buffer_size: bytes
+    are buffered, on :flush_to_disk: and on :close:.
+    Every :tail_interval: seconds the lines buffered since the last tail write are appended
+    to a small tail file next to the log file, so at most the lines of the last :tail_interval:
+    seconds are lost on a power loss. Each line is written to the tail file only once.
+    The tail file starts with the size of the log file the buffered lines are appended to
+    and is removed when they are. A tail file left by a crash is appended to the log file
+    on the next start.
+    """
+
+    def __init__(self, filename, encoding=None, flush_interval=300, tail_interval=5,
+                 max_buffer_size=2 ** 20, statistics=None):
+        self.logger = logging.getLogger(__name__)
+        self.filename = filename
+        self.tail_filename = filename + ".tail"
+        self.encoding = encoding if encoding else "utf-8"
+        self.flush_interval = flush_interval
+        self.tail_interval = tail_interval
+        self.max_buffer_size = max_buffer_size
+        self.statistics = statistics if statistics else LogWriteStatistics()
+
+        self._lock = threading.RLock()
+        self._buffer = []
+        self._buffer_size = 0
+        self._tail_file = None
+        # the number of buffered lines written to the tail file
+        self._tail_length = 0
+        self._closed = threading.Event()
+        self._file = open(filename, "ab")
+        self._recover_tail()
+        self._thread = threading.Thread(target=self._write_periodically, name="log-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        data = text.encode(self.encoding)
+        with self._lock:
+            self._buffer.append(data)
+            self._buffer_size += len(data)
+            self.statistics.record_count += 1
+            if self._buffer_size > self.max_buffer_size:
+                self.flush_to_disk()
+
+    def flush(self):
+        # called after every record, the buffer is flushed in batches instead
+        pass
+
+    def flush_to_disk(self):
+        """Appends the buffered lines to the log file and removes the tail file."""
+        with self._lock:
+            if not self._buffer:
+                return
+            start = time.monotonic()
+            data = b"".join(self._buffer)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer = []
+            self._buffer_size = 0
+            self._remove_tail()
+            self.statistics.add_flush(len(data), time.monotonic() - start)
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        with self._lock:
+            self.flush_to_disk()
+            self._file.close()
+
+    def _write_periodically(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._closed.wait(self.tail_interval):
+            try:
+                if time.monotonic() >= next_flush:
+                    self.flush_to_disk()
+                    next_flush = time.monotonic() + self.flush_interval
+                else:
+                    self._write_tail()
+            except OSError as e:
+                self.logger.error("Failed to write the log: " + str(e))
+
+    def _write_tail(self):
+        with self._lock:
+            if self._tail_length == len(self._buffer):
+                return
+            data = b"".join(self._buffer[self._tail_length:])
+            if self._tail_file is None:
+                # replaced atomically, so a crash never leaves a partial offset
+                offset = os.fstat(self._file.fileno()).st_size
+                temp_filename = self.tail_filename + ".tmp"
+                with open(temp_filename, "wb") as temp_file:
+                    temp_file.write(str(offset).encode() + b"\n" + data)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_filename, self.tail_filename)
+                self._tail_file = open(self.tail_filename, "ab")
+            else:
+                self._tail_file.write(data)
+                self._tail_file.flush()
+                os.fsync(self._tail_file.fileno())
+            self._tail_length = len(self._buffer)
+            self.statistics.add_tail_write()
+
+    def _remove_tail(self):
+        self._tail_length = 0
+        if self._tail_file is not None:
+            self._tail_file.close()
+            self._tail_file = None
+        try:
+            os.remove(self.tail_filename)
+        except FileNotFoundError:
+            pass
+
+    def _recover_tail(self):
+        """Appends the lines of a tail file left by a crash to the log file.
+        Lines already appended before the crash are replaced.
+        """
+        try:
+            with open(self.tail_filename, "rb") as tail_file:
+                offset = int(tail_file.readline())
+                data = tail_file.read()
+        except FileNotFoundError:
+            return
+        except ValueError:
+            self.logger.warning("Removed the invalid log tail file " + self.tail_filename)
+            self._remove_tail()
+            return
+        if os.fstat(self._file.fileno()).st_size > offset:
+            self._file.truncate(offset)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._remove_tail()
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import tarfile
+
+
+class LogArchive:
+    """The result of archiving a log file."""
+
+    __slots__ = ("path", "mime_subtype", "sha256", "log_size", "archive_size")
+
+    def __init__(self, path, mime_subtype, sha256, log_size, archive_size):
+        self.path = path
+        self.mime_subtype = mime_subtype
+        self.sha256 = sha256
+        self.log_size = log_size
+        self.archive_size = archive_size
+
+
+class _HashingReader:
+    """A file object which hashes the data of the log it reads."""
+
+    def __init__(self, file):
+        self._file = file
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self):
+        """
+        :return: The hex SHA-256 digest of the read data
+        """
+        return self._hash.hexdigest()
+
+
+class LogArchiver:
+    """Archives rotated log files in a tar archive compressed with :codec: (gz, bz2 or xz)
+    at compression :level: (the codec's default if None).
+
+    The log is read once in chunks of :chunk_size: bytes. Each chunk is hashed and compressed,
+    so the memory usage does not depend on the size of the log.
+    """
+
+    CODECS = {
+        "gz": ("compresslevel", "gzip"),
+        "bz2": ("compresslevel", "x-bzip2"),
+        "xz": ("preset", "x-xz")
+    }
+
+    def __init__(self, codec="gz", level=None, chunk_size=2 ** 16):
+        if codec not in self.CODECS:
+            raise ValueError("Unsupported codec " + str(codec) + ", use one of "
+                             + ", ".join(self.CODECS))
+        self.codec = codec
+        self.level = level
+        self.chunk_size = chunk_size
+
+    def archive(self, log_path, remove=True):
+        """Archives the log at :log_path: to :log_path:.tar.<codec>.
+
+        :param remove: True if the log is removed after it was archived
+        :return: A :LogArchive:
+        """
+        level_argument, mime_subtype = self.CODECS[self.codec]
+        options = {level_argument: self.level} if self.level is not None else {}
+        archive_path = log_path + ".tar." + self.codec
+        with open(log_path, "rb") as log_file:
+            tar_info = tarfile.TarInfo(os.path.basename(log_path))
+            stat = os.fstat(log_file.fileno())
+            tar_info.size = stat.st_size
+            tar_info.mtime = stat.st_mtime
+            tar_info.mode = stat.st_mode & 0o777
+            reader = _HashingReader(log_file)
+            with tarfile.open(archive_path, "w:" + self.codec, copybufsize=self.chunk_size,
+                              **options) as tar:
+                tar.addfile(tar_info, reader)
+        if remove:
+            os.remove(log_path)
+        return LogArchive(archive_path, mime_subtype, reader.hexdigest(), tar_info.size,
+                          os.path.getsize(archive_path))
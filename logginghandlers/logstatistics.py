@@ -0,0 +1,97 @@
+import logging
+import re
+import threading
+import time
+
+
+class LogStatistics(logging.Filter):
+    """Counts log records by their level, logger name and hour while they are logged,
+    so a summary of a log file does not require to scan the file.
+
+    Added as filter to a handler, all records handled by the handler are counted.
+    Records whose message starts with :start_prefix: are counted as application starts.
+    """
+
+    # a line formatted with "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LINE_PATTERN = re.compile(
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} - (\S+) - ([A-Z]+) - (.*)$")
+
+    def __init__(self, start_prefix="START"):
+        super().__init__()
+        self.start_prefix = start_prefix
+        self.start_count = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        self.count_record(record)
+        return True
+
+    def count_record(self, record):
+        self.count(record.levelno, record.name, record.created,
+                   isinstance(record.msg, str) and record.msg.startswith(self.start_prefix))
+
+    def count(self, levelno, name, created, is_start=False):
+        key = (levelno, name, int(created // 3600))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if is_start:
+                self.start_count += 1
+
+    def count_file(self, path):
+        """Counts the lines of an existing log file, e.g. written before the application started.
+        Lines which do not match :LINE_PATTERN:, like the lines of tracebacks, are skipped.
+        """
+        try:
+            with open(path, errors="replace") as log_file:
+                for line in log_file:
+                    match = self.LINE_PATTERN.match(line)
+                    if not match:
+                        continue
+                    levelno = logging.getLevelName(match.group(3))
+                    if not isinstance(levelno, int):
+                        continue
+                    created = time.mktime(time.strptime(match.group(1), "%Y-%m-%d %H:%M:%S"))
+                    self.count(levelno, match.group(2), created,
+                               match.group(4).startswith(self.start_prefix))
+        except FileNotFoundError:
+            pass
+
+    def reset(self):
+        """Starts counting from zero.
+
+        :return: A :LogStatistics: with the counts until now
+        """
+        statistics = LogStatistics(self.start_prefix)
+        with self._lock:
+            statistics._counts, self._counts = self._counts, {}
+            statistics.start_count, self.start_count = self.start_count, 0
+        return statistics
+
+    def get_count(self, levelno):
+        """
+        :return: The number of records of the level :levelno:
+        """
+        return sum(count for (record_levelno, _, _), count in self._counts.items()
+                   if record_levelno == levelno)
+
+    def get_counts_by_logger(self, min_levelno=logging.WARNING):
+        """
+        :return: A dict of the logger names and their number of records of at least :min_levelno:
+        """
+        return self._get_counts(1, min_levelno)
+
+    def get_counts_by_hour(self, min_levelno=logging.WARNING):
+        """
+        :return: A dict of the hours as "YYYY-MM-DD HH" in local time
+            and their number of records of at least :min_levelno:
+        """
+        return {time.strftime("%Y-%m-%d %H", time.localtime(hour * 3600)): count
+                for hour, count in sorted(self._get_counts(2, min_levelno).items())}
+
+    def _get_counts(self, key_index, min_levelno):
+        counts = {}
+        for key, count in self._counts.items():
+            if key[0] >= min_levelno:
+                counts[key[key_index]] = counts.get(key[key_index], 0) + count
+        return counts
@@ -0,0 +1,67 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues log records without waiting.
+
+    If the bounded queue is full, the record is dropped and counted.
+    The number of dropped records is logged as soon as the queue has space again.
+    """
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped_count = 0
+        self._reported_dropped_count = 0
+
+    def prepare(self, record):
+        # the records are handled within the process, formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped_count != self._reported_dropped_count:
+                self.queue.put_nowait(self._get_dropped_record())
+                self._reported_dropped_count = self.dropped_count
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def _get_dropped_record(self):
+        msg = "The log queue was full. Dropped " \
+            + str(self.dropped_count - self._reported_dropped_count) + " log records, " \
+            + str(self.dropped_count) + " in total."
+        return logging.LogRecord(__name__, logging.WARNING, __file__, 0, msg, None, None)
+
+
+class FlushingQueueListener(QueueListener):
+    """A queue listener which handles all enqueued records before it stops,
+    even if the queue is full, and closes its handlers afterwards.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+            handler.close()
+
+
+def enable_queue_logging(logger, max_size=10000):
+    """Moves the handlers of :logger: to a listener thread.
+    Logging then only enqueues the records in a queue of at most :max_size: records.
+
+    :return: The started :FlushingQueueListener:, which has to be stopped on shutdown
+    """
+    record_queue = queue.Queue(max_size)
+    listener = FlushingQueueListener(record_queue, *logger.handlers, respect_handler_level=True)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(DroppingQueueHandler(record_queue))
+    listener.start()
+    return listener
@@ -0,0 +1,94 @@
+import logging
+import time
+
+
+class _CallSite:
+    __slots__ = ("message", "levelno", "repeat_count", "first_repeat", "last_record")
+
+    def __init__(self, message, levelno):
+        self.message = message
+        self.levelno = levelno
+        self.repeat_count = 0
+        self.first_repeat = None
+        self.last_record = None
+
+
+class RepeatedRecordCollapser:
+    """Collapses log records which repeat the previous message of their call site.
+
+    Periodic tasks log the same messages from the same lines over and over, interleaved with
+    each other. For each logger the last message of each call site is kept. Once a logger only
+    repeats its messages, the repeated records are suppressed and counted.
+    Every :summary_interval: seconds a "repeated N times" summary is written per call site.
+
+    A record with a different message or from a new call site is a state change.
+    It's written immediately, after the summaries of the logger's suppressed records,
+    and the logger's messages are collected anew.
+    Records above the level :max_levelno: are never collapsed, so every warning and error
+    is written when it happens.
+    """
+
+    def __init__(self, summary_interval=3600, max_levelno=logging.INFO):
+        self.summary_interval = summary_interval
+        self.max_levelno = max_levelno
+        self.suppressed_count = 0
+        self._loggers = {}
+
+    def process(self, record):
+        """
+        :return: The records to write instead of :record:
+        """
+        if record.levelno > self.max_levelno:
+            return [record]
+        call_sites, is_repeating = self._loggers.get(record.name, ({}, False))
+        key = (record.pathname, record.lineno)
+        message = record.getMessage()
+        call_site = call_sites.get(key)
+        is_repeated = call_site is not None and call_site.message == message \
+            and call_site.levelno == record.levelno
+
+        if is_repeated:
+            self._loggers[record.name] = (call_sites, True)
+            self.suppressed_count += 1
+            call_site.repeat_count += 1
+            call_site.last_record = record
+            if call_site.first_repeat is None:
+                call_site.first_repeat = record.created
+            if record.created - call_site.first_repeat >= self.summary_interval:
+                return [self._get_summary(call_site)]
+            return []
+
+        records = []
+        if call_site is not None or is_repeating:
+            # a state change, the logger's messages are collected anew
+            records = [self._get_summary(site) for site in call_sites.values()
+                       if site.repeat_count]
+            call_sites = {}
+        call_sites[key] = _CallSite(message, record.levelno)
+        self._loggers[record.name] = (call_sites, False)
+        records.append(record)
+        return records
+
+    def flush(self):
+        """Summarizes the records suppressed since the last summaries, e.g. before the log file
+        is rotated or closed. The repeated messages are still suppressed afterwards.
+
+        :return: The summary records
+        """
+        return [self._get_summary(call_site)
+                for call_sites, _ in self._loggers.values()
+                for call_site in call_sites.values() if call_site.repeat_count]
+
+    @staticmethod
+    def _get_summary(call_site):
+        record = call_site.last_record
+        summary = logging.makeLogRecord(record.__dict__)
+        summary.msg = "Repeated " + str(call_site.repeat_count) + " times since " \
+            + time.strftime("%H:%M:%S", time.localtime(call_site.first_repeat)) + ": " \
+            + call_site.message
+        summary.args = None
+        summary.exc_info = None
+        summary.exc_text = None
+        call_site.repeat_count = 0
+        call_site.first_repeat = None
+        return summary
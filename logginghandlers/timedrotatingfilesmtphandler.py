@@ -1,11 +1,15 @@
 import configparser
 import json
-import mmap
+import logging
 import os
-import tarfile
 import threading
 from logging.handlers import TimedRotatingFileHandler
 
+from logginghandlers.bufferedlogwriter import BufferedLogWriter, LogWriteStatistics
+from logginghandlers.logarchiver import LogArchiver
+from logginghandlers.logstatistics import LogStatistics
+from logginghandlers.repeatedrecordcollapser import RepeatedRecordCollapser
+from mailspool import get_mail_spool
 from sendmail import MailSender
 
 
@@ -14,45 +18,136 @@ class TimedRotatingFileSMTPHandler(TimedRotatingFileHandler):
     and compresses a logging file and sends the compressed archive via Email
     at the rotation of the file.
 
-    The resulting archives are "tar.gz"s.
+    The resulting archives are tar archives compressed with :codec: (gz, bz2 or xz)
+    at compression :level:.
+    The summary in the mail is based on :statistics:, which counts the records while they are
+    written, so the log file is not scanned at the rotation.
+    If :collapse_repeats: is greater than 0, records up to the level :collapse_max_level:
+    repeating the previous message of their call site are only summarized every
+    :collapse_repeats: seconds.
+    If :flush_interval: is greater than 0, the log is written by a :BufferedLogWriter:,
+    which appends the records to the file every :flush_interval: seconds, on errors and at
+    the rotation, and keeps a tail file updated every :tail_interval: seconds.
     The file "logging_config.yaml" configures the logging.
     The file "config.ini" configures the Email settings.
+    If a spool directory is set there, the mails are delivered via a :MailSpool:.
     """
 
     # noinspection PyPep8Naming
     def __init__(
         self, filename, configfilename, send_log, when='h', interval=1,
-        backupCount=0, encoding=None, delay=False, utc=False, atTime=None
+        backupCount=0, encoding=None, delay=False, utc=False, atTime=None,
+        codec="gz", level=None, collapse_repeats=0, collapse_max_level="INFO", flush_interval=0,
+        tail_interval=5
     ):
         try:
             os.mkdir(os.path.dirname(filename))
         except FileExistsError:
             pass
+        self.flush_interval = flush_interval
+        self.tail_interval = tail_interval
+        self.write_statistics = LogWriteStatistics()
         super().__init__(
             filename, when, interval, backupCount, encoding, delay, utc, atTime
         )
+        self.log_archiver = LogArchiver(codec, level)
+        self.statistics = LogStatistics()
+        # the log file may already contain the records of a previous run
+        self.statistics.count_file(self.baseFilename)
+        if isinstance(collapse_max_level, str):
+            collapse_max_level = logging.getLevelName(collapse_max_level)
+        self.repeated_record_collapser = \
+            RepeatedRecordCollapser(collapse_repeats, collapse_max_level) \
+            if collapse_repeats > 0 else None
+        self._rotated_files = []
+        self._archive_threads = []
         config = configparser.ConfigParser()
         config.read(configfilename)
         self.mail_sender = MailSender(
             config['Email']['smtp_server'],
             config['Email']['smtp_port'],
             config['Email']['username'],
-            config['Email']['password']
+            config['Email']['password'],
+            max_attachment_size=config.getfloat("Email", "max_attachment_size", fallback=5)
+            * 2 ** 20
         )
+        if send_log:
+            self.mail_sender = get_mail_spool(config, self.mail_sender, "log")
         self.from_addr = config["Email"]["from_addr"]
         self.to_addrs = json.loads(config["Email"]["to_addrs"])
         self.subject = config["Email"]["subject"]
         self.send_log = send_log
 
+    def rotate(self, source, dest):
+        super().rotate(source, dest)
+        self._rotated_files.append(dest)
+
+    def _open(self):
+        if self.flush_interval <= 0:
+            return super()._open()
+        return BufferedLogWriter(self.baseFilename, self.encoding, self.flush_interval,
+                                 self.tail_interval, statistics=self.write_statistics)
+
+    def emit(self, record):
+        records = self.repeated_record_collapser.process(record) \
+            if self.repeated_record_collapser else [record]
+        for record_to_write in records:
+            super().emit(record_to_write)
+        if record.levelno >= logging.ERROR and isinstance(self.stream, BufferedLogWriter):
+            self.stream.flush_to_disk()
+        # counted after a rollover, so the record is counted for the file it is written to
+        self.statistics.count_record(record)
+
     def doRollover(self):
+        self._write_repeat_summaries()
+        statistics = self.statistics.reset()
         super().doRollover()
-        threading.Thread(target=self._compress_log_send_mail).start()
+        write_statistics = self.write_statistics.reset()
+        self._archive_threads = [thread for thread in self._archive_threads if thread.is_alive()]
+        while self._rotated_files:
+            thread = threading.Thread(target=self._compress_log_send_mail,
+                                      args=(self._rotated_files.pop(0), statistics,
+                                            write_statistics),
+                                      name="log-archive")
+            thread.start()
+            self._archive_threads.append(thread)
+
+    def close(self, timeout=60):
+        """Closes the log file and waits at most :timeout: seconds for running archivings."""
+        self.acquire()
+        try:
+            self._write_repeat_summaries()
+        finally:
+            self.release()
+        super().close()
+        for thread in self._archive_threads:
+            thread.join(timeout)
+
+    def _write_repeat_summaries(self):
+        """Writes the pending summaries of repeated records to the current log file,
+        so no repetitions are lost when it is rotated or closed.
+        """
+        if self.repeated_record_collapser is None or self.stream is None:
+            return
+        for summary in self.repeated_record_collapser.flush():
+            # bypasses the rollover check of the rotating handler, the file is about to be closed
+            logging.FileHandler.emit(self, summary)
 
-    def _compress_log_send_mail(self):
-        file_to_compress = self._get_file_to_compress()
-        log_summary = self._generate_log_summary(file_to_compress)
-        compressed_file = self._compress_file(file_to_compress)
-        os.remove(file_to_compress)
+    def _compress_log_send_mail(self, file_to_compress, statistics, write_statistics):
+        log_archive = self.log_archiver.archive(file_to_compress)
+        log_summary = self._generate_log_summary_text(
+            statistics.get_count(logging.ERROR) + statistics.get_count(logging.CRITICAL),
+            statistics.get_count(logging.WARNING),
+            statistics.start_count
+        ) + self._generate_counts_text("Warnings and errors per logger",
+                                       statistics.get_counts_by_logger()) \
+            + self._generate_counts_text("Warnings and errors per hour",
+                                         statistics.get_counts_by_hour()) \
+            + "SHA-256 of " + os.path.basename(file_to_compress) + ": " + log_archive.sha256 \
+            + "\nCompressed " + str(log_archive.log_size) + " to " \
+            + str(log_archive.archive_size) + " bytes\n"
+        if self.flush_interval > 0:
+            log_summary += str(write_statistics) + "\n"
 
         if self.send_log:
             self.mail_sender.send_tar_gz_attachment(
@@ -60,47 +155,10 @@ class TimedRotatingFileSMTPHandler(TimedRotatingFileHandler):
                 self.to_addrs,
                 self.subject,
                 log_summary,
-                compressed_file
+                log_archive.path,
+                log_archive.mime_subtype
             )
 
-    @staticmethod
-    def _get_file_to_compress():
-        file_to_compress = [
-            file for file in os.listdir("log/")
-            if not file.endswith(".tar.gz") and not file.endswith(".log")
-        ][0]
-        file_to_compress = os.path.join("log", file_to_compress)
-        return file_to_compress
-
-    @staticmethod
-    def _compress_file(file):
-        compressed_file = file + ".tar.gz"
-        with tarfile.open(compressed_file, "w:gz") as tar:
-            tar.add(file)
-        return compressed_file
-
-    def _generate_log_summary(self, logfile):
-        with open(logfile, "r+b") as file:
-            memory_mapped = mmap.mmap(
-                file.fileno(), 0, access=mmap.ACCESS_READ)
-
-            error_count = 0
-            warning_count = 0
-            start_count = 0
-
-            line = memory_mapped.readline()
-            while line != b"":
-                if b"ERROR" in line:
-                    error_count += 1
-                if b"WARNING" in line:
-                    warning_count += 1
-                if b"START" in line:
-                    start_count += 1
-                line = memory_mapped.readline()
-            memory_mapped.close()
-        return self._generate_log_summary_text(
-            error_count, warning_count, start_count)
-
     def _generate_log_summary_text(
             self, error_count, warning_count, start_count):
         summary_text = "Log contains:\n" \
@@ -112,6 +170,13 @@ class TimedRotatingFileSMTPHandler(TimedRotatingFileHandler):
             + self._pluralize(start_count, "start")
         return summary_text
 
+    @staticmethod
+    def _generate_counts_text(title, counts):
+        if not counts:
+            return ""
+        return title + ":\n" + "".join(
+            "\t" + str(key) + ": " + str(count) + "\n" for key, count in counts.items())
+
     @staticmethod
     def _pluralize(count, singular):
         return singular + "\n" if count == 1 else singular + "s\n"
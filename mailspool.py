@@ -0,0 +1,265 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+def get_mail_spool(config, mail_sender, name):
+    """Wraps :mail_sender: in a :MailSpool: if a spool directory is set in the Email section
+    of :config:.
+
+    :param name: The name of the spool file in the spool directory without its extension
+    :return: The :MailSpool: or :mail_sender: if no spool directory is set
+    """
+    spool_dir = config.get("Email", "spool_dir", fallback=None)
+    if not spool_dir:
+        return mail_sender
+    return MailSpool(
+        mail_sender,
+        os.path.join(spool_dir, name + ".spool"),
+        max_bytes=config.getfloat("Email", "spool_max_size", fallback=10) * 2 ** 20,
+        max_age=config.getfloat("Email", "spool_max_age", fallback=168) * 3600)
+
+
+class SpooledMail:
+    __slots__ = ("mail_id", "created", "from_addr", "to_addrs", "msg", "size")
+
+    def __init__(self, mail_id, created, from_addr, to_addrs, msg, size):
+        self.mail_id = mail_id
+        self.created = created
+        self.from_addr = from_addr
+        self.to_addrs = to_addrs
+        self.msg = msg
+        self.size = size
+
+
+class MailSpool:
+    """Wraps a :MailSender: to deliver its mails via a spool file on disk,
+    so no mail is lost while the SMTP server cannot be reached or the host restarts.
+
+    :send_message: appends the mail to the spool file with a single write.
+    A background thread syncs the appended mails to disk, one fsync for all mails appended since
+    the last one, and delivers them in order. A failed delivery is retried after a delay
+    which doubles up to :max_backoff: seconds.
+    The id of the last delivered mail is stored next to the spool file.
+
+    The spool holds at most :max_bytes: bytes. Mails older than :max_age: seconds are dropped.
+    """
+
+    def __init__(self, mail_sender, path, max_bytes=10 * 2 ** 20, max_age=7 * 24 * 3600,
+                 min_backoff=10, max_backoff=900):
+        self.logger = logging.getLogger(__name__)
+        self.mail_sender = mail_sender
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.delivered_count = 0
+        self.dropped_count = 0
+
+        self._delivered_path = path + ".delivered"
+        self._condition = threading.Condition()
+        self._pending = collections.deque()
+        self._pending_bytes = 0
+        self._last_id = 0
+        self._is_sync_required = False
+        self._is_disconnect_requested = False
+        self._is_closed = False
+        self._file = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        if self._file is None:
+            self._file = open(self.path, "ab", buffering=0)
+        if self._pending:
+            self.logger.info(str(len(self._pending)) + " spooled mails to deliver")
+        self._thread = threading.Thread(target=self._deliver, name="mail-spool", daemon=True)
+        self._thread.start()
+
+    def send_message(self, from_addr, to_addrs, msg):
+        """
+        :return: True, as the mail is delivered later
+        """
+        with self._condition:
+            self._last_id += 1
+            mail = SpooledMail(self._last_id, time.time(), from_addr, to_addrs, str(msg), 0)
+            record = self._get_record(mail)
+            mail.size = len(record)
+            try:
+                self._file.write(record)
+                self._is_sync_required = True
+            except OSError as e:
+                self.logger.error("Failed to spool mail, keeping it in memory only: " + str(e))
+            self._pending.append(mail)
+            self._pending_bytes += mail.size
+            if self._pending_bytes > self.max_bytes:
+                self._drop_oldest()
+            self._condition.notify()
+        return True
+
+    def send_tar_gz_attachment(self, from_addr, to_addrs, subject, body, archive,
+                               mime_subtype="gzip"):
+        msg = self.mail_sender.get_tar_gz_attachment_message(
+            from_addr, to_addrs, subject, body, archive, mime_subtype)
+        return self.send_message(from_addr, to_addrs, msg)
+
+    def disconnect(self):
+        """Closes the connection to the SMTP server once the spooled mails are delivered.
+        Unlike :close:, the spool stays open and the next mail opens a new connection.
+        """
+        with self._condition:
+            self._is_disconnect_requested = True
+            self._condition.notify()
+
+    def close(self, timeout=10):
+        """Syncs the spool to disk and stops the delivery.
+        Undelivered mails are delivered after the next start.
+        """
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        with self._condition:
+            self._sync()
+            self._file.close()
+        self.mail_sender.close()
+
+    def _deliver(self):
+        failure_count = 0
+        while True:
+            with self._condition:
+                while not self._pending and not self._is_closed \
+                        and not self._is_disconnect_requested:
+                    self._condition.wait()
+                if self._is_closed:
+                    return
+                if not self._pending:
+                    self._is_disconnect_requested = False
+                    mail = None
+                else:
+                    self._sync()
+                    mail = self._pending[0]
+            if mail is None:
+                # the connection is only used by this thread
+                self.mail_sender.close()
+                continue
+            if time.time() - mail.created > self.max_age:
+                self.logger.warning("Dropped spooled mail " + str(mail.mail_id)
+                                    + " older than " + str(self.max_age) + " seconds")
+                self.dropped_count += 1
+                self._acknowledge(mail)
+                continue
+
+            try:
+                is_sent = self.mail_sender.send_message(mail.from_addr, mail.to_addrs, mail.msg)
+            except Exception:
+                self.logger.exception("Failed to send spooled mail " + str(mail.mail_id))
+                is_sent = False
+            if is_sent:
+                failure_count = 0
+                self.delivered_count += 1
+                self._acknowledge(mail)
+                continue
+
+            failure_count += 1
+            delay = min(self.min_backoff * 2 ** min(failure_count - 1, 16), self.max_backoff)
+            self.logger.warning("Retrying to send " + str(len(self._pending))
+                                + " spooled mails in " + str(delay) + " seconds")
+            with self._condition:
+                if not self._is_closed:
+                    self._condition.wait(delay)
+
+    def _acknowledge(self, mail):
+        """Removes the delivered or dropped :mail: from the spool."""
+        with self._condition:
+            if self._pending and self._pending[0] is mail:
+                self._pending.popleft()
+                self._pending_bytes -= mail.size
+            self._write_atomically(self._delivered_path, str(mail.mail_id).encode())
+            if not self._pending:
+                self._rewrite()
+
+    def _drop_oldest(self):
+        while self._pending_bytes > self.max_bytes and len(self._pending) > 1:
+            mail = self._pending.popleft()
+            self._pending_bytes -= mail.size
+            self.dropped_count += 1
+            self.logger.warning("The mail spool is full. Dropped mail " + str(mail.mail_id))
+        self._rewrite()
+
+    def _sync(self):
+        if not self._is_sync_required:
+            return
+        try:
+            os.fsync(self._file.fileno())
+            self._is_sync_required = False
+        except OSError as e:
+            self.logger.error("Failed to sync the mail spool: " + str(e))
+
+    def _rewrite(self):
+        """Replaces the spool file by one containing only the pending mails."""
+        records = b"".join(self._get_record(mail) for mail in self._pending)
+        try:
+            if self._file is not None:
+                self._file.close()
+            self._write_atomically(self.path, records)
+        finally:
+            self._file = open(self.path, "ab", buffering=0)
+            self._is_sync_required = False
+
+    @staticmethod
+    def _get_record(mail):
+        return json.dumps({
+            "id": mail.mail_id,
+            "created": mail.created,
+            "from_addr": mail.from_addr,
+            "to_addrs": mail.to_addrs,
+            "msg": mail.msg
+        }).encode() + b"\n"
+
+    def _write_atomically(self, path, data):
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "wb") as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.logger.error("Failed to write " + path + ": " + str(e))
+
+    def _load(self):
+        try:
+            with open(self._delivered_path) as delivered_file:
+                delivered_id = int(delivered_file.read())
+        except (OSError, ValueError):
+            delivered_id = 0
+        self._last_id = delivered_id
+        try:
+            with open(self.path, "rb") as spool_file:
+                lines = spool_file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last record may be incomplete after a crash
+                self.logger.warning("Skipped an incomplete record in the mail spool")
+                continue
+            self._last_id = max(self._last_id, record["id"])
+            if record["id"] <= delivered_id:
+                continue
+            self._pending.append(SpooledMail(record["id"], record["created"],
+                                             record["from_addr"], record["to_addrs"],
+                                             record["msg"], len(line)))
+            self._pending_bytes += len(line)
+        if self._pending_bytes > self.max_bytes:
+            self._drop_oldest()
+        else:
+            self._rewrite()
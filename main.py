@@ -1,23 +1,37 @@
+import atexit
 import configparser
 import logging
 import logging.config
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
-from alarmmonitor import AlarmMonitor
-from alarmmonitormailsender import AlarmMonitorMailSender
-from blaulichtsmscontroller import BlaulichtSmsController
-from chromiumbrowsercontroller import ChromiumBrowserController
-from hdmiceccontroller import (CecLogging, CecMode, LibCecController, PythonCecController)
+from alarmmonitor import AlarmMonitor, AsyncAlarmMonitor
+from alarmmonitormailsender import AlarmMonitorMailSender, MailOutbox, QueuedMailSender
+from logginghandlers.queuelogging import enable_queue_logging
+from pollingscheduler import PollingScheduler
+from startupphases import StartupPhases
+
+# the modules of the blaulichtSMS API, the HDMI CEC and the browser backends are imported when
+# the backend is set up, so only the chosen backends are loaded, in parallel with each other
 
 logger = None
 
 
-def set_up_logging(logging_config):
+def set_up_logging(logging_config, log_queue_size=0):
     """Configures the logging for the module according to the dict
     logging_config.
+
+    If :log_queue_size: is greater than 0, the records are written by a listener thread
+    and logging only enqueues them.
     """
     logging.config.dictConfig(logging_config)
+    if log_queue_size > 0:
+        listener = enable_queue_logging(logging.getLogger(), log_queue_size)
+        # registered after logging's own shutdown handler, so it runs before it
+        atexit.register(listener.stop)
 
     global logger
     logger = logging.getLogger(__name__)
@@ -30,13 +44,25 @@ def get_logging_config(logging_config_filepath):
     return logging_config
 
 
-def get_cec_controller(config, send_errors, mail_sender):
+def get_display_sections(config):
+    """Gets the config sections of the displays, which are named "Display <name>".
+    Each display has its own X display and HDMI CEC device.
+
+    :return: The names of the sections or ["Alarmmonitor"] if there is only a single display
+    """
+    sections = [section for section in config.sections() if section.startswith("Display ")]
+    return sections if sections else ["Alarmmonitor"]
+
+
+def get_cec_controller(config, send_errors, mail_sender, display_section="Alarmmonitor"):
+    from hdmiceccontroller import CecLogging, CecMode, LibCecController, PythonCecController
+
     cec_mode_index = None
     try:
         cec_mode_index = config.getint("Alarmmonitor", "cec_mode")
         cec_mode = CecMode(cec_mode_index)
     except ValueError:
-        logger.warning("Invalid CEC mode: " + cec_mode_index)
+        logger.warning("Invalid CEC mode: " + str(cec_mode_index))
         cec_mode = CecMode.LIB_CEC
     logger.info("Using CEC mode: " + cec_mode.name)
 
@@ -45,52 +71,242 @@ def get_cec_controller(config, send_errors, mail_sender):
         cec_logging_index = config.getint("Alarmmonitor",
                                           "cec_logging",
                                           fallback=CecLogging.CEC_LOG_ERROR.value)
-        cec_logging = CecMode(cec_logging_index)
+        cec_logging = CecLogging(cec_logging_index)
     except ValueError:
-        logger.warning("Invalid CEC logging level: " + cec_logging_index)
+        logger.warning("Invalid CEC logging level: " + str(cec_logging_index))
         cec_logging = CecLogging.CEC_LOG_ERROR
 
     try:
-        device_id = config.get("Alarmmonitor", "cec_device_id", fallback="1")
+        device_id = config.get(display_section, "cec_device_id",
+                               fallback=config.get("Alarmmonitor", "cec_device_id",
+                                                   fallback="1"))
     except ValueError:
         logger.warning("Invalid cec_device_id")
         device_id = "1"
 
+    state_max_age = config.getfloat("Alarmmonitor", "cec_state_max_age", fallback=60)
+
     if cec_mode == CecMode.PYTHON_CEC:
-        return PythonCecController(send_errors, mail_sender)
+        return PythonCecController(send_errors, mail_sender, state_max_age=state_max_age)
     else:
         return LibCecController(send_errors,
                                 mail_sender,
                                 debug_level=cec_logging,
-                                device_id=device_id)
+                                device_id=device_id,
+                                state_max_age=state_max_age,
+                                output_buffer_size=config.getint(
+                                    "Alarmmonitor", "cec_output_buffer_size", fallback=1000),
+                                adapter=config.get(display_section, "cec_adapter",
+                                                   fallback=None))
 
 
-def main():
-    logging_config = get_logging_config("logging_config.yaml")
-    set_up_logging(logging_config)
+def get_cec_controllers(config, send_errors, mail_sender, display_sections):
+    """Initializes the HDMI CEC controllers of all displays in parallel.
 
-    config = configparser.ConfigParser()
-    config.read("config.ini")
+    :return: The controller of the single display or a :CecControllerGroup:
+    """
+    if len(display_sections) == 1:
+        return get_cec_controller(config, send_errors, mail_sender, display_sections[0])
+    from hdmiceccontroller import CecControllerGroup, CecMode
 
-    alarm_duration = config.getint("Alarmmonitor", "hdmi_cec_device_on_time")
-    polling_interval = config.getint("Alarmmonitor", "polling_interval")
-    send_errors = config.getboolean("Alarmmonitor", "send_errors")
-    send_starts = config.getboolean("Alarmmonitor", "send_starts")
-    show_infos = config.getboolean("blaulichtSMS Einsatzmonitor", "show_infos")
+    if config.get("Alarmmonitor", "cec_mode", fallback="") == str(CecMode.PYTHON_CEC.value):
+        raise ValueError("Several displays require libCEC (cec_mode = "
+                         + str(CecMode.LIB_CEC.value) + "). python-cec can only open a single"
+                         + " CEC adapter, so all displays would control the same device.")
+
+    with ThreadPoolExecutor(max_workers=len(display_sections)) as executor:
+        cec_controllers = list(executor.map(
+            lambda display_section: get_cec_controller(config, send_errors, mail_sender,
+                                                       display_section),
+            display_sections))
+    return CecControllerGroup(cec_controllers)
+
+
+def get_browser_controller(config, session_id, display_section="Alarmmonitor", display_index=0):
+    """Creates the browser controller of a display.
+    The browsers of each display use their own remote debugging ports and user data directories.
+    """
+    from browserhealthprobe import BrowserHealthProbe
+    from chromiumbrowsercontroller import (CONFIG_DIR, ChromiumBrowserController,
+                                           HotSpareBrowserController)
+    from processtreemonitor import ProcessTreeMonitor
+
+    def create_health_probe(devtools_client):
+        return BrowserHealthProbe(
+            devtools_client,
+            response_timeout=config.getfloat("Alarmmonitor", "browser_response_timeout",
+                                             fallback=5),
+            max_load_time=config.getfloat("Alarmmonitor", "browser_max_load_time",
+                                          fallback=30),
+            dashboard_selector=config.get("Alarmmonitor", "browser_dashboard_selector",
+                                          fallback=None),
+            failure_threshold=config.getint("Alarmmonitor", "browser_failure_threshold",
+                                            fallback=2))
+
+    health_probe_factory = create_health_probe \
+        if config.getboolean("Alarmmonitor", "browser_health_probe", fallback=False) else None
+
+    resource_limits = {
+        name: config.getfloat("Alarmmonitor", "browser_max_" + name, fallback=None)
+        for name in ("rss", "swap", "cpu")
+    }
+
+    def create_resource_monitor():
+        return ProcessTreeMonitor(**{"max_" + name: limit
+                                     for name, limit in resource_limits.items()})
+
+    resource_monitor_factory = create_resource_monitor \
+        if any(limit is not None for limit in resource_limits.values()) else None
+
+    profile_snapshot_dir = config.get("Alarmmonitor", "browser_profile_snapshot", fallback=None)
+    ephemeral_profile_root = config.get("Alarmmonitor", "browser_ephemeral_profile_root",
+                                        fallback="/dev/shm")
+    x_display = config.get(display_section, "x_display", fallback=":0")
+    remote_debugging_port = 9222 + 2 * display_index
+    # the first display keeps the directories used before there were several displays
+    user_data_dir_suffix = "-display-" + str(display_index + 1) if display_index else ""
 
+    if config.getboolean("Alarmmonitor", "browser_hot_spare", fallback=False):
+        return HotSpareBrowserController(
+            session_id, remote_debugging_ports=(remote_debugging_port, remote_debugging_port + 1),
+            user_data_dirs=tuple(
+                os.path.join(CONFIG_DIR, "chromium-dashboard" + user_data_dir_suffix + "-" + slot)
+                for slot in ("1", "2")),
+            health_probe_factory=health_probe_factory, profile_snapshot_dir=profile_snapshot_dir,
+            ephemeral_profile_root=ephemeral_profile_root,
+            resource_monitor_factory=resource_monitor_factory, x_display=x_display)
+    browser_controller = ChromiumBrowserController(
+        session_id, remote_debugging_port=remote_debugging_port if health_probe_factory else None,
+        user_data_dir=os.path.join(CONFIG_DIR, "chromium" + user_data_dir_suffix)
+        if display_index else None,
+        profile_snapshot_dir=profile_snapshot_dir, ephemeral_profile_root=ephemeral_profile_root,
+        resource_monitor=resource_monitor_factory() if resource_monitor_factory else None,
+        x_display=x_display)
+    if health_probe_factory:
+        browser_controller.health_probe = health_probe_factory(browser_controller.devtools)
+    return browser_controller
+
+
+def get_blaulichtsms_controller(config, alarm_duration, alarm_history):
+    """Sets up the blaulichtSMS Dashboard API and logs in.
+
+    :return: The :BlaulichtSmsController:
+    :raises BlaulichtSmsSessionInitException: If the login failed
+    """
+    from blaulichtsmscontroller import BlaulichtSmsController, BlaulichtSmsSessionInitException
+    from pooledhttpclient import PooledHttpClient
+
+    http_client = PooledHttpClient(
+        connect_timeout=config.getfloat("blaulichtSMS Einsatzmonitor", "connect_timeout",
+                                        fallback=5),
+        read_timeout=config.getfloat("blaulichtSMS Einsatzmonitor", "read_timeout", fallback=10))
     blaulichtsms_controller = BlaulichtSmsController(
         config["blaulichtSMS Einsatzmonitor"]["customer_id"],
         config["blaulichtSMS Einsatzmonitor"]["username"],
         config["blaulichtSMS Einsatzmonitor"]["password"],
         alarm_duration=alarm_duration,
-        show_infos=show_infos)
-    mail_sender = AlarmMonitorMailSender()
-    hdmi_cec_controller = get_cec_controller(config, send_errors, mail_sender)
-    browser_controller = ChromiumBrowserController(blaulichtsms_controller.get_session())
-    alarm_monitor = AlarmMonitor(polling_interval, send_errors, send_starts,
-                                 blaulichtsms_controller, hdmi_cec_controller, browser_controller,
-                                 mail_sender)
-    alarm_monitor.run()
+        show_infos=config.getboolean("blaulichtSMS Einsatzmonitor", "show_infos"),
+        http_client=http_client,
+        session_ttl=config.getint("blaulichtSMS Einsatzmonitor", "session_ttl", fallback=43200),
+        alarm_history=alarm_history)
+    # the browsers show the dashboard with the session token, so there is nothing to start without
+    if not blaulichtsms_controller.session_token_manager.get_token():
+        raise BlaulichtSmsSessionInitException("Failed to initialize blaulichtSMS session")
+    return blaulichtsms_controller
+
+
+def start_browsers(config, blaulichtsms_controller, display_sections):
+    """Starts the browsers of all displays.
+
+    :return: The browser controller of the single display or a :MultiDisplayBrowserController:
+    """
+    session_id = blaulichtsms_controller.session_token_manager.get_token()
+    browser_controllers = [get_browser_controller(config, session_id, display_section, index)
+                           for index, display_section in enumerate(display_sections)]
+    if len(browser_controllers) == 1:
+        browser_controller = browser_controllers[0]
+    else:
+        from chromiumbrowsercontroller import MultiDisplayBrowserController
+        browser_controller = MultiDisplayBrowserController(browser_controllers)
+    browser_controller.start()
+    return browser_controller
+
+
+def main():
+    started_at = time.monotonic()
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+
+    logging_config = get_logging_config("logging_config.yaml")
+    set_up_logging(logging_config,
+                   config.getint("Alarmmonitor", "log_queue_size", fallback=0))
+
+    alarm_duration = config.getint("Alarmmonitor", "hdmi_cec_device_on_time")
+    polling_interval = config.getfloat("Alarmmonitor", "polling_interval")
+    send_errors = config.getboolean("Alarmmonitor", "send_errors")
+    send_starts = config.getboolean("Alarmmonitor", "send_starts")
+    is_async_runtime = config.get("Alarmmonitor", "runtime", fallback="sched") == "asyncio"
+    display_sections = get_display_sections(config)
+    # the login, the HDMI CEC initialization and the browser start overlap,
+    # and the alarms are requested as soon as the login succeeded
+    startup = StartupPhases(config.getboolean("Alarmmonitor", "parallel_startup",
+                                              fallback=False), started_at)
+
+    alarm_history_path = config.get("Alarmmonitor", "alarm_history", fallback=None)
+    alarm_history = None
+    if alarm_history_path:
+        from alarmhistory import AlarmHistory
+        alarm_history = AlarmHistory(
+            alarm_history_path,
+            max_age=config.getfloat("Alarmmonitor", "alarm_history_max_age", fallback=365))
+    polling_scheduler = PollingScheduler(
+        polling_interval,
+        hot_interval=config.getfloat("Alarmmonitor", "hot_polling_interval",
+                                     fallback=polling_interval),
+        hot_window=config.getfloat("Alarmmonitor", "hot_polling_window", fallback=0),
+        max_backoff=config.getfloat("Alarmmonitor", "max_polling_backoff", fallback=300))
+    mail_outbox = MailOutbox(AlarmMonitorMailSender(),
+                             max_size=config.getint("Email", "outbox_size", fallback=100),
+                             digest_delay=config.getfloat("Email", "digest_delay", fallback=10))
+    mail_sender = QueuedMailSender(mail_outbox) if is_async_runtime else mail_outbox
+
+    # sequentially the HDMI CEC initialization runs before the login, as it did before
+    cec_init = startup.start("HDMI CEC", get_cec_controllers, config, send_errors, mail_sender,
+                             display_sections)
+    login = startup.start("login", get_blaulichtsms_controller, config, alarm_duration,
+                          alarm_history)
+    blaulichtsms_controller = login.result()
+    first_poll = startup.start("alarm request", blaulichtsms_controller.is_alarm) \
+        if startup.is_parallel else None
+    browser_controller = startup.run("browser", start_browsers, config, blaulichtsms_controller,
+                                     display_sections)
+    try:
+        hdmi_cec_controller = cec_init.result()
+    except BaseException:
+        # in parallel the browsers were started while the HDMI CEC initialization failed
+        browser_controller.terminate()
+        raise
+    if first_poll is not None:
+        first_poll.result()
+    startup.finish()
+
+    alarm_monitor_class = AsyncAlarmMonitor if is_async_runtime else AlarmMonitor
+    alarm_monitor = alarm_monitor_class(polling_interval, send_errors, send_starts,
+                                        blaulichtsms_controller, hdmi_cec_controller,
+                                        browser_controller, mail_sender, polling_scheduler,
+                                        cec_verify_interval=config.getfloat(
+                                            "Alarmmonitor", "cec_verify_interval",
+                                            fallback=300),
+                                        browser_check_interval=config.getfloat(
+                                            "Alarmmonitor", "browser_check_interval",
+                                            fallback=polling_interval),
+                                        is_browser_started=True)
+    try:
+        alarm_monitor.run()
+    finally:
+        mail_outbox.close()
+        if alarm_history is not None:
+            alarm_history.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,65 @@
+import logging
+import random
+
+
+class PollingScheduler:
+    """Computes the times of the blaulichtSMS Dashboard API polls.
+
+    Polls run at a fixed rate of :interval: seconds. The time a poll takes does not delay
+    the following polls, unless a poll takes longer than the interval.
+    For :hot_window: seconds after a new alarm or info arrived, polls run every :hot_interval:
+    seconds instead.
+    While the polls fail, the interval grows exponentially up to :max_backoff: seconds.
+    Backoff intervals vary randomly by :jitter: to spread the load on the API.
+
+    All times are in seconds of a monotonic clock. Intervals may be fractions of a second.
+    """
+
+    def __init__(self, interval, hot_interval=None, hot_window=0, max_backoff=300, jitter=0.2):
+        self.logger = logging.getLogger(__name__)
+        self.interval = interval
+        self.hot_interval = hot_interval if hot_interval else interval
+        self.hot_window = hot_window
+        self.max_backoff = max(max_backoff, interval)
+        self.jitter = jitter
+
+        self._next_poll = None
+        self._hot_until = 0
+        self._failure_count = 0
+
+    def schedule(self, now, is_failed=False, has_news=False):
+        """Computes the time of the next poll after a poll finished at :now:.
+
+        :param is_failed: True if the finished poll failed
+        :param has_news: True if the finished poll received a new alarm or info
+        :return: The time of the next poll
+        """
+        if has_news and self.hot_window > 0:
+            if now >= self._hot_until:
+                self.logger.info("Polling every " + str(self.hot_interval)
+                                 + " seconds after a new alarm")
+            self._hot_until = now + self.hot_window
+
+        if is_failed:
+            self._failure_count += 1
+        elif self._failure_count:
+            self.logger.info("Polling succeeded again after "
+                             + str(self._failure_count) + " failures")
+            self._failure_count = 0
+
+        base = self._next_poll if self._next_poll is not None else now
+        next_poll = base + self.current_interval(now)
+        if next_poll < now:
+            self.logger.debug("Poll overran its interval. Polling immediately.")
+            next_poll = now
+        self._next_poll = next_poll
+        return next_poll
+
+    def current_interval(self, now):
+        if self._failure_count:
+            exponent = min(self._failure_count - 1, 16)
+            backoff = min(self.interval * 2 ** exponent, self.max_backoff)
+            return backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if now < self._hot_until:
+            return self.hot_interval
+        return self.interval
@@ -0,0 +1,256 @@
+import logging
+import socket
+import ssl
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+
+class RequestTimings:
+    """The timings of a single request in seconds.
+
+    :dns:, :connect: and :tls: are 0 if the request reused a pooled keep-alive connection.
+    """
+
+    def __init__(self):
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.ttfb = 0.0
+        self.total = 0.0
+        self.reused_connection = True
+        self.resumed_tls_session = False
+
+    def __str__(self):
+        return "dns={:.1f}ms connect={:.1f}ms tls={:.1f}ms ttfb={:.1f}ms total={:.1f}ms " \
+               "reused_connection={} resumed_tls_session={}".format(
+                   self.dns * 1000, self.connect * 1000, self.tls * 1000, self.ttfb * 1000,
+                   self.total * 1000, self.reused_connection, self.resumed_tls_session)
+
+
+class DnsCache:
+    """Caches the results of name resolutions for :ttl: seconds.
+
+    All resolved addresses are kept, filtered by the address families urllib3 would use,
+    so a connection can fall back to the next address, e.g. from a broken IPv6 route to IPv4.
+    If a resolution fails, a stale cached result is used instead,
+    as a flaky resolver should not stop the polling.
+    """
+
+    def __init__(self, ttl=300):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """Resolves :host: and :port: to IP addresses.
+
+        :return: A tuple of the list of the resolved IP addresses in the order to try them
+            and a flag if the result came from the cache
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((host, port))
+        if entry and entry[1] > now:
+            return list(entry[0]), True
+        try:
+            addresses = []
+            for _, _, _, _, socket_address in socket.getaddrinfo(
+                    host, port, allowed_gai_family(), socket.SOCK_STREAM):
+                if socket_address[0] not in addresses:
+                    addresses.append(socket_address[0])
+        except socket.gaierror:
+            if entry:
+                self.logger.warning("Failed to resolve " + host + ". Using cached addresses.")
+                return list(entry[0]), True
+            raise
+        with self._lock:
+            self._entries[(host, port)] = (addresses, now + self.ttl)
+        return list(addresses), False
+
+    def prefer(self, host, port, address):
+        """Moves :address: to the front of the cached addresses of :host: and :port:,
+        so the following connections try an address which worked first.
+        """
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry and address in entry[0] and entry[0][0] != address:
+                addresses = [address] + [other for other in entry[0] if other != address]
+                self._entries[(host, port)] = (addresses, entry[1])
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """An SSL context which resumes the last TLS session of a host
+    when a new connection to this host is established.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # ssl.SSLContext is set up in __new__
+        super().__init__()
+        self._sessions = {}
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None and server_hostname:
+            session = self._sessions.get(server_hostname)
+        return super().wrap_socket(sock, *args, server_hostname=server_hostname,
+                                   session=session, **kwargs)
+
+    def remember_session(self, server_hostname, ssl_socket):
+        session = getattr(ssl_socket, "session", None)
+        if server_hostname and session is not None:
+            self._sessions[server_hostname] = session
+
+
+class _ConnectionTimingsRecorder(threading.local):
+    """Collects the connection setup timings of the request running in the current thread."""
+
+    def __init__(self):
+        self.timings = RequestTimings()
+
+    def reset(self):
+        self.timings = RequestTimings()
+
+
+class _TimedConnectionMixin:
+    """Resolves hosts through a :DnsCache: and records the connection setup timings.
+
+    The resolved addresses are tried in order until a connection is established.
+    """
+
+    dns_cache = None
+    recorder = None
+
+    def _new_conn(self):
+        timings = self.recorder.timings
+        timings.reused_connection = False
+        start = time.monotonic()
+        host = self._dns_host
+        addresses, _ = self.dns_cache.resolve(host, self.port)
+        resolved = time.monotonic()
+        timings.dns = resolved - start
+        for index, address in enumerate(addresses):
+            # urllib3 only uses _dns_host to open the socket,
+            # the TLS server name is taken from host
+            self._dns_host = address
+            try:
+                sock = super()._new_conn()
+                break
+            except (ConnectTimeoutError, NewConnectionError) as e:
+                if index == len(addresses) - 1:
+                    raise
+                logging.getLogger(__name__).warning(
+                    "Failed to connect to " + address + " of " + host + ": " + str(e)
+                    + ". Trying the next address.")
+            finally:
+                self._dns_host = host
+        if index > 0:
+            self.dns_cache.prefer(host, self.port, address)
+        timings.connect = time.monotonic() - resolved
+        return sock
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self):
+        start = time.monotonic()
+        super().connect()
+        timings = self.recorder.timings
+        timings.tls = time.monotonic() - start - timings.dns - timings.connect
+        timings.resumed_tls_session = bool(getattr(self.sock, "session_reused", False))
+        self._remember_tls_session()
+
+    def close(self):
+        # TLS 1.3 session tickets arrive after the handshake, so the session is stored again
+        self._remember_tls_session()
+        super().close()
+
+    def _remember_tls_session(self):
+        if isinstance(self.ssl_context, ResumingSSLContext) and self.sock is not None:
+            self.ssl_context.remember_session(self.host, self.sock)
+
+
+class _PooledHttpAdapter(HTTPAdapter):
+    """A transport adapter whose connection pools use the timed connections
+    of a :PooledHttpClient:.
+    """
+
+    def __init__(self, dns_cache, recorder, ssl_context, **kwargs):
+        self._dns_cache = dns_cache
+        self._recorder = recorder
+        self._ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+        attributes = {"dns_cache": self._dns_cache, "recorder": self._recorder}
+        http_pool = type("TimedHTTPConnectionPool", (HTTPConnectionPool,), {
+            "ConnectionCls": type("TimedHTTPConnection", (_TimedHTTPConnection,), attributes)
+        })
+        https_pool = type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,), {
+            "ConnectionCls": type("TimedHTTPSConnection", (_TimedHTTPSConnection,), attributes)
+        })
+        self.poolmanager.pool_classes_by_scheme = {"http": http_pool, "https": https_pool}
+
+
+class PooledHttpClient:
+    """An HTTP client which keeps its connections alive between requests.
+
+    New connections resolve their host through a DNS cache and resume the last TLS session.
+    Every request has a connect and a read deadline.
+    The timings of the last request are available as :last_timings:.
+    """
+
+    def __init__(self, connect_timeout=5, read_timeout=10, dns_ttl=300, pool_maxsize=2):
+        self.logger = logging.getLogger(__name__)
+        self.timeout = (connect_timeout, read_timeout)
+        self.last_timings = None
+
+        self._recorder = _ConnectionTimingsRecorder()
+        ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context.load_default_certs()
+        ssl_context.load_verify_locations(requests.certs.where())
+        adapter = _PooledHttpAdapter(DnsCache(dns_ttl), self._recorder, ssl_context,
+                                     pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Sends a request over a pooled connection.
+
+        Raises the exceptions of :requests: on connection errors and exceeded deadlines.
+
+        :return: The :requests.Response:
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self._recorder.reset()
+        start = time.monotonic()
+        response = self.session.request(method, url, **kwargs)
+        timings = self._recorder.timings
+        timings.total = time.monotonic() - start
+        timings.ttfb = max(response.elapsed.total_seconds()
+                           - timings.dns - timings.connect - timings.tls, 0.0)
+        self.last_timings = timings
+        self.logger.debug("Request timings: " + str(timings))
+        return response
+
+    def close(self):
+        self.session.close()
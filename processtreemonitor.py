@@ -0,0 +1,162 @@
+import logging
+import os
+import time
+
+
+class ProcessTreeResources:
+    """The resources used by a process and all of its descendants.
+
+    The memory is in bytes, the CPU usage in percent of one core since the previous sample.
+    """
+
+    __slots__ = ("process_count", "rss", "swap", "cpu_percent")
+
+    def __init__(self, process_count, rss, swap, cpu_percent):
+        self.process_count = process_count
+        self.rss = rss
+        self.swap = swap
+        self.cpu_percent = cpu_percent
+
+    def __str__(self):
+        return str(self.process_count) + " processes, RSS " + str(self.rss // 2 ** 20) \
+            + " MiB, swap " + str(self.swap // 2 ** 20) + " MiB, CPU " \
+            + (str(round(self.cpu_percent, 1)) + " %" if self.cpu_percent is not None else "-")
+
+
+class ProcessTreeMonitor:
+    """Samples the resources of a process tree from /proc and checks them against limits.
+
+    The limits are optional. :max_rss: and :max_swap: are in MiB and exceeded by a single sample.
+    :max_cpu: is in percent of one core and has to be exceeded by
+    :cpu_samples: consecutive samples, so short load peaks are tolerated.
+    """
+
+    def __init__(self, max_rss=None, max_swap=None, max_cpu=None, cpu_samples=3,
+                 proc_dir="/proc"):
+        self.logger = logging.getLogger(__name__)
+        self.max_rss = max_rss
+        self.max_swap = max_swap
+        self.max_cpu = max_cpu
+        self.cpu_samples = cpu_samples
+        self.proc_dir = proc_dir
+
+        self.pid = None
+        self.last_resources = None
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._last_cpu_time = None
+        self._last_sample_time = None
+        self._cpu_exceeded_count = 0
+
+    def attach(self, pid):
+        """Monitors the process tree of :pid: from now on."""
+        self.pid = pid
+        self.last_resources = None
+        self._last_cpu_time = None
+        self._last_sample_time = None
+        self._cpu_exceeded_count = 0
+
+    def sample(self):
+        """
+        :return: The current :ProcessTreeResources: of the monitored process tree
+        """
+        pids = self._get_tree_pids()
+        rss = 0
+        swap = 0
+        cpu_ticks = 0
+        for pid in pids:
+            try:
+                rss_pages, swap_kib = self._read_memory(pid)
+                cpu_ticks += self._read_cpu_ticks(pid)
+            except (OSError, ValueError, IndexError):
+                # the process exited in the meantime
+                continue
+            rss += rss_pages * self._page_size
+            swap += swap_kib * 1024
+
+        now = time.monotonic()
+        cpu_time = cpu_ticks / self._clock_ticks
+        cpu_percent = None
+        if self._last_sample_time is not None and now > self._last_sample_time:
+            # exited processes reduce the sum, so the difference is limited to 0
+            cpu_percent = max(cpu_time - self._last_cpu_time, 0) \
+                / (now - self._last_sample_time) * 100
+        self._last_cpu_time = cpu_time
+        self._last_sample_time = now
+        self.last_resources = ProcessTreeResources(len(pids), rss, swap, cpu_percent)
+        return self.last_resources
+
+    def get_exceeded_limit(self):
+        """Samples the process tree and checks the limits.
+
+        :return: A description of the exceeded limit or None
+        """
+        if self.pid is None:
+            return None
+        resources = self.sample()
+        self.logger.debug("Browser resources: " + str(resources))
+        if self.max_rss is not None and resources.rss > self.max_rss * 2 ** 20:
+            return "RSS of " + str(resources.rss // 2 ** 20) + " MiB exceeds " \
+                + str(self.max_rss) + " MiB"
+        if self.max_swap is not None and resources.swap > self.max_swap * 2 ** 20:
+            return "swap of " + str(resources.swap // 2 ** 20) + " MiB exceeds " \
+                + str(self.max_swap) + " MiB"
+        if self.max_cpu is not None and resources.cpu_percent is not None:
+            if resources.cpu_percent > self.max_cpu:
+                self._cpu_exceeded_count += 1
+            else:
+                self._cpu_exceeded_count = 0
+            if self._cpu_exceeded_count >= self.cpu_samples:
+                return "CPU usage exceeds " + str(self.max_cpu) + " % for " \
+                    + str(self._cpu_exceeded_count) + " samples"
+        return None
+
+    def _get_tree_pids(self):
+        """
+        :return: The PID of the monitored process and the PIDs of all of its descendants
+        """
+        children = {}
+        for entry in os.listdir(self.proc_dir):
+            if not entry.isdigit():
+                continue
+            try:
+                ppid = int(self._read_stat(entry)[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        pids = []
+        pending = [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, ()))
+        return pids
+
+    def _read_stat(self, pid):
+        """
+        :return: The fields of /proc/<pid>/stat after the command, starting with the state
+        """
+        with open(os.path.join(self.proc_dir, str(pid), "stat")) as stat_file:
+            stat = stat_file.read()
+        # the command is in parentheses and may contain spaces
+        return stat[stat.rindex(")") + 2:].split()
+
+    def _read_cpu_ticks(self, pid):
+        fields = self._read_stat(pid)
+        # utime and stime
+        return int(fields[11]) + int(fields[12])
+
+    def _read_memory(self, pid):
+        """
+        :return: The resident pages from /proc/<pid>/statm and the swapped KiB from status
+        """
+        with open(os.path.join(self.proc_dir, str(pid), "statm")) as statm_file:
+            rss_pages = int(statm_file.read().split()[1])
+        swap_kib = 0
+        with open(os.path.join(self.proc_dir, str(pid), "status")) as status_file:
+            for line in status_file:
+                if line.startswith("VmSwap:"):
+                    swap_kib = int(line.split()[1])
+                    break
+        return rss_pages, swap_kib
@@ -1,61 +1,135 @@
+import base64
 import smtplib
 import logging
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.encoders import encode_base64
 import os
 
 
 class MailSender:
-    """A utility class for sending emails."""
+    """A utility class for sending emails.
 
-    def __init__(self, smtp_server, smtp_port, user, password):
+    If :reuse_connection: is set, the authenticated connection to the SMTP server is kept open
+    for the following mails until :close: is called.
+    A connection closed by the server in the meantime is opened again.
+    Archives larger than :max_attachment_size: bytes are not attached to the mails.
+    """
+
+    def __init__(self, smtp_server, smtp_port, user, password, reuse_connection=False, timeout=30,
+                 max_attachment_size=None):
         self.logger = logging.getLogger(__name__)
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.user = user
         self.password = password
+        self.reuse_connection = reuse_connection
+        self.timeout = timeout
+        self.max_attachment_size = max_attachment_size
+        self._connection = None
 
     def send_tar_gz_attachment(
-            self, from_addr, to_addrs, subject, body, archive):
+            self, from_addr, to_addrs, subject, body, archive, mime_subtype="gzip"):
+        msg = self.get_tar_gz_attachment_message(
+            from_addr, to_addrs, subject, body, archive, mime_subtype)
+        return self.send_message(from_addr, to_addrs, msg)
+
+    def get_tar_gz_attachment_message(
+            self, from_addr, to_addrs, subject, body, archive, mime_subtype="gzip"):
+        """Creates a mail with the compressed :archive: attached.
+        The encoded archive is kept in memory as a whole and copied when the mail is sent,
+        which needs about 3 times the size of the archive. An archive larger than
+        :max_attachment_size: is therefore not attached but only mentioned in the body.
+        """
         msg = MIMEMultipart()
         msg["Subject"] = subject
         msg["From"] = from_addr
         msg["To"] = ", ".join(to_addrs)
 
+        archive_size = os.path.getsize(archive)
+        if self.max_attachment_size is not None and archive_size > self.max_attachment_size:
+            self.logger.warning("The archive " + archive + " exceeds the maximum attachment size."
+                                " Sending the mail without it.")
+            msg.attach(MIMEText(body + "\n" + os.path.basename(archive) + " (" + str(archive_size)
+                                + " bytes) exceeds the maximum attachment size of "
+                                + str(int(self.max_attachment_size))
+                                + " bytes and was not attached.\n"))
+            return msg
+
         msg_body = MIMEText(body)
         msg.attach(msg_body)
 
+        encoded_chunks = []
         with open(archive, "rb") as fp:
-            archive_data = fp.read()
-        attachment = MIMEBase("application", "gzip")
-        attachment.set_payload(archive_data)
-        encode_base64(attachment)
+            # 57 bytes are encoded in a base64 line of 76 characters
+            chunk = fp.read(57 * 1024)
+            while chunk:
+                encoded_chunks.append(base64.encodebytes(chunk).decode("ascii"))
+                chunk = fp.read(57 * 1024)
+        attachment = MIMEBase("application", mime_subtype)
+        attachment.set_payload("".join(encoded_chunks))
+        attachment["Content-Transfer-Encoding"] = "base64"
         attachment.add_header(
             "Content-Disposition",
             "attachment",
             filename=os.path.basename(archive)
         )
         msg.attach(attachment)
-
-        self.send_message(from_addr, to_addrs, msg)
+        return msg
 
     def send_message(self, from_addr, to_addrs, msg):
+        """
+        :return: True if the mail was sent
+        """
         self.logger.info("Sending mail...")
         self.logger.debug("Mail: \n" + str(msg))
-        connection = self.get_connection()
-        if connection:
+        if not self.reuse_connection:
+            connection = self.get_connection()
+            if not connection:
+                return False
             connection.sendmail(from_addr, to_addrs, str(msg))
             connection.quit()
             self.logger.info("Sent mail successfully")
+            return True
+
+        while True:
+            is_reused = self._connection is not None
+            if not is_reused:
+                self._connection = self.get_connection()
+                if not self._connection:
+                    return False
+            try:
+                self._connection.sendmail(from_addr, to_addrs, str(msg))
+                self.logger.info("Sent mail successfully")
+                return True
+            except smtplib.SMTPServerDisconnected:
+                self._connection = None
+                if not is_reused:
+                    raise
+                self.logger.debug("The server closed the connection. Reconnecting.")
+            except OSError:
+                self.close()
+                raise
+
+    def close(self):
+        """Closes a reused connection."""
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._connection = None
 
     def get_connection(self):
         try:
-            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
             server.login(self.user, self.password)
             self.logger.debug('Logged in to server')
             return server
         except smtplib.SMTPException:
             self.logger.error('Unable to login to server')
             return None
+        except OSError as e:
+            self.logger.error('Unable to connect to server: ' + str(e))
+            return None
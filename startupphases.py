@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class StartupPhases:
+    """Runs the phases of the application's startup and measures their durations.
+
+    If :is_parallel: is True, the phases started with :start: run concurrently, each in its own
+    thread. Otherwise each phase runs in the calling thread as soon as it is started,
+    so the phases run in the order they are started.
+    The times are reported relative to :started_at:, a time of :time.monotonic:.
+    """
+
+    def __init__(self, is_parallel=False, started_at=None):
+        self.logger = logging.getLogger(__name__)
+        self.is_parallel = is_parallel
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self._timings = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix="startup") if is_parallel \
+            else None
+
+    def start(self, name, func, *args):
+        """Starts the phase :name: which calls :func: with :args:.
+        In the sequential mode the phase has finished when this returns
+        and an exception of :func: is raised immediately.
+
+        :return: A :Future: of the result of :func:
+        """
+        if self._executor:
+            return self._executor.submit(self.run, name, func, *args)
+        future = Future()
+        future.set_result(self.run(name, func, *args))
+        return future
+
+    def run(self, name, func, *args):
+        """Runs the phase :name: in the calling thread.
+
+        :return: The result of :func:
+        """
+        start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._timings.append((name, start - self.started_at, time.monotonic() - start))
+
+    def finish(self):
+        """Logs the timings of all phases. Phases which are still running are not waited for."""
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        with self._lock:
+            timings = sorted(self._timings, key=lambda timing: timing[1])
+        self.logger.info(
+            "Started " + ("in parallel" if self.is_parallel else "sequentially") + " in "
+            + str(round(time.monotonic() - self.started_at, 3)) + " seconds: "
+            + ", ".join(name + " " + str(round(offset, 3)) + " s + " + str(round(duration, 3))
+                        + " s" for name, offset, duration in timings))
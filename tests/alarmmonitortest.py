@@ -26,3 +26,7 @@ class AlarmMonitorTest(AlarmMonitor):
             self.hdmi_cec_controller.power_on()
         else:
             self.hdmi_cec_controller.standby()
+
+    def _supervise_browser(self):
+        # the browser is checked by _run_helper, so the scheduler runs out after the last request
+        pass
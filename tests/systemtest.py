@@ -80,7 +80,8 @@ def main():
         base_url="http://localhost:5000/"
     )
     hdmi_cec_controller = get_cec_controller(config, False, None)
-    browser_controller = ChromiumBrowserController(mock_blaulichtsms_controller.get_session())
+    browser_controller = ChromiumBrowserController(
+        mock_blaulichtsms_controller.session_token_manager.get_token())
 
     alarm_monitor_test = AlarmMonitorTest(polling_interval, mock_blaulichtsms_controller, hdmi_cec_controller,
                                           browser_controller, api_requests_count)
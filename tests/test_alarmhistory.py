@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+
+from alarmhistory import AlarmHistory
+
+
+def alarm(alarm_id, alarm_date, text="Brand"):
+    return {"alarmId": alarm_id, "alarmDate": alarm_date, "alarmText": text}
+
+
+def alarm_date(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def alarm_time(alarm_date):
+    return datetime.strptime(alarm_date, "%Y-%m-%dT%H:%M:%S.%fZ") \
+        .replace(tzinfo=timezone.utc).timestamp()
+
+
+class AlarmHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "alarmhistory.db")
+        self.history = self.open()
+
+    def open(self, max_age=365):
+        history = AlarmHistory(self.path, max_age=max_age)
+        self.addCleanup(history.close)
+        return history
+
+    def test_added_alarm_is_returned_with_receive_time(self):
+        self.history.add_alarms([alarm("1", "2024-01-01T10:00:00.000Z")], received_at=100)
+        self.assertEqual(dict(alarm("1", "2024-01-01T10:00:00.000Z"), receivedAt=100),
+                         self.history.get_alarm("1"))
+        self.assertIsNone(self.history.get_alarm("2"))
+
+    def test_changed_alarm_is_updated_and_keeps_receive_time(self):
+        self.history.add_alarms([alarm("1", "2024-01-01T10:00:00.000Z")], received_at=100)
+        self.history.add_alarms([alarm("1", "2024-01-01T10:30:00.000Z", "Unfall")],
+                                received_at=200)
+        self.assertEqual(dict(alarm("1", "2024-01-01T10:30:00.000Z", "Unfall"), receivedAt=100),
+                         self.history.get_alarm("1"))
+        self.assertEqual(1, self.history.count_alarms())
+
+    def test_alarms_are_queried_by_alarm_date_newest_first(self):
+        self.history.add_alarms([alarm("1", "2024-01-01T10:00:00.000Z"),
+                                 alarm("2", "2024-01-01T12:00:00.000Z"),
+                                 alarm("3", "2024-01-01T11:00:00.000Z")])
+        self.assertEqual(["2", "3", "1"],
+                         [alarm["alarmId"] for alarm in self.history.get_alarms()])
+        since = alarm_time("2024-01-01T11:00:00.000Z")
+        self.assertEqual(["2", "3"], [alarm["alarmId"]
+                                      for alarm in self.history.get_alarms(since=since)])
+        self.assertEqual(["3"], [alarm["alarmId"] for alarm in self.history.get_alarms(
+            since=since, until=alarm_time("2024-01-01T11:59:59.000Z"))])
+        self.assertEqual(["2"], [alarm["alarmId"]
+                                 for alarm in self.history.get_alarms(limit=1)])
+        self.assertEqual(2, self.history.count_alarms(since=since))
+
+    def test_transitions_are_queried_oldest_first(self):
+        self.history.add_transition(False, transition_time=300)
+        self.history.add_transition(True, "1", transition_time=100)
+        self.history.add_transition(False, transition_time=200)
+        self.assertEqual([(100, True, "1"), (200, False, None), (300, False, None)],
+                         self.history.get_transitions())
+        self.assertEqual([(200, False, None)],
+                         self.history.get_transitions(since=150, until=250))
+
+    def test_alarms_are_kept_after_reopening(self):
+        self.history.add_alarms([alarm("1", "2024-01-01T10:00:00.000Z")], received_at=100)
+        self.history.close()
+        history = self.open(max_age=100000)
+        self.assertEqual(100, history.get_alarm("1")["receivedAt"])
+
+    def test_old_entries_are_removed_on_opening(self):
+        now = time.time()
+        old_date = alarm_date(now - 3 * 86400)
+        recent_date = alarm_date(now - 3600)
+        self.history.add_alarms([alarm("1", old_date), alarm("2", recent_date)])
+        self.history.add_transition(True, "1", transition_time=now - 3 * 86400)
+        self.history.add_transition(False, transition_time=now - 3600)
+        self.history.close()
+
+        with self.assertLogs("alarmhistory", "INFO"):
+            history = self.open(max_age=2)
+        self.assertEqual(["2"], [alarm["alarmId"] for alarm in history.get_alarms()])
+        self.assertEqual([False], [is_on for _, is_on, _ in history.get_transitions()])
+
+    def test_failed_write_is_only_logged(self):
+        self.history.close()
+        with self.assertLogs("alarmhistory", "ERROR"):
+            self.history.add_transition(True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime, timedelta
+
+from alarmindex import AlarmIndex
+
+DURATION = timedelta(hours=1)
+
+
+def alarm(alarm_id, alarm_date):
+    return {"alarmId": alarm_id, "alarmDate": alarm_date}
+
+
+class AlarmIndexTest(unittest.TestCase):
+
+    def test_new_and_changed_alarms_are_returned(self):
+        index = AlarmIndex(DURATION)
+        new_records = index.update([alarm("1", "2024-01-01T10:00:00.000Z")])
+        self.assertEqual(["1"], [record.alarm_id for record in new_records])
+        self.assertEqual([], index.update([alarm("1", "2024-01-01T10:00:00.000Z")]))
+        changed_records = index.update([alarm("1", "2024-01-01T10:30:00.000Z")])
+        self.assertEqual(["1"], [record.alarm_id for record in changed_records])
+        self.assertEqual(3, index.update_count)
+
+    def test_alarm_expires_after_alarm_duration(self):
+        index = AlarmIndex(DURATION)
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z")])
+        self.assertTrue(index.is_active(datetime(2024, 1, 1, 11, 0)))
+        self.assertFalse(index.is_active(datetime(2024, 1, 1, 11, 0, 1)))
+
+    def test_latest_alarm_id_is_the_alarm_which_expires_last(self):
+        index = AlarmIndex(DURATION)
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z"),
+                      alarm("2", "2024-01-01T10:30:00.000Z"),
+                      alarm("3", "2024-01-01T09:00:00.000Z")])
+        self.assertEqual("2", index.latest_alarm_id)
+        self.assertEqual(datetime(2024, 1, 1, 11, 30), index.expires_at)
+
+    def test_removed_alarm_no_longer_determines_expiry(self):
+        index = AlarmIndex(DURATION)
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z"),
+                      alarm("2", "2024-01-01T10:30:00.000Z")])
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z")])
+        self.assertEqual(1, len(index))
+        self.assertIsNone(index.get("2"))
+        self.assertEqual("1", index.latest_alarm_id)
+        self.assertEqual(datetime(2024, 1, 1, 11, 0), index.expires_at)
+
+    def test_alarm_moved_back_recomputes_expiry(self):
+        index = AlarmIndex(DURATION)
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z"),
+                      alarm("2", "2024-01-01T10:30:00.000Z")])
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z"),
+                      alarm("2", "2024-01-01T09:00:00.000Z")])
+        self.assertEqual("1", index.latest_alarm_id)
+
+    def test_empty_response_clears_index(self):
+        index = AlarmIndex(DURATION)
+        index.update([alarm("1", "2024-01-01T10:00:00.000Z")])
+        index.update([])
+        self.assertEqual(0, len(index))
+        self.assertIsNone(index.latest_alarm_id)
+        self.assertFalse(index.is_active(datetime(2024, 1, 1, 10, 0)))
+
+    def test_restored_alarms_are_active_until_first_update(self):
+        index = AlarmIndex(DURATION)
+        index.restore([alarm("1", "2024-01-01T10:00:00.000Z")])
+        self.assertTrue(index.is_active(datetime(2024, 1, 1, 10, 30)))
+        self.assertEqual("1", index.latest_alarm_id)
+        self.assertEqual(0, index.update_count)
+
+        new_records = index.update([alarm("2", "2024-01-01T09:00:00.000Z")])
+        self.assertEqual(["2"], [record.alarm_id for record in new_records])
+        self.assertIsNone(index.get("1"))
+        self.assertEqual("2", index.latest_alarm_id)
+
+    def test_restored_alarm_is_not_new_in_first_update(self):
+        index = AlarmIndex(DURATION)
+        index.restore([alarm("1", "2024-01-01T10:00:00.000Z")])
+        self.assertEqual([], index.update([alarm("1", "2024-01-01T10:00:00.000Z")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import unittest
+from contextlib import contextmanager
+
+from browserhealthprobe import BrowserHealthProbe
+
+LOGIN_URL = "https://dashboard.blaulichtsms.net/#/login?token=1234"
+DASHBOARD_URL = "https://dashboard.blaulichtsms.net/#/"
+
+
+class FakeDevToolsClient:
+    """Answers Runtime.evaluate with a fixed page state."""
+
+    def __init__(self, **state):
+        self.state = dict({
+            "url": DASHBOARD_URL,
+            "readyState": "complete",
+            "loadTime": 1200,
+            "pageAge": 5000,
+            "hasContent": True,
+            "hasLoginForm": False,
+            "hasDashboard": True
+        }, **state)
+
+    @contextmanager
+    def connect_page(self):
+        yield self
+
+    def send(self, method, params=None, timeout=None):
+        return {"result": {"value": json.dumps(self.state)}}
+
+
+class BrowserHealthProbeTest(unittest.TestCase):
+
+    def probe(self, dashboard_selector=None, **state):
+        return BrowserHealthProbe(FakeDevToolsClient(**state),
+                                  dashboard_selector=dashboard_selector).probe()
+
+    def test_dashboard_is_healthy_with_either_url(self):
+        for url in (LOGIN_URL, DASHBOARD_URL):
+            with self.subTest(url=url):
+                self.assertTrue(self.probe(url=url).is_healthy)
+
+    def test_login_form_is_unhealthy_with_either_url(self):
+        for url in (LOGIN_URL, DASHBOARD_URL):
+            with self.subTest(url=url):
+                health = self.probe(url=url, hasLoginForm=True)
+                self.assertFalse(health.is_healthy)
+                self.assertEqual("The login page is shown", health.reason)
+
+    def test_login_form_next_to_the_dashboard_is_healthy(self):
+        health = self.probe(dashboard_selector=".alarm", url=LOGIN_URL, hasLoginForm=True)
+        self.assertTrue(health.is_healthy)
+
+    def test_blank_page_is_unhealthy(self):
+        health = self.probe(hasContent=False)
+        self.assertFalse(health.is_healthy)
+        self.assertEqual("The page is blank", health.reason)
+
+    def test_missing_dashboard_is_unhealthy(self):
+        health = self.probe(dashboard_selector=".alarm", hasDashboard=False)
+        self.assertFalse(health.is_healthy)
+        self.assertEqual("The dashboard is not shown", health.reason)
+
+    def test_loading_page_is_healthy_until_max_load_time(self):
+        self.assertTrue(self.probe(loadTime=None, pageAge=5000).is_healthy)
+        self.assertFalse(self.probe(loadTime=None, pageAge=60000).is_healthy)
+
+    def test_unhealthy_after_failure_threshold(self):
+        probe = BrowserHealthProbe(FakeDevToolsClient(hasContent=False), failure_threshold=2)
+        self.assertTrue(probe.is_healthy())
+        self.assertFalse(probe.is_healthy())
+
+
+if __name__ == "__main__":
+    unittest.main()
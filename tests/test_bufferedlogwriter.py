@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from logginghandlers.bufferedlogwriter import BufferedLogWriter
+
+
+class BufferedLogWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, "alarmmonitor.log")
+
+    def writer(self, **kwargs):
+        writer = BufferedLogWriter(self.filename, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def read(self, filename=None):
+        with open(filename if filename else self.filename, "rb") as log_file:
+            return log_file.read()
+
+    def wait_for(self, predicate, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_lines_are_written_in_one_batch_on_close(self):
+        writer = self.writer()
+        writer.write("first\n")
+        writer.flush()
+        writer.write("second\n")
+        self.assertEqual(b"", self.read())
+        writer.close()
+        self.assertEqual(b"first\nsecond\n", self.read())
+        self.assertEqual(2, writer.statistics.record_count)
+        self.assertEqual(1, writer.statistics.flush_count)
+
+    def test_lines_are_written_beyond_max_buffer_size(self):
+        writer = self.writer(max_buffer_size=10)
+        writer.write("first\n")
+        self.assertEqual(b"", self.read())
+        writer.write("second\n")
+        self.assertEqual(b"first\nsecond\n", self.read())
+
+    def test_lines_are_written_after_flush_interval(self):
+        writer = self.writer(flush_interval=0.1, tail_interval=0.02)
+        writer.write("first\n")
+        self.assertTrue(self.wait_for(lambda: writer.statistics.flush_count == 1))
+        self.assertEqual(b"first\n", self.read())
+        self.assertFalse(os.path.exists(writer.tail_filename))
+
+    def test_buffered_lines_are_written_to_tail_file(self):
+        with open(self.filename, "wb") as log_file:
+            log_file.write(b"old\n")
+        writer = self.writer(tail_interval=0.02)
+        writer.write("first\n")
+        self.assertTrue(self.wait_for(lambda: writer.statistics.tail_write_count == 1))
+        self.assertEqual(b"4\nfirst\n", self.read(writer.tail_filename))
+        writer.write("second\n")
+        self.assertTrue(self.wait_for(lambda: writer.statistics.tail_write_count == 2))
+        self.assertEqual(b"4\nfirst\nsecond\n", self.read(writer.tail_filename))
+        writer.flush_to_disk()
+        self.assertFalse(os.path.exists(writer.tail_filename))
+        writer.write("third\n")
+        self.assertTrue(self.wait_for(lambda: writer.statistics.tail_write_count == 3))
+        self.assertEqual(b"17\nthird\n", self.read(writer.tail_filename))
+
+    def test_lines_are_written_to_tail_file_only_once(self):
+        writer = self.writer(tail_interval=3600)
+        for i in range(10):
+            writer.write("line " + str(i) + "\n")
+            writer._write_tail()
+        tail_size = os.path.getsize(writer.tail_filename)
+        self.assertEqual(len(b"0\n") + 10 * len(b"line 0\n"), tail_size)
+        writer._write_tail()
+        self.assertEqual(tail_size, os.path.getsize(writer.tail_filename))
+        self.assertEqual(10, writer.statistics.tail_write_count)
+
+    def test_tail_file_is_recovered_on_start(self):
+        # the crash happened while the first buffered line was appended
+        with open(self.filename, "wb") as log_file:
+            log_file.write(b"old\nfir")
+        with open(self.filename + ".tail", "wb") as tail_file:
+            tail_file.write(b"4\nfirst\nsecond\n")
+        writer = self.writer()
+        self.assertEqual(b"old\nfirst\nsecond\n", self.read())
+        self.assertFalse(os.path.exists(writer.tail_filename))
+        writer.write("third\n")
+        writer.close()
+        self.assertEqual(b"old\nfirst\nsecond\nthird\n", self.read())
+
+    def test_invalid_tail_file_is_removed(self):
+        with open(self.filename + ".tail", "wb") as tail_file:
+            tail_file.write(b"fir")
+        with self.assertLogs("logginghandlers.bufferedlogwriter", "WARNING"):
+            writer = self.writer()
+        self.assertFalse(os.path.exists(writer.tail_filename))
+        self.assertEqual(b"", self.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import time
+import unittest
+
+from hdmiceccontroller import CecCommandMultiplexer
+
+
+class CecCommandMultiplexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.commands = []
+        self.multiplexer = CecCommandMultiplexer(self.commands.append)
+
+    def test_query_is_resolved_by_matching_line(self):
+        query = self.multiplexer.submit("pow 0", r"power status: (\S+)")
+        self.assertEqual(["pow 0"], self.commands)
+        self.assertFalse(self.multiplexer.dispatch("DEBUG: [  1] unrelated log line"))
+        self.assertTrue(self.multiplexer.dispatch("power status: on"))
+        self.assertEqual("on", query.wait().group(1))
+
+    def test_line_resolves_the_oldest_matching_query(self):
+        first = self.multiplexer.submit("pow 0", r"power status: (\S+)")
+        second = self.multiplexer.submit("pow 0", r"power status: (\S+)")
+        self.multiplexer.dispatch("power status: on")
+        self.multiplexer.dispatch("power status: standby")
+        self.assertEqual("on", first.wait().group(1))
+        self.assertEqual("standby", second.wait().group(1))
+
+    def test_line_skips_queries_with_other_patterns(self):
+        power = self.multiplexer.submit("pow 0", r"power status: (\S+)")
+        address = self.multiplexer.submit("ad 0", r"address: (\S+)")
+        self.multiplexer.dispatch("address: 1.0.0.0")
+        self.assertEqual("1.0.0.0", address.wait().group(1))
+        self.assertIsNone(power.match)
+
+    def test_query_waits_for_a_line_from_another_thread(self):
+        def write_command(command):
+            threading.Timer(0.05, self.multiplexer.dispatch, ["power status: on"]).start()
+
+        self.multiplexer = CecCommandMultiplexer(write_command)
+        match = self.multiplexer.query("pow 0", r"power status: (\S+)", timeout=1)
+        self.assertEqual("on", match.group(1))
+
+    def test_query_times_out_without_response(self):
+        start = time.monotonic()
+        with self.assertLogs("CEC", "WARNING"):
+            match = self.multiplexer.query("pow 0", r"power status: (\S+)", timeout=0.1)
+        self.assertIsNone(match)
+        self.assertLess(time.monotonic() - start, 1)
+        # the expired query does not consume a late response
+        self.assertFalse(self.multiplexer.dispatch("power status: on"))
+
+    def test_cancel_all_resolves_queries_without_match(self):
+        query = self.multiplexer.submit("pow 0", r"power status: (\S+)")
+        self.multiplexer.cancel_all()
+        self.assertIsNone(query.wait())
+        self.assertFalse(self.multiplexer.dispatch("power status: on"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+from hdmiceccontroller import CecControllerGroup
+
+
+class FakeCecController:
+
+    def __init__(self, is_on=False):
+        self.state = is_on
+        self.thread_names = []
+        self.close_count = 0
+
+    def is_on(self):
+        self.thread_names.append(threading.current_thread().name)
+        return self.state
+
+    def power_on(self):
+        self.state = True
+
+    def standby(self):
+        self.state = False
+
+    def activate_source(self):
+        self.state = True
+
+    def close(self, timeout=10):
+        self.close_count += 1
+
+
+class CecControllerGroupTest(unittest.TestCase):
+
+    def test_commands_are_sent_to_all_devices(self):
+        cec_controllers = [FakeCecController(), FakeCecController()]
+        group = CecControllerGroup(cec_controllers)
+        self.addCleanup(group.close)
+        self.assertIs(False, group.is_on())
+        group.activate_source()
+        self.assertIs(True, group.is_on())
+        self.assertEqual(["cec-0", "cec-0"], cec_controllers[0].thread_names)
+        self.assertEqual(["cec-1", "cec-1"], cec_controllers[1].thread_names)
+
+    def test_different_states_are_unknown(self):
+        group = CecControllerGroup([FakeCecController(True), FakeCecController(False)])
+        self.addCleanup(group.close)
+        self.assertIsNone(group.is_on())
+
+    def test_close_does_not_wait_longer_than_timeout_for_a_hanging_device(self):
+        hanging_controller = FakeCecController()
+        release = threading.Event()
+        started = threading.Event()
+        hanging_controller.power_on = lambda: started.set() or release.wait(1)
+        responding_controller = FakeCecController()
+        responded = threading.Event()
+        responding_controller.power_on = responded.set
+        cec_controllers = [responding_controller, hanging_controller]
+        group = CecControllerGroup(cec_controllers)
+        threading.Thread(target=group.power_on, daemon=True).start()
+        started.wait(1)
+        responded.wait(1)
+        start = time.monotonic()
+        with self.assertLogs("hdmiceccontroller", "WARNING"):
+            group.close(timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(1, responding_controller.close_count)
+        self.assertEqual(0, hanging_controller.close_count)
+        release.set()
+
+
+if __name__ == "__main__":
+    unittest.main()
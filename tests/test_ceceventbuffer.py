@@ -0,0 +1,130 @@
+import io
+import threading
+import unittest
+from queue import Empty
+
+from hdmiceccontroller import CecEvent, CecEventBuffer, StdoutReader
+
+
+class CecEventTest(unittest.TestCase):
+
+    def test_traffic_line_is_parsed(self):
+        event = CecEvent("TRAFFIC: [          271838]\t>> 0f:36\n")
+        self.assertEqual("TRAFFIC", event.level)
+        self.assertEqual(">>", event.direction)
+        self.assertEqual(0, event.initiator)
+        self.assertEqual(15, event.destination)
+        self.assertEqual(0x36, event.opcode)
+        self.assertEqual(b"", event.parameters)
+
+    def test_traffic_line_with_parameters_is_parsed(self):
+        event = CecEvent("TRAFFIC: [  1]\t<< 10:90:01")
+        self.assertEqual("<<", event.direction)
+        self.assertEqual(1, event.initiator)
+        self.assertEqual(0, event.destination)
+        self.assertEqual(0x90, event.opcode)
+        self.assertEqual(b"\x01", event.parameters)
+
+    def test_poll_without_opcode_has_no_message(self):
+        event = CecEvent("TRAFFIC: [  1]\t<< 10")
+        self.assertEqual("TRAFFIC", event.level)
+        self.assertIsNone(event.opcode)
+
+    def test_log_line_has_only_level(self):
+        event = CecEvent("NOTICE: [  1]\tconnection opened")
+        self.assertEqual("NOTICE", event.level)
+        self.assertIsNone(event.direction)
+        self.assertIsNone(event.opcode)
+
+    def test_other_line_has_no_level(self):
+        event = CecEvent("power status: on")
+        self.assertEqual("power status: on", event.line)
+        self.assertIsNone(event.level)
+
+
+class CecEventBufferTest(unittest.TestCase):
+
+    def test_events_are_returned_in_order(self):
+        buffer = CecEventBuffer(3)
+        events = [CecEvent("line " + str(i)) for i in range(3)]
+        for event in events:
+            self.assertFalse(buffer.put(event))
+        self.assertEqual(3, len(buffer))
+        self.assertEqual(events, [buffer.get() for _ in range(3)])
+        self.assertEqual(0, buffer.memory_bytes)
+
+    def test_full_buffer_drops_oldest_event(self):
+        buffer = CecEventBuffer(2)
+        events = [CecEvent("line " + str(i)) for i in range(3)]
+        buffer.put(events[0])
+        buffer.put(events[1])
+        self.assertTrue(buffer.put(events[2]))
+        self.assertEqual(3, buffer.received_count)
+        self.assertEqual(1, buffer.dropped_count)
+        self.assertEqual(events[1:], buffer.get_all())
+        self.assertEqual(0, len(buffer))
+        self.assertEqual(0, buffer.memory_bytes)
+
+    def test_memory_bytes_follow_the_buffered_events(self):
+        buffer = CecEventBuffer(2)
+        buffer.put(CecEvent("short"))
+        buffer.put(CecEvent("a much longer line " * 10))
+        size = buffer.memory_bytes
+        buffer.put(CecEvent("short"))
+        self.assertEqual(size, buffer.memory_bytes)
+
+    def test_get_raises_empty(self):
+        buffer = CecEventBuffer()
+        with self.assertRaises(Empty):
+            buffer.get(block=False)
+        with self.assertRaises(Empty):
+            buffer.get(timeout=0.05)
+
+    def test_get_waits_for_event(self):
+        buffer = CecEventBuffer()
+        event = CecEvent("line")
+        threading.Timer(0.05, buffer.put, [event]).start()
+        self.assertIs(event, buffer.get(timeout=1))
+
+
+class BlockingStdout:
+    """Returns the lines put into it like the stdout of cec-client."""
+
+    def __init__(self):
+        self.lines = CecEventBuffer()
+
+    def readline(self):
+        return self.lines.get().line
+
+    def close(self):
+        pass
+
+
+class StdoutReaderTest(unittest.TestCase):
+
+    def test_unhandled_events_are_buffered(self):
+        handled = []
+        reader = StdoutReader(io.StringIO("power status: on\nwaiting for input\n"),
+                              lambda event: handled.append(event.line) or "power" in event.line)
+        reader.thread.join(1)
+        self.assertEqual(["power status: on\n", "waiting for input\n"], handled)
+        self.assertEqual("waiting for input\n", reader.get_nowait().line)
+
+    def test_events_are_not_buffered_after_stop_buffering(self):
+        stdout = BlockingStdout()
+        handled = threading.Event()
+        reader = StdoutReader(stdout, lambda event: handled.set(), capacity=2)
+        stdout.lines.put(CecEvent("waiting for input\n"))
+        reader.get(timeout=1)
+        reader.stop_buffering()
+        for _ in range(5):
+            stdout.lines.put(CecEvent("TRAFFIC: [  1]\t>> 0f:36\n"))
+        stdout.lines.put(CecEvent(""))
+        reader.thread.join(1)
+        self.assertEqual(0, len(reader.buffer))
+        self.assertEqual(0, reader.buffer.dropped_count)
+        self.assertTrue(handled.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest import mock
+
+from cecreconciler import CecReconciler
+
+
+class FakeCecController:
+    """Records the commands and reports the state they switched to."""
+
+    def __init__(self, is_on=None):
+        self.state = is_on
+        self.commands = []
+
+    def is_on(self):
+        self.commands.append("is_on")
+        return self.state
+
+    def activate_source(self):
+        self.commands.append("activate_source")
+        self.state = True
+
+    def standby(self):
+        self.commands.append("standby")
+        self.state = False
+
+
+class FakeAlarmHistory:
+
+    def __init__(self):
+        self.transitions = []
+
+    def add_transition(self, is_on, alarm_id=None):
+        self.transitions.append((is_on, alarm_id))
+
+
+class CecReconcilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch("cecreconciler.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.controller = FakeCecController()
+        self.reconciler = CecReconciler(self.controller, verify_interval=300)
+
+    def test_nothing_is_sent_without_desired_state(self):
+        self.reconciler.reconcile()
+        self.assertEqual([], self.controller.commands)
+
+    def test_repeated_commands_are_suppressed(self):
+        self.reconciler.set_desired(True)
+        for _ in range(3):
+            self.reconciler.reconcile()
+        self.assertEqual(["activate_source"], self.controller.commands)
+        self.assertEqual(1, self.reconciler.commands_sent)
+        self.assertEqual(2, self.reconciler.commands_suppressed)
+
+    def test_changed_desired_state_is_sent(self):
+        self.reconciler.set_desired(True)
+        self.reconciler.reconcile()
+        self.reconciler.set_desired(False)
+        self.reconciler.reconcile()
+        self.assertEqual(["activate_source", "standby"], self.controller.commands)
+
+    def test_state_is_verified_after_verify_interval(self):
+        self.reconciler.set_desired(True)
+        self.reconciler.reconcile()
+        self.now += 299
+        self.reconciler.reconcile()
+        self.assertEqual(["activate_source"], self.controller.commands)
+        self.now += 1
+        self.reconciler.reconcile()
+        self.assertEqual(["activate_source", "is_on"], self.controller.commands)
+        self.assertEqual(2, self.reconciler.commands_suppressed)
+
+    def test_device_switched_by_someone_else_is_switched_back(self):
+        self.reconciler.set_desired(True)
+        self.reconciler.reconcile()
+        self.controller.state = False
+        self.now += 300
+        with self.assertLogs("cecreconciler", "WARNING"):
+            self.reconciler.reconcile()
+        self.assertEqual(["activate_source", "is_on", "activate_source"],
+                         self.controller.commands)
+        self.assertEqual(2, self.reconciler.commands_sent)
+
+    def test_unknown_state_is_sent_again(self):
+        self.reconciler.set_desired(False)
+        self.reconciler.reconcile()
+        self.controller.state = None
+        self.now += 300
+        self.reconciler.reconcile()
+        self.assertEqual(["standby", "is_on", "standby"], self.controller.commands)
+
+    def test_transitions_are_stored_in_alarm_history(self):
+        alarm_history = FakeAlarmHistory()
+        reconciler = CecReconciler(self.controller, alarm_history=alarm_history)
+        reconciler.set_desired(True, "1")
+        reconciler.set_desired(True, "1")
+        reconciler.set_desired(False)
+        self.assertEqual([(True, "1"), (False, None)], alarm_history.transitions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import threading
+import time
+import unittest
+
+from daemonthreadexecutor import DaemonThreadExecutor
+
+
+class DaemonThreadExecutorTest(unittest.TestCase):
+
+    def test_runs_calls_in_order(self):
+        executor = DaemonThreadExecutor("test")
+        results = []
+        futures = [executor.submit(results.append, i) for i in range(5)]
+        for future in futures:
+            future.result(1)
+        self.assertEqual([0, 1, 2, 3, 4], results)
+        self.assertTrue(executor.shutdown(timeout=1))
+
+    def test_propagates_exceptions(self):
+        executor = DaemonThreadExecutor("test")
+        future = executor.submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(1)
+        executor.shutdown(timeout=1)
+
+    def test_shutdown_does_not_wait_longer_than_timeout_for_a_hanging_call(self):
+        executor = DaemonThreadExecutor("test")
+        started = threading.Event()
+        release = threading.Event()
+        executor.submit(lambda: started.set() or release.wait())
+        started.wait(1)
+        queued = executor.submit(lambda: None)
+        start = time.monotonic()
+        self.assertFalse(executor.shutdown(cancel_futures=True, timeout=0.2))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(queued.cancelled())
+        release.set()
+        self.assertTrue(executor.shutdown(timeout=1))
+
+    def test_rejects_calls_after_shutdown(self):
+        executor = DaemonThreadExecutor("test")
+        executor.shutdown(timeout=1)
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+
+from chromiumbrowsercontroller import HotSpareBrowserController
+
+
+class FakeDevTools:
+
+    def __init__(self, is_available=True):
+        self.is_available = is_available
+
+    def wait_until_available(self, timeout):
+        if isinstance(self.is_available, Exception):
+            raise self.is_available
+        return self.is_available
+
+
+class FakeBrowser:
+
+    def __init__(self, slot, start_error=None, is_available=True):
+        self.remote_debugging_port, self.user_data_dir = slot
+        self.devtools = FakeDevTools(is_available)
+        self.start_error = start_error
+        self.is_started = False
+        self.is_terminated = False
+
+    def start(self):
+        if self.start_error:
+            raise self.start_error
+        self.is_started = True
+
+    def hide(self):
+        return True
+
+    def terminate(self):
+        self.is_terminated = True
+
+
+class HotSpareBrowserControllerTest(unittest.TestCase):
+
+    def controller(self, **spare_kwargs):
+        self.browsers = []
+
+        def create_browser(slot, hidden):
+            browser = FakeBrowser(slot, **spare_kwargs) if hidden else FakeBrowser(slot)
+            self.browsers.append(browser)
+            return browser
+        patcher = mock.patch.object(HotSpareBrowserController, "_create_browser",
+                                    side_effect=create_browser)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return HotSpareBrowserController("session")
+
+    def warm_up_spare(self, controller):
+        controller._is_warming_up = True
+        controller._warm_up_spare()
+        self.assertFalse(controller._is_warming_up)
+
+    def test_ready_spare_is_kept(self):
+        controller = self.controller()
+        with self.assertLogs("chromiumbrowsercontroller", "INFO"):
+            self.warm_up_spare(controller)
+        spare = self.browsers[1]
+        self.assertIs(spare, controller.spare)
+        self.assertEqual(9223, spare.remote_debugging_port)
+        self.assertFalse(spare.is_terminated)
+
+    def test_spare_failing_to_start_is_terminated(self):
+        controller = self.controller(start_error=OSError("chromium-browser not found"))
+        with self.assertLogs("chromiumbrowsercontroller", "ERROR"):
+            self.warm_up_spare(controller)
+        self.assertIsNone(controller.spare)
+        self.assertTrue(self.browsers[1].is_terminated)
+
+    def test_spare_failing_to_become_available_is_terminated(self):
+        controller = self.controller(is_available=ConnectionError("refused"))
+        with self.assertLogs("chromiumbrowsercontroller", "ERROR"):
+            self.warm_up_spare(controller)
+        self.assertIsNone(controller.spare)
+        self.assertTrue(self.browsers[1].is_started)
+        self.assertTrue(self.browsers[1].is_terminated)
+
+    def test_spare_not_ready_in_time_is_terminated(self):
+        controller = self.controller(is_available=False)
+        with self.assertLogs("chromiumbrowsercontroller", "WARNING"):
+            self.warm_up_spare(controller)
+        self.assertIsNone(controller.spare)
+        self.assertTrue(self.browsers[1].is_terminated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import configparser
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from logginghandlers.logstatistics import LogStatistics
+from logginghandlers.timedrotatingfilesmtphandler import TimedRotatingFileSMTPHandler
+
+
+def make_record(msg, levelno=logging.INFO, name="alarmmonitor", created=None):
+    record = logging.LogRecord(name, levelno, __file__, 1, msg, None, None)
+    if created is not None:
+        record.created = created
+    return record
+
+
+class LogStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_records_are_counted_by_level_logger_and_hour(self):
+        statistics = LogStatistics()
+        hour = time.mktime((2024, 5, 1, 10, 0, 0, 0, 0, -1))
+        statistics.count_record(make_record("START alarm monitor"))
+        statistics.count_record(make_record("failed", logging.ERROR, "browser", hour + 60))
+        statistics.count_record(make_record("slow", logging.WARNING, "cec", hour + 120))
+        statistics.count_record(make_record("slow", logging.WARNING, "cec", hour + 3600))
+        self.assertEqual(1, statistics.start_count)
+        self.assertEqual(1, statistics.get_count(logging.ERROR))
+        self.assertEqual(2, statistics.get_count(logging.WARNING))
+        self.assertEqual({"browser": 1, "cec": 2}, statistics.get_counts_by_logger())
+        self.assertEqual({"2024-05-01 10": 2, "2024-05-01 11": 1},
+                         statistics.get_counts_by_hour())
+
+    def test_duplicate_records_are_counted_each(self):
+        statistics = LogStatistics()
+        record = make_record("connection lost", logging.WARNING)
+        for _ in range(3):
+            statistics.count_record(record)
+        self.assertEqual(3, statistics.get_count(logging.WARNING))
+
+    def test_reset_returns_the_counts_and_starts_from_zero(self):
+        statistics = LogStatistics()
+        statistics.count_record(make_record("START alarm monitor"))
+        statistics.count_record(make_record("failed", logging.ERROR))
+        previous = statistics.reset()
+        self.assertEqual(1, previous.start_count)
+        self.assertEqual(1, previous.get_count(logging.ERROR))
+        self.assertEqual(0, statistics.start_count)
+        self.assertEqual(0, statistics.get_count(logging.ERROR))
+        statistics.count_record(make_record("failed", logging.ERROR))
+        self.assertEqual(1, statistics.get_count(logging.ERROR))
+        self.assertEqual(1, previous.get_count(logging.ERROR))
+
+    def test_lines_of_a_previous_run_are_counted_on_restart(self):
+        path = os.path.join(self.directory, "alarmmonitor.log")
+        with open(path, "w") as log_file:
+            log_file.write(
+                "2024-05-01 10:00:00,000 - __main__ - INFO - START alarm monitor\n"
+                "2024-05-01 10:05:00,000 - browser - ERROR - Page crashed\n"
+                "Traceback (most recent call last):\n"
+                "  File \"main.py\", line 1, in <module>\n"
+                "ValueError: ERROR in traceback\n"
+                "2024-05-01 10:06:00,000 - cec - WARNING - No answer, retrying\n"
+                "2024-05-01 10:06:00,000 - cec - WARNING - No answer, retrying\n"
+                "2024-05-01 10:07:00,000 - cec - NOLEVEL - unknown level\n")
+        statistics = LogStatistics()
+        statistics.count_file(path)
+        self.assertEqual(1, statistics.start_count)
+        self.assertEqual(1, statistics.get_count(logging.ERROR))
+        self.assertEqual(2, statistics.get_count(logging.WARNING))
+        self.assertEqual({"browser": 1, "cec": 2}, statistics.get_counts_by_logger())
+
+    def test_missing_file_is_not_counted(self):
+        statistics = LogStatistics()
+        statistics.count_file(os.path.join(self.directory, "missing.log"))
+        self.assertEqual(0, statistics.get_count(logging.INFO))
+
+
+class TimedRotatingFileSMTPHandlerStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        config = configparser.ConfigParser()
+        config["Email"] = {"smtp_server": "localhost", "smtp_port": "587",
+                           "username": "user", "password": "password",
+                           "from_addr": "from", "to_addrs": '["to"]', "subject": "Log"}
+        self.config_path = os.path.join(self.directory, "config.ini")
+        with open(self.config_path, "w") as config_file:
+            config.write(config_file)
+        self.filename = os.path.join(self.directory, "logs", "alarmmonitor.log")
+
+    def handler(self):
+        handler = TimedRotatingFileSMTPHandler(self.filename, self.config_path, False)
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        self.addCleanup(handler.close)
+        return handler
+
+    def test_rollover_summarizes_only_the_records_of_the_rotated_file(self):
+        handler = self.handler()
+        handler.emit(make_record("START alarm monitor"))
+        handler.emit(make_record("failed", logging.ERROR))
+        summarized = []
+        with mock.patch.object(handler, "_compress_log_send_mail",
+                               lambda path, statistics, _: summarized.append(statistics)):
+            handler.doRollover()
+            for thread in handler._archive_threads:
+                thread.join(1)
+        handler.emit(make_record("failed", logging.ERROR))
+        self.assertEqual(1, len(summarized))
+        self.assertEqual(1, summarized[0].start_count)
+        self.assertEqual(1, summarized[0].get_count(logging.ERROR))
+        self.assertEqual(0, handler.statistics.start_count)
+        self.assertEqual(1, handler.statistics.get_count(logging.ERROR))
+
+    def test_records_of_a_previous_run_are_counted_after_a_restart(self):
+        handler = self.handler()
+        handler.emit(make_record("START alarm monitor"))
+        handler.emit(make_record("failed", logging.ERROR))
+        handler.close()
+        restarted_handler = self.handler()
+        restarted_handler.emit(make_record("START alarm monitor"))
+        self.assertEqual(2, restarted_handler.statistics.start_count)
+        self.assertEqual(1, restarted_handler.statistics.get_count(logging.ERROR))
+
+
+if __name__ == "__main__":
+    unittest.main()
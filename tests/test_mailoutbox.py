@@ -0,0 +1,103 @@
+import threading
+import unittest
+
+from alarmmonitormailsender import MailOutbox
+
+
+class FakeMailSender:
+    """Records the sent mails. Fails while :is_failing: is set."""
+
+    def __init__(self, is_failing=False):
+        self.is_failing = is_failing
+        self.messages = []
+        self.close_count = 0
+        self.sent = threading.Event()
+        self.disconnected = threading.Event()
+
+    def send_message(self, msg):
+        self.messages.append(msg)
+        self.sent.set()
+        if self.is_failing:
+            raise OSError("Connection refused")
+        return True
+
+    def disconnect(self):
+        self.disconnected.set()
+
+    def close(self):
+        self.close_count += 1
+
+
+class MailOutboxTest(unittest.TestCase):
+
+    def test_mails_enqueued_within_digest_delay_are_sent_as_one_digest(self):
+        mail_sender = FakeMailSender()
+        outbox = MailOutbox(mail_sender, digest_delay=0.2)
+        for msg in ("first", "second", "first"):
+            outbox.send_message(msg)
+        outbox.close()
+        self.assertEqual(["first\n(repeated 2 times)\n\n---\n\nsecond"], mail_sender.messages)
+        self.assertEqual(3, outbox.sent_count)
+        self.assertEqual(0, outbox.failed_count)
+
+    def test_mails_after_digest_delay_are_sent_separately(self):
+        mail_sender = FakeMailSender()
+        outbox = MailOutbox(mail_sender, digest_delay=0)
+        outbox.send_message("first")
+        mail_sender.sent.wait(1)
+        outbox.send_message("second")
+        outbox.close()
+        self.assertEqual(["first", "second"], mail_sender.messages)
+        self.assertEqual(2, outbox.sent_count)
+
+    def test_failed_mails_are_counted_as_failed(self):
+        mail_sender = FakeMailSender(is_failing=True)
+        outbox = MailOutbox(mail_sender, digest_delay=0.1)
+        with self.assertLogs("alarmmonitormailsender", "ERROR"):
+            outbox.send_message("first")
+            outbox.send_message("second")
+            outbox.close()
+        self.assertEqual(0, outbox.sent_count)
+        self.assertEqual(2, outbox.failed_count)
+
+    def test_unsent_mails_are_counted_as_failed(self):
+        mail_sender = FakeMailSender()
+        mail_sender.send_message = lambda msg: False
+        outbox = MailOutbox(mail_sender, digest_delay=0)
+        outbox.send_message("first")
+        outbox.close()
+        self.assertEqual(0, outbox.sent_count)
+        self.assertEqual(1, outbox.failed_count)
+
+    def test_mails_beyond_max_size_are_dropped(self):
+        mail_sender = FakeMailSender()
+        started = threading.Event()
+        release = threading.Event()
+        send_message = mail_sender.send_message
+        mail_sender.send_message = lambda msg: (
+            started.set() or release.wait(1) and send_message(msg))
+        outbox = MailOutbox(mail_sender, max_size=2, digest_delay=0)
+        outbox.send_message("first")
+        started.wait(1)
+        with self.assertLogs("alarmmonitormailsender", "ERROR"):
+            for msg in ("second", "third", "fourth"):
+                outbox.send_message(msg)
+        release.set()
+        outbox.close()
+        self.assertEqual(1, outbox.dropped_count)
+        self.assertEqual(3, outbox.sent_count)
+
+    def test_connection_is_closed_after_idle_timeout(self):
+        mail_sender = FakeMailSender()
+        outbox = MailOutbox(mail_sender, digest_delay=0, idle_timeout=0.05)
+        outbox.send_message("first")
+        self.assertTrue(mail_sender.disconnected.wait(1))
+        self.assertEqual(0, mail_sender.close_count)
+        outbox.send_message("second")
+        outbox.close()
+        self.assertEqual(["first", "second"], mail_sender.messages)
+        self.assertEqual(1, mail_sender.close_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
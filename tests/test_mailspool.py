@@ -0,0 +1,163 @@
+import configparser
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mailspool import MailSpool, get_mail_spool
+
+
+class FakeMailSender:
+    """Records the delivered mails. Fails the first :failure_count: deliveries."""
+
+    def __init__(self, failure_count=0):
+        self.failure_count = failure_count
+        self.attempt_times = []
+        self.messages = []
+        self.close_count = 0
+        self.delivered = threading.Condition()
+
+    def send_message(self, from_addr, to_addrs, msg):
+        with self.delivered:
+            self.attempt_times.append(time.monotonic())
+            if len(self.attempt_times) <= self.failure_count:
+                return False
+            self.messages.append(msg)
+            self.delivered.notify_all()
+            return True
+
+    def wait_for(self, count, timeout=2):
+        with self.delivered:
+            return self.delivered.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def close(self):
+        with self.delivered:
+            self.close_count += 1
+            self.delivered.notify_all()
+
+
+class MailSpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "spool", "alarmmonitor.spool")
+
+    def spool(self, mail_sender, **kwargs):
+        spool = MailSpool(mail_sender, self.path, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def test_mails_are_delivered_in_order(self):
+        mail_sender = FakeMailSender()
+        spool = self.spool(mail_sender)
+        for msg in ("first", "second", "third"):
+            self.assertTrue(spool.send_message("from", ["to"], msg))
+        self.assertTrue(mail_sender.wait_for(3))
+        self.assertEqual(["first", "second", "third"], mail_sender.messages)
+        spool.close()
+        self.assertEqual(3, spool.delivered_count)
+        with open(self.path + ".delivered") as delivered_file:
+            self.assertEqual("3", delivered_file.read())
+        self.assertEqual(0, os.path.getsize(self.path))
+
+    def test_disconnect_keeps_the_spool_open(self):
+        mail_sender = FakeMailSender()
+        spool = self.spool(mail_sender)
+        spool.send_message("from", ["to"], "first")
+        spool.disconnect()
+        with mail_sender.delivered:
+            self.assertTrue(mail_sender.delivered.wait_for(lambda: mail_sender.close_count, 2))
+        self.assertEqual(["first"], mail_sender.messages)
+        self.assertTrue(spool.send_message("from", ["to"], "second"))
+        self.assertTrue(mail_sender.wait_for(2))
+        self.assertEqual(1, mail_sender.close_count)
+
+    def test_failed_delivery_is_retried_with_growing_backoff(self):
+        mail_sender = FakeMailSender(failure_count=2)
+        spool = self.spool(mail_sender, min_backoff=0.1, max_backoff=1)
+        with self.assertLogs("mailspool", "WARNING"):
+            spool.send_message("from", ["to"], "first")
+            self.assertTrue(mail_sender.wait_for(1))
+        self.assertEqual(["first"], mail_sender.messages)
+        first_delay, second_delay = (later - earlier for earlier, later in zip(
+            mail_sender.attempt_times, mail_sender.attempt_times[1:]))
+        self.assertGreaterEqual(first_delay, 0.1)
+        self.assertGreaterEqual(second_delay, 0.2)
+
+    def test_undelivered_mails_are_delivered_after_restart(self):
+        spool = MailSpool(FakeMailSender(failure_count=10), self.path, min_backoff=10)
+        spool.send_message("from", ["to"], "first")
+        spool.send_message("from", ["to"], "second")
+        spool.close(timeout=1)
+
+        mail_sender = FakeMailSender()
+        spool = self.spool(mail_sender)
+        self.assertTrue(mail_sender.wait_for(2))
+        self.assertEqual(["first", "second"], mail_sender.messages)
+        spool.send_message("from", ["to"], "third")
+        self.assertTrue(mail_sender.wait_for(3))
+        spool.close()
+        with open(self.path + ".delivered") as delivered_file:
+            self.assertEqual("3", delivered_file.read())
+
+    def test_delivered_mails_are_not_delivered_again_after_restart(self):
+        os.makedirs(os.path.dirname(self.path))
+        records = [b'{"id": %d, "created": %f, "from_addr": "from", "to_addrs": ["to"], '
+                   b'"msg": "mail %d"}\n' % (mail_id, time.time(), mail_id)
+                   for mail_id in (1, 2, 3)]
+        with open(self.path, "wb") as spool_file:
+            spool_file.write(b"".join(records) + b'{"id": 4, "crea')
+        with open(self.path + ".delivered", "w") as delivered_file:
+            delivered_file.write("2")
+
+        mail_sender = FakeMailSender()
+        with self.assertLogs("mailspool", "WARNING"):
+            spool = self.spool(mail_sender)
+        self.assertTrue(mail_sender.wait_for(1))
+        spool.send_message("from", ["to"], "mail 4")
+        self.assertTrue(mail_sender.wait_for(2))
+        self.assertEqual(["mail 3", "mail 4"], mail_sender.messages)
+
+    def test_oldest_mails_are_dropped_beyond_max_bytes(self):
+        spool = self.spool(FakeMailSender(failure_count=10), min_backoff=10)
+        spool.send_message("from", ["to"], "mail 1")
+        # room for two mails of the same size
+        spool.max_bytes = 2 * os.path.getsize(self.path) + 10
+        with self.assertLogs("mailspool", "WARNING"):
+            for msg in ("mail 2", "mail 3", "mail 4"):
+                spool.send_message("from", ["to"], msg)
+        self.assertEqual(2, spool.dropped_count)
+        self.assertEqual([3, 4], [mail.mail_id for mail in spool._pending])
+        self.assertLessEqual(os.path.getsize(self.path), spool.max_bytes)
+
+    def test_mails_older_than_max_age_are_dropped(self):
+        mail_sender = FakeMailSender(failure_count=1)
+        spool = self.spool(mail_sender, max_age=0.1, min_backoff=0.2)
+        with self.assertLogs("mailspool", "WARNING"):
+            spool.send_message("from", ["to"], "first")
+            time.sleep(0.4)
+        spool.send_message("from", ["to"], "second")
+        self.assertTrue(mail_sender.wait_for(1))
+        self.assertEqual(["second"], mail_sender.messages)
+        self.assertEqual(1, spool.dropped_count)
+
+    def test_mail_spool_is_only_used_with_spool_dir(self):
+        config = configparser.ConfigParser()
+        config.read_dict({"Email": {}})
+        mail_sender = FakeMailSender()
+        self.assertIs(mail_sender, get_mail_spool(config, mail_sender, "log"))
+
+        config["Email"]["spool_dir"] = os.path.dirname(self.path)
+        config["Email"]["spool_max_size"] = "0.5"
+        spool = get_mail_spool(config, mail_sender, "log")
+        self.addCleanup(spool.close)
+        self.assertEqual(os.path.join(os.path.dirname(self.path), "log.spool"), spool.path)
+        self.assertEqual(2 ** 19, spool.max_bytes)
+        self.assertEqual(168 * 3600, spool.max_age)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import unittest
+
+from pollingscheduler import PollingScheduler
+
+
+class PollingSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+
+    def test_polls_at_a_fixed_rate(self):
+        scheduler = PollingScheduler(10)
+        self.assertEqual(10, scheduler.schedule(0))
+        # the poll took 3 seconds, the next one still starts on time
+        self.assertEqual(20, scheduler.schedule(13))
+
+    def test_overrun_poll_is_followed_immediately(self):
+        scheduler = PollingScheduler(10)
+        scheduler.schedule(0)
+        self.assertEqual(25, scheduler.schedule(25))
+
+    def test_polls_faster_within_hot_window(self):
+        scheduler = PollingScheduler(10, hot_interval=2, hot_window=30)
+        self.assertEqual(2, scheduler.schedule(0, has_news=True))
+        self.assertEqual(2, scheduler.current_interval(29))
+        self.assertEqual(10, scheduler.current_interval(30))
+
+    def test_backoff_doubles_up_to_max_backoff_within_jitter(self):
+        scheduler = PollingScheduler(10, max_backoff=60, jitter=0.2)
+        for expected in (10, 20, 40, 60, 60):
+            scheduler.schedule(0, is_failed=True)
+            for _ in range(100):
+                interval = scheduler.current_interval(0)
+                self.assertGreaterEqual(interval, expected * 0.8)
+                self.assertLessEqual(interval, expected * 1.2)
+
+    def test_jitter_varies_backoff(self):
+        scheduler = PollingScheduler(10, jitter=0.2)
+        scheduler.schedule(0, is_failed=True)
+        intervals = {scheduler.current_interval(0) for _ in range(10)}
+        self.assertGreater(len(intervals), 1)
+
+    def test_success_resets_backoff(self):
+        scheduler = PollingScheduler(10, jitter=0.2)
+        for _ in range(5):
+            scheduler.schedule(0, is_failed=True)
+        with self.assertLogs("pollingscheduler", "INFO"):
+            scheduler.schedule(0)
+        self.assertEqual(10, scheduler.current_interval(0))
+
+    def test_max_backoff_is_at_least_the_interval(self):
+        scheduler = PollingScheduler(120, max_backoff=60, jitter=0)
+        scheduler.schedule(0, is_failed=True)
+        self.assertEqual(120, scheduler.current_interval(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+
+from pooledhttpclient import DnsCache, PooledHttpClient
+
+
+def resolving(*addresses):
+    """Patches the name resolution of example.org to :addresses:.
+    The IP addresses are still resolved by the operating system.
+    """
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, port, *args, **kwargs):
+        if host != "example.org":
+            return getaddrinfo(host, port, *args, **kwargs)
+        return [(socket.AF_INET6 if ":" in address else socket.AF_INET, socket.SOCK_STREAM, 6,
+                 "", (address, port)) for address in addresses]
+
+    return mock.patch("pooledhttpclient.socket.getaddrinfo", side_effect=resolve)
+
+
+class OkHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class DnsCacheTest(unittest.TestCase):
+
+    def test_all_addresses_are_cached_in_order(self):
+        dns_cache = DnsCache(ttl=60)
+        with resolving("2001:db8::1", "192.0.2.1", "2001:db8::1"):
+            self.assertEqual((["2001:db8::1", "192.0.2.1"], False),
+                             dns_cache.resolve("example.org", 80))
+        self.assertEqual((["2001:db8::1", "192.0.2.1"], True),
+                         dns_cache.resolve("example.org", 80))
+
+    def test_preferred_address_is_tried_first(self):
+        dns_cache = DnsCache(ttl=60)
+        with resolving("2001:db8::1", "192.0.2.1"):
+            dns_cache.resolve("example.org", 80)
+        dns_cache.prefer("example.org", 80, "192.0.2.1")
+        self.assertEqual(["192.0.2.1", "2001:db8::1"], dns_cache.resolve("example.org", 80)[0])
+
+    def test_stale_addresses_are_used_if_resolution_fails(self):
+        dns_cache = DnsCache(ttl=0)
+        with resolving("192.0.2.1"):
+            dns_cache.resolve("example.org", 80)
+        with mock.patch("pooledhttpclient.socket.getaddrinfo", side_effect=socket.gaierror()):
+            with self.assertLogs("pooledhttpclient", "WARNING"):
+                self.assertEqual((["192.0.2.1"], True), dns_cache.resolve("example.org", 80))
+
+
+class PooledHttpClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), OkHandler)
+        self.addCleanup(self.server.server_close)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://example.org:" + str(self.server.server_port) + "/"
+
+    def test_next_address_is_tried_if_connect_fails(self):
+        client = PooledHttpClient(connect_timeout=1)
+        self.addCleanup(client.close)
+        # nothing listens on 127.0.0.2, so the connection is refused
+        with resolving("127.0.0.2", "127.0.0.1"):
+            with self.assertLogs("pooledhttpclient", "WARNING") as logs:
+                self.assertEqual(b"ok", client.get(self.url).content)
+                # the working address is tried first for the next connection
+                client.session.close()
+                self.assertEqual(b"ok", client.get(self.url).content)
+        self.assertEqual(1, len(logs.records))
+
+    def test_connect_error_is_raised_if_all_addresses_fail(self):
+        client = PooledHttpClient(connect_timeout=1)
+        self.addCleanup(client.close)
+        with resolving("127.0.0.2", "127.0.0.3"):
+            with self.assertLogs("pooledhttpclient", "WARNING"):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    client.get(self.url)
+
+
+if __name__ == "__main__":
+    unittest.main()
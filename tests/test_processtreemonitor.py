@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from processtreemonitor import ProcessTreeMonitor
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class FakeProcDir:
+    """A /proc tree containing only the stat, statm and status files read by the monitor."""
+
+    def __init__(self, test_case):
+        self.path = tempfile.mkdtemp()
+        test_case.addCleanup(shutil.rmtree, self.path)
+        os.mkdir(os.path.join(self.path, "self"))
+
+    def add_process(self, pid, ppid, rss_mib=0, swap_mib=0, cpu_seconds=0,
+                    command="chromium (renderer)"):
+        directory = os.path.join(self.path, str(pid))
+        os.makedirs(directory, exist_ok=True)
+        ticks = int(cpu_seconds * CLOCK_TICKS)
+        # utime and stime are the 14th and 15th fields
+        with open(os.path.join(directory, "stat"), "w") as stat_file:
+            stat_file.write(str(pid) + " (" + command + ") S " + str(ppid)
+                            + " 0" * 9 + " " + str(ticks) + " 0" + " 0" * 5 + "\n")
+        with open(os.path.join(directory, "statm"), "w") as statm_file:
+            statm_file.write("1000 " + str(rss_mib * 2 ** 20 // PAGE_SIZE) + " 0 0 0 0 0\n")
+        with open(os.path.join(directory, "status"), "w") as status_file:
+            status_file.write("Name:\tchromium\nVmRSS:\t0 kB\nVmSwap:\t"
+                              + str(swap_mib * 1024) + " kB\n")
+
+    def remove_process(self, pid):
+        shutil.rmtree(os.path.join(self.path, str(pid)))
+
+
+class ProcessTreeMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = FakeProcDir(self)
+        self.proc.add_process(1, 0, rss_mib=500)
+        self.proc.add_process(100, 1, rss_mib=100, swap_mib=10, cpu_seconds=1)
+        self.proc.add_process(101, 100, rss_mib=200, swap_mib=20, cpu_seconds=2)
+        self.proc.add_process(102, 101, rss_mib=50, cpu_seconds=3)
+        self.proc.add_process(200, 1, rss_mib=1000)
+        self.now = 1000
+        patcher = mock.patch("processtreemonitor.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def monitor(self, **limits):
+        monitor = ProcessTreeMonitor(proc_dir=self.proc.path, **limits)
+        monitor.attach(100)
+        return monitor
+
+    def test_resources_of_the_process_tree_are_summed(self):
+        resources = self.monitor().sample()
+        self.assertEqual(3, resources.process_count)
+        self.assertEqual(350 * 2 ** 20, resources.rss)
+        self.assertEqual(30 * 2 ** 20, resources.swap)
+        self.assertIsNone(resources.cpu_percent)
+
+    def test_cpu_usage_is_computed_between_samples(self):
+        monitor = self.monitor()
+        monitor.sample()
+        self.proc.add_process(102, 101, rss_mib=50, cpu_seconds=8)
+        self.now += 10
+        self.assertAlmostEqual(50, monitor.sample().cpu_percent)
+
+    def test_exited_process_is_skipped(self):
+        monitor = self.monitor()
+        monitor.sample()
+        self.proc.remove_process(102)
+        self.now += 10
+        resources = monitor.sample()
+        self.assertEqual(2, resources.process_count)
+        self.assertEqual(300 * 2 ** 20, resources.rss)
+        self.assertEqual(0, resources.cpu_percent)
+
+    def test_rss_limit_is_exceeded_by_a_single_sample(self):
+        self.assertIsNone(self.monitor(max_rss=350).get_exceeded_limit())
+        self.assertEqual("RSS of 350 MiB exceeds 349 MiB",
+                         self.monitor(max_rss=349).get_exceeded_limit())
+
+    def test_swap_limit_is_exceeded_by_a_single_sample(self):
+        self.assertIsNone(self.monitor(max_swap=30).get_exceeded_limit())
+        self.assertEqual("swap of 30 MiB exceeds 29 MiB",
+                         self.monitor(max_swap=29).get_exceeded_limit())
+
+    def test_cpu_limit_has_to_be_exceeded_by_consecutive_samples(self):
+        monitor = self.monitor(max_cpu=50, cpu_samples=2)
+        # the first sample has no CPU usage yet
+        self.assertIsNone(monitor.get_exceeded_limit())
+        cpu_seconds = 3
+        results = []
+        for cpu_percent in (100, 10, 100, 100):
+            cpu_seconds += cpu_percent / 10
+            self.proc.add_process(102, 101, rss_mib=50, cpu_seconds=cpu_seconds)
+            self.now += 10
+            results.append(monitor.get_exceeded_limit())
+        self.assertEqual([None, None, None, "CPU usage exceeds 50 % for 2 samples"], results)
+
+    def test_no_limit_is_checked_before_attach(self):
+        monitor = ProcessTreeMonitor(max_rss=1, proc_dir=self.proc.path)
+        self.assertIsNone(monitor.get_exceeded_limit())
+
+
+if __name__ == "__main__":
+    unittest.main()
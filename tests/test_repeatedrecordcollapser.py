@@ -0,0 +1,103 @@
+import logging
+import unittest
+
+from logginghandlers.repeatedrecordcollapser import RepeatedRecordCollapser
+
+
+def record(msg, lineno=1, name="poller", created=0, levelno=logging.INFO):
+    return logging.makeLogRecord({"name": name, "msg": msg, "pathname": "poller.py",
+                                  "lineno": lineno, "levelno": levelno,
+                                  "levelname": logging.getLevelName(levelno),
+                                  "created": created})
+
+
+class RepeatedRecordCollapserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collapser = RepeatedRecordCollapser(summary_interval=3600)
+
+    def messages(self, records):
+        return [record.getMessage() for record in records]
+
+    def test_repeated_records_are_suppressed(self):
+        self.assertEqual(["Polling"], self.messages(self.collapser.process(record("Polling"))))
+        self.assertEqual([], self.collapser.process(record("Polling")))
+        self.assertEqual([], self.collapser.process(record("Polling")))
+        self.assertEqual(2, self.collapser.suppressed_count)
+
+    def test_interleaved_call_sites_are_suppressed(self):
+        for _ in range(3):
+            self.collapser.process(record("Requesting", lineno=1))
+            self.collapser.process(record("Request successful", lineno=2))
+        self.assertEqual(4, self.collapser.suppressed_count)
+
+    def test_state_change_is_written_after_summaries(self):
+        self.collapser.process(record("No alarm", created=0))
+        self.collapser.process(record("No alarm", created=10))
+        self.collapser.process(record("No alarm", created=20))
+        records = self.collapser.process(record("Alarm", created=30))
+        self.assertEqual(2, len(records))
+        self.assertTrue(records[0].getMessage().startswith("Repeated 2 times since "))
+        self.assertTrue(records[0].getMessage().endswith(": No alarm"))
+        self.assertEqual("Alarm", records[1].getMessage())
+        # the messages are collected anew
+        self.assertEqual(["No alarm"], self.messages(
+            self.collapser.process(record("No alarm", created=40))))
+
+    def test_different_level_is_a_state_change(self):
+        self.collapser.process(record("Timeout", levelno=logging.DEBUG))
+        records = self.collapser.process(record("Timeout"))
+        self.assertEqual(["Timeout"], self.messages(records))
+
+    def test_warnings_and_errors_are_never_collapsed(self):
+        for levelno in (logging.WARNING, logging.ERROR):
+            for _ in range(3):
+                self.assertEqual(["Timeout"], self.messages(
+                    self.collapser.process(record("Timeout", levelno=levelno))))
+        self.assertEqual(0, self.collapser.suppressed_count)
+        self.assertEqual([], self.collapser.flush())
+
+    def test_warnings_do_not_interrupt_collapsing(self):
+        self.collapser.process(record("Polling", lineno=1))
+        self.collapser.process(record("Polling", lineno=1))
+        self.collapser.process(record("Slow answer", lineno=2, levelno=logging.WARNING))
+        self.assertEqual([], self.collapser.process(record("Polling", lineno=1)))
+
+    def test_max_level_is_configurable(self):
+        collapser = RepeatedRecordCollapser(max_levelno=logging.WARNING)
+        collapser.process(record("Timeout", levelno=logging.WARNING))
+        self.assertEqual([], collapser.process(record("Timeout", levelno=logging.WARNING)))
+        collapser.process(record("Failed", lineno=2, levelno=logging.ERROR))
+        self.assertEqual(["Failed"], self.messages(
+            collapser.process(record("Failed", lineno=2, levelno=logging.ERROR))))
+
+    def test_loggers_are_collapsed_independently(self):
+        self.collapser.process(record("Polling", name="poller"))
+        self.collapser.process(record("Polling", name="poller"))
+        self.assertEqual(["Checking"], self.messages(
+            self.collapser.process(record("Checking", name="browser"))))
+        self.assertEqual([], self.collapser.process(record("Polling", name="poller")))
+
+    def test_summary_is_written_after_summary_interval(self):
+        self.collapser.process(record("Polling", created=0))
+        self.assertEqual([], self.collapser.process(record("Polling", created=10)))
+        records = self.collapser.process(record("Polling", created=3610))
+        self.assertEqual(1, len(records))
+        self.assertTrue(records[0].getMessage().startswith("Repeated 2 times since "))
+        self.assertEqual([], self.collapser.process(record("Polling", created=3620)))
+
+    def test_flush_summarizes_suppressed_records(self):
+        self.collapser.process(record("Polling", lineno=1))
+        self.collapser.process(record("Polling", lineno=1))
+        self.collapser.process(record("Checking", lineno=2, name="browser"))
+        records = self.collapser.flush()
+        self.assertEqual(1, len(records))
+        self.assertTrue(records[0].getMessage().endswith(": Polling"))
+        self.assertEqual("poller", records[0].name)
+        self.assertEqual([], self.collapser.flush())
+        # the repeated message is still suppressed after the flush
+        self.assertEqual([], self.collapser.process(record("Polling", lineno=1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+
+from sendmail import MailSender
+
+
+class MailSenderTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.archive = os.path.join(directory, "alarmmonitor.log.tar.gz")
+        self.data = os.urandom(200 * 1024)
+        with open(self.archive, "wb") as archive_file:
+            archive_file.write(self.data)
+
+    def test_archive_is_attached(self):
+        mail_sender = MailSender("smtp", 587, "user", "password",
+                                 max_attachment_size=len(self.data))
+        msg = mail_sender.get_tar_gz_attachment_message(
+            "from", ["to"], "Log", "Summary", self.archive)
+        body, attachment = msg.get_payload()
+        self.assertEqual("Summary", body.get_payload())
+        self.assertEqual("alarmmonitor.log.tar.gz", attachment.get_filename())
+        self.assertEqual(self.data, base64.b64decode(attachment.get_payload()))
+
+    def test_archive_larger_than_max_attachment_size_is_not_attached(self):
+        mail_sender = MailSender("smtp", 587, "user", "password",
+                                 max_attachment_size=len(self.data) - 1)
+        with self.assertLogs("sendmail", "WARNING"):
+            msg = mail_sender.get_tar_gz_attachment_message(
+                "from", ["to"], "Log", "Summary", self.archive)
+        body, = msg.get_payload()
+        self.assertTrue(body.get_payload().startswith("Summary\n"))
+        self.assertIn("alarmmonitor.log.tar.gz", body.get_payload())
+
+
+if __name__ == "__main__":
+    unittest.main()
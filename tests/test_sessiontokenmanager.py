@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from blaulichtsmscontroller import BlaulichtSmsSessionInitException, SessionTokenManager
+
+
+class SessionTokenManagerTest(unittest.TestCase):
+
+    def test_concurrent_refreshes_are_merged_into_a_single_login(self):
+        logins = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def login():
+            logins.append(None)
+            started.set()
+            release.wait(1)
+            return "token"
+
+        manager = SessionTokenManager(login)
+        tokens = []
+        first = threading.Thread(target=lambda: tokens.append(manager.refresh()))
+        first.start()
+        started.wait(1)
+        second = threading.Thread(target=lambda: tokens.append(manager.get_token()))
+        second.start()
+        release.set()
+        first.join(1)
+        second.join(1)
+        self.assertEqual(["token", "token"], tokens)
+        self.assertEqual(1, len(logins))
+
+    def test_failed_login_returns_none(self):
+        def login():
+            raise BlaulichtSmsSessionInitException()
+
+        manager = SessionTokenManager(login)
+        with self.assertLogs("blaulichtsmscontroller", "ERROR"):
+            self.assertIsNone(manager.get_token())
+
+    def test_failed_renewal_keeps_the_previous_token(self):
+        tokens = iter(["token"])
+
+        def login():
+            try:
+                return next(tokens)
+            except StopIteration:
+                raise BlaulichtSmsSessionInitException()
+
+        manager = SessionTokenManager(login)
+        self.assertEqual("token", manager.get_token())
+        with self.assertLogs("blaulichtsmscontroller", "ERROR"):
+            self.assertEqual("token", manager.refresh())
+
+    def test_valid_token_is_not_renewed(self):
+        logins = []
+        manager = SessionTokenManager(lambda: logins.append(None) or "token")
+        manager.get_token()
+        self.assertEqual("token", manager.get_token(block=False))
+        self.assertEqual(1, len(logins))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import unittest
+
+from startupphases import StartupPhases
+
+
+class StartupPhasesTest(unittest.TestCase):
+
+    def test_sequential_phases_run_in_the_order_they_are_started(self):
+        startup = StartupPhases()
+        calls = []
+        first = startup.start("first", calls.append, "first")
+        self.assertEqual(["first"], calls)
+        startup.start("second", calls.append, "second")
+        self.assertEqual(["first", "second"], calls)
+        self.assertTrue(first.done())
+        with self.assertLogs("startupphases", "INFO"):
+            startup.finish()
+
+    def test_sequential_phase_raises_immediately(self):
+        startup = StartupPhases()
+        calls = []
+        with self.assertRaises(ZeroDivisionError):
+            startup.start("failing", lambda: 1 / 0)
+            calls.append("next")
+        self.assertEqual([], calls)
+
+    def test_parallel_phases_run_concurrently(self):
+        startup = StartupPhases(is_parallel=True)
+        release = threading.Event()
+        blocked = startup.start("blocked", release.wait, 1)
+        other = startup.start("other", lambda: "done")
+        self.assertEqual("done", other.result(1))
+        self.assertFalse(blocked.done())
+        release.set()
+        self.assertTrue(blocked.result(1))
+        with self.assertLogs("startupphases", "INFO") as logs:
+            startup.finish()
+        self.assertIn("in parallel", logs.output[0])
+
+    def test_parallel_phase_raises_on_result(self):
+        startup = StartupPhases(is_parallel=True)
+        future = startup.start("failing", lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(1)
+        startup.finish()
+
+
+if __name__ == "__main__":
+    unittest.main()